@@ -1,34 +1,23 @@
 from fastapi import APIRouter, HTTPException, Depends
 from app.models.task import TaskRequest, ProgrammingLanguage
 from app.services.ai_service import generate_code_scaffolding
-from app.services.code_executor import execute_code
-from app.services.quiz_service import generate_quiz, check_quiz_answers
+from app.services.code_executor import execute_code, executor
+from app.services.error_classifier import classify_errors
+from app.services.quiz_service import check_quiz_answers
 from app.services.learning_service import generate_learning_content
 from app.services.code_service import analyze_code
+from app.services.quiz_store import quiz_sessions
+from app.services.quiz_bank import quiz_bank
+from app.services.request_timing import TimedRoute
 import logging
 import uuid
 from typing import Dict, Any, List
 import time
 from datetime import datetime
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 logger = logging.getLogger(__name__)
 
-# In-memory storage for quiz questions (in a real app, use Redis or a database)
-quiz_sessions = {}
-
-# Cleanup old sessions (older than 2 hours)
-def cleanup_old_sessions():
-    current_time = time.time()
-    to_delete = []
-    for session_id, data in quiz_sessions.items():
-        if current_time - data["created_at"] > 7200:  # 2 hours
-            to_delete.append(session_id)
-    
-    for session_id in to_delete:
-        del quiz_sessions[session_id]
-        logger.info(f"Cleaned up old session: {session_id}")
-
 @router.post("/generate_scaffolding")
 async def generate_scaffolding(request: TaskRequest):
     try:
@@ -71,6 +60,9 @@ async def generate_scaffolding(request: TaskRequest):
         if not result or "scaffolding" not in result:
             logger.error("Failed to generate valid code")
             raise HTTPException(status_code=500, detail="Failed to generate valid code")
+        
+        # Bank the task's quiz while the learner works on the code
+        quiz_bank.prefetch(request.task_description, request.language.value)
             
         # Log the generated code length for debugging
         logger.info(f"Generated code length: {len(result['scaffolding'])}")
@@ -101,7 +93,7 @@ async def run_code(request: dict):
             )
         
         logger.info(f"Running code in {language.value}")
-        output = await execute_code(request["code"], language)
+        output = await execute_code(request["code"], language, use_cache=request.get("cache", True))
         
         return {"output": output}
     except HTTPException:
@@ -133,25 +125,19 @@ async def analyze_code_endpoint(request: dict):
         logger.info(f"Analyzing code in {language.value}")
         
         # First execute the code to determine if it's working
-        has_execution_errors = False
+        execution_errors = []
         try:
-            output = await execute_code(request["code"], language)
-            # Check for common error patterns in the output
-            execution_error_patterns = [
-                "error", "exception", "traceback", "syntax error", "runtime error",
-                "indexerror", "keyerror", "attributeerror", "typeerror", "nameerror",
-                "valueerror", "syntaxerror", "indentationerror", "fail"
-            ]
-            
-            has_execution_errors = any(pattern in output.lower() for pattern in execution_error_patterns)
+            result = await executor.execute(request["code"], language, use_cache=request.get("cache", True))
+            # Classify from the exit code and stderr rather than scanning the output for keywords
+            execution_errors = classify_errors(result.stderr, result.exit_code, result.timed_out)
+            has_execution_errors = bool(execution_errors)
             
             logger.info(f"Code execution result - Has errors: {has_execution_errors}")
             if has_execution_errors:
-                logger.info(f"Execution errors detected in output: {output[:200]}...")
+                logger.info(f"Execution errors detected: {execution_errors[:3]}")
                 
         except Exception as e:
             has_execution_errors = True
-            output = str(e)
             logger.info(f"Exception during code execution: {str(e)}")
         
         # Get a logical code correctness analysis from the AI service
@@ -161,7 +147,8 @@ async def analyze_code_endpoint(request: dict):
             request["code"], 
             request["task_description"], 
             language.value, 
-            has_errors=has_execution_errors
+            has_errors=has_execution_errors,
+            errors=execution_errors
         )
         
         return {"analysis": analysis_result}
@@ -179,22 +166,12 @@ async def generate_quiz_endpoint(request: dict):
         if not request.get("language"):
             raise HTTPException(status_code=400, detail="Language is required")
         
-        # Clean up old sessions
-        cleanup_old_sessions()
-        
-        # Generate a unique session ID for this quiz
-        session_id = str(uuid.uuid4())
+        # Serve a pre-generated quiz when the bank has one; "cache": false always asks Gemini
+        questions = await quiz_bank.get_quiz(request["task_description"], request["language"],
+                                             use_bank=request.get("cache", True))
         
-        # Generate questions
-        questions = await generate_quiz(request["task_description"], request["language"])
-        
-        # Store questions in memory with session ID
-        quiz_sessions[session_id] = {
-            "questions": questions,
-            "task_description": request["task_description"],
-            "language": request["language"],
-            "created_at": time.time()  # Current timestamp
-        }
+        # Store questions under a new session ID; old sessions are expired in the background
+        session_id = quiz_sessions.create(questions, request["task_description"], request["language"])
         
         logger.info(f"Generated quiz with session ID: {session_id}")
         
@@ -217,12 +194,10 @@ async def check_quiz_endpoint(request: dict):
         
         session_id = request["session_id"]
         
-        # Check if session exists
-        if session_id not in quiz_sessions:
-            raise HTTPException(status_code=404, detail="Quiz session not found. Please generate a new quiz.")
-        
         # Get stored questions
-        session_data = quiz_sessions[session_id]
+        session_data = quiz_sessions.get(session_id)
+        if session_data is None:
+            raise HTTPException(status_code=404, detail="Quiz session not found. Please generate a new quiz.")
         questions = session_data["questions"]
         
         # Log the answers received from the frontend
@@ -1,7 +1,14 @@
 from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.api.routes import router as api_router
+from app.services.code_executor import executor
+from app.services.metrics import REGISTRY, current_endpoint
+from app.services.quiz_store import quiz_sessions
+from app.services.quiz_bank import quiz_bank
+from app.services.profiler import profiler
+from app.services.request_timing import RequestTimings, current_timings
+from contextlib import asynccontextmanager
 import logging
 import traceback
 
@@ -9,7 +16,20 @@ import traceback
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI(title="AI Coding Assistant API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop the pooled code executor, the quiz session reaper, the quiz bank refill workers and the profiler"""
+    await profiler.start()
+    await executor.start()
+    await quiz_sessions.start()
+    await quiz_bank.start()
+    yield
+    await quiz_bank.shutdown()
+    await quiz_sessions.shutdown()
+    await executor.shutdown()
+    await profiler.shutdown()
+
+app = FastAPI(title="AI Coding Assistant API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -20,6 +40,27 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Label LLM metrics with the route that triggered the call
+@app.middleware("http")
+async def track_endpoint(request: Request, call_next):
+    token = current_endpoint.set(request.url.path)
+    try:
+        return await call_next(request)
+    finally:
+        current_endpoint.reset(token)
+
+# Break each request's time down by stage in a Server-Timing header
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    timings = RequestTimings()
+    token = current_timings.set(timings)
+    try:
+        response = await call_next(request)
+    finally:
+        current_timings.reset(token)
+    response.headers["Server-Timing"] = RequestTimings.server_timing(timings.finish(request.url.path))
+    return response
+
 # Global exception handler
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -37,6 +78,11 @@ app.include_router(api_router, prefix="/api")
 async def root():
     return {"message": "AI Coding Assistant API is running"}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"} 
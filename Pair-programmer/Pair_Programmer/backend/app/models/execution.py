@@ -0,0 +1,22 @@
+from pydantic import BaseModel, Field
+
+class ExecutionResult(BaseModel):
+    stdout: str = ""
+    stderr: str = ""
+    exit_code: int = 0
+    timed_out: bool = False
+    backend: str = Field("piston", description="Backend that ran the code")
+    duration: float = Field(0.0, description="Wall-clock seconds including queueing and retries")
+    cached: bool = Field(False, description="Served from the execution cache")
+
+    @property
+    def succeeded(self) -> bool:
+        return self.exit_code == 0 and not self.timed_out and not self.stderr
+
+    def as_output(self) -> str:
+        """The single output string returned by /run_code"""
+        if self.timed_out:
+            return f"Error:\nExecution timed out\n{self.stderr}".rstrip()
+        if self.stderr:
+            return f"Error:\n{self.stderr}"
+        return self.stdout
@@ -1,11 +1,11 @@
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 from app.models.task import DifficultyLevel
 import logging
 from typing import Dict, Any, List
-import re
-import json
+
+from app.services.json_extract import JSONExtractionError, extract_json, strip_code_fence
+from app.services.llm_client import create_model, generate_content
+from app.services.metrics import record_parse_failure
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,12 +20,7 @@ model = None
 def initialize_gemini():
     global model
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = create_model('gemini-2.0-flash')
         logger.info("Gemini API initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Gemini API: {str(e)}")
@@ -221,46 +216,23 @@ async def generate_code_scaffolding(task_description: str, difficulty_level: str
             
             Important: Return ONLY the JSON object, no other text, markdown formatting, or backticks."""
 
-        response = await model.generate_content_async(prompt)
+        response = await generate_content(model, prompt, template="scaffolding")
         
         if not response or not response.text:
             raise ValueError("No response from AI model")
         
-        # Clean the response text to ensure it's valid JSON
         response_text = response.text.strip()
         
-        # Remove any markdown code block indicators
-        response_text = response_text.replace('```json', '').replace('```', '')
-        
-        # Remove any language specifiers
-        response_text = response_text.replace('```python', '').replace('```javascript', '').replace('```java', '')
-        
-        # Remove any leading/trailing whitespace
-        response_text = response_text.strip()
-        
-        # Try to extract JSON from the response
+        # Extract the JSON object, skipping any code fence or prose around it
         try:
-            # First try to parse the entire response as JSON
-            result = json.loads(response_text)
-        except json.JSONDecodeError:
-            # If that fails, try to find JSON-like structure
-            try:
-                # Look for content between curly braces
-                json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-                if json_match:
-                    result = json.loads(json_match.group())
-                else:
-                    # If no JSON found, create a default structure
-                    result = {
-                        "scaffolding": response_text,
-                        "hints": []
-                    }
-            except (json.JSONDecodeError, AttributeError):
-                # If all parsing attempts fail, create a default structure
-                result = {
-                    "scaffolding": response_text,
-                    "hints": []
-                }
+            result = extract_json(response_text, dict)
+        except JSONExtractionError:
+            # If no JSON found, treat the whole response as the code
+            record_parse_failure("scaffolding")
+            result = {
+                "scaffolding": strip_code_fence(response_text),
+                "hints": []
+            }
         
         # Validate and clean up the result
         if not isinstance(result, dict):
@@ -321,22 +293,19 @@ async def generate_additional_hints(task_description: str, language: str, num_hi
         
         Important: Return ONLY the JSON array, no other text."""
         
-        response = await model.generate_content_async(prompt)
+        response = await generate_content(model, prompt, template="additional_hints")
         if not response or not response.text:
             return []
             
         hints_text = response.text.strip()
-        hints_text = hints_text.replace('```json', '').replace('```', '').strip()
         
         try:
-            hints = json.loads(hints_text)
-            if isinstance(hints, list):
-                return hints[:num_hints]
-            return []
-        except json.JSONDecodeError:
+            return extract_json(hints_text, list)[:num_hints]
+        except JSONExtractionError:
             # If JSON parsing fails, try to extract hints from the text
+            record_parse_failure("additional_hints")
             hints = []
-            lines = hints_text.split('\n')
+            lines = strip_code_fence(hints_text).split('\n')
             for line in lines:
                 line = line.strip()
                 if line and not line.startswith('[') and not line.startswith(']'):
@@ -1,12 +1,52 @@
 import aiohttp
+import asyncio
 import logging
+import os
+import random
+import shutil
+import signal
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
 from app.models.task import ProgrammingLanguage
-import json
+from app.models.execution import ExecutionResult
+from app.services.execution_cache import EXECUTION_CACHE_ENABLED, ExecutionCache, is_deterministic
+from app.services.request_timing import record_stage, timed
 
 logger = logging.getLogger(__name__)
 
-# Piston API configuration
-PISTON_API_URL = "https://emkc.org/api/v2/piston/execute"
+# Where code runs: "piston" (public or self-hosted Piston API) or "local" (subprocesses on this host)
+EXECUTOR_BACKEND = os.getenv("EXECUTOR_BACKEND", "piston")
+
+# Piston API configuration; point PISTON_API_URL at a self-hosted instance to avoid the public rate limit
+PISTON_API_URL = os.getenv("PISTON_API_URL", "https://emkc.org/api/v2/piston/execute")
+
+# Pooled connections kept open to the Piston API
+PISTON_POOL_SIZE = int(os.getenv("PISTON_POOL_SIZE", "20"))
+
+# Executions in flight at once; further requests wait for a slot
+EXECUTOR_MAX_CONCURRENCY = int(os.getenv("EXECUTOR_MAX_CONCURRENCY", "8"))
+
+# Retries for connection errors, rate limiting and 5xx responses, with jittered backoff
+EXECUTOR_MAX_RETRIES = int(os.getenv("EXECUTOR_MAX_RETRIES", "2"))
+EXECUTOR_RETRY_BACKOFF = float(os.getenv("EXECUTOR_RETRY_BACKOFF", "0.5"))
+
+# Timeout in seconds for one execution; compiled languages get longer by default.
+# Override per language with e.g. EXECUTOR_LANGUAGE_TIMEOUTS="java=40,rust=45"
+EXECUTOR_TIMEOUT = float(os.getenv("EXECUTOR_TIMEOUT", "15"))
+LANGUAGE_TIMEOUTS = {
+    ProgrammingLanguage.JAVA: 30.0,
+    ProgrammingLanguage.CPP: 30.0,
+    ProgrammingLanguage.CSHARP: 30.0,
+    ProgrammingLanguage.GO: 30.0,
+    ProgrammingLanguage.RUST: 40.0,
+    ProgrammingLanguage.SWIFT: 40.0,
+}
+for _item in filter(None, os.getenv("EXECUTOR_LANGUAGE_TIMEOUTS", "").split(",")):
+    _name, _, _seconds = _item.partition("=")
+    LANGUAGE_TIMEOUTS[ProgrammingLanguage(_name.strip())] = float(_seconds)
+
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
 
 # Language mapping for Piston
 LANGUAGE_MAPPING = {
@@ -22,15 +62,61 @@ LANGUAGE_MAPPING = {
     ProgrammingLanguage.SWIFT: "swift",
 }
 
-async def execute_code(code: str, language: ProgrammingLanguage) -> str:
-    """
-    Execute the given code using Piston API and return the output.
-    """
+# Local backend: (source file name, compile command or None, run command);
+# {source} and {binary} are replaced with paths in a scratch directory
+LOCAL_COMMANDS: Dict[ProgrammingLanguage, Tuple[str, Optional[List[str]], List[str]]] = {
+    ProgrammingLanguage.PYTHON: ("main.py", None, ["python3", "{source}"]),
+    ProgrammingLanguage.JAVASCRIPT: ("main.js", None, ["node", "{source}"]),
+    ProgrammingLanguage.JAVA: ("Main.java", None, ["java", "{source}"]),
+    ProgrammingLanguage.CPP: ("main.cpp", ["g++", "-O2", "-o", "{binary}", "{source}"], ["{binary}"]),
+    ProgrammingLanguage.GO: ("main.go", None, ["go", "run", "{source}"]),
+    ProgrammingLanguage.RUST: ("main.rs", ["rustc", "-O", "-o", "{binary}", "{source}"], ["{binary}"]),
+    ProgrammingLanguage.PHP: ("main.php", None, ["php", "{source}"]),
+    ProgrammingLanguage.RUBY: ("main.rb", None, ["ruby", "{source}"]),
+    ProgrammingLanguage.SWIFT: ("main.swift", None, ["swift", "{source}"]),
+}
+
+class ExecutorUnavailableError(Exception):
+    """Raised when the execution backend can't be reached after retries"""
+
+def signal_exit_code(signal_name: str) -> int:
+    """The exit code of a program killed by the named signal, -signum as subprocess reports it"""
     try:
+        return -signal.Signals[signal_name]
+    except KeyError:
+        return 1
+
+def language_timeout(language: ProgrammingLanguage) -> float:
+    return LANGUAGE_TIMEOUTS.get(language, EXECUTOR_TIMEOUT)
+
+class PistonBackend:
+    """Runs code through the Piston API over one pooled HTTP session"""
+
+    name = "piston"
+
+    def __init__(self, api_url: str = PISTON_API_URL, pool_size: int = PISTON_POOL_SIZE):
+        self.api_url = api_url
+        self.pool_size = pool_size
+        self._session = None
+
+    async def start(self) -> None:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60)
+            self._session = aiohttp.ClientSession(connector=connector)
+
+    async def shutdown(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def run(self, code: str, language: ProgrammingLanguage, stdin: str, timeout: float) -> ExecutionResult:
         piston_language = LANGUAGE_MAPPING.get(language)
         if not piston_language:
             raise ValueError(f"Language {language} is not supported")
 
+        # Created lazily when used outside the app lifespan, e.g. from a script
+        await self.start()
+
         # Prepare the execution request
         execution_data = {
             "language": piston_language,
@@ -41,29 +127,218 @@ async def execute_code(code: str, language: ProgrammingLanguage) -> str:
                     "content": code
                 }
             ],
-            "stdin": "",  # You can add input here if needed
+            "stdin": stdin,
             "args": []
         }
 
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                PISTON_API_URL,
-                json=execution_data
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise Exception(f"Failed to execute code: {error_text}")
-                
-                result = await response.json()
-                
-                if result.get("run"):
-                    run_result = result["run"]
-                    if run_result.get("stderr"):
-                        return f"Error:\n{run_result['stderr']}"
-                    return run_result.get("stdout", "No output")
-                else:
-                    return "Error: No execution result received"
+        async with self._session.post(
+            self.api_url,
+            json=execution_data,
+            timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as response:
+            if response.status in RETRYABLE_STATUSES:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, response.history, status=response.status,
+                    message=await response.text()
+                )
+            if response.status != 200:
+                error_text = await response.text()
+                raise Exception(f"Failed to execute code: {error_text}")
+
+            result = await response.json()
+
+        if not result.get("run"):
+            return ExecutionResult(stderr="No execution result received", exit_code=1, backend=self.name)
+
+        # A failed compile stage is reported as the run's error
+        compile_result = result.get("compile") or {}
+        if compile_result.get("code"):
+            return ExecutionResult(
+                stdout=compile_result.get("stdout", ""),
+                stderr=compile_result.get("stderr") or compile_result.get("output", ""),
+                exit_code=compile_result["code"],
+                backend=self.name
+            )
+
+        run_result = result["run"]
+        exit_code = run_result.get("code")
+        if exit_code is None:
+            # Killed by a signal: Piston reports no code, only the signal's name
+            exit_code = signal_exit_code(run_result["signal"]) if run_result.get("signal") else 0
+        return ExecutionResult(
+            stdout=run_result.get("stdout", ""),
+            stderr=run_result.get("stderr", ""),
+            exit_code=exit_code,
+            timed_out=run_result.get("signal") == "SIGKILL",
+            backend=self.name
+        )
+
+class LocalBackend:
+    """Runs code in subprocesses on this host, for offline use"""
 
+    name = "local"
+
+    def __init__(self):
+        # Running programs, killed on shutdown
+        self._processes = set()
+
+    async def start(self) -> None:
+        missing = sorted({
+            language.value for language, (_, compile_cmd, run_cmd) in LOCAL_COMMANDS.items()
+            if not shutil.which((compile_cmd or run_cmd)[0])
+        })
+        if missing:
+            logger.info(f"Local executor has no toolchain for: {', '.join(missing)}")
+
+    async def shutdown(self) -> None:
+        for process in list(self._processes):
+            self._kill(process)
+
+    @staticmethod
+    def _kill(process) -> None:
+        """Kill the whole process group, including anything the program spawned"""
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    async def run(self, code: str, language: ProgrammingLanguage, stdin: str, timeout: float) -> ExecutionResult:
+        if language not in LOCAL_COMMANDS:
+            raise ValueError(f"Language {language} is not supported by the local executor")
+        file_name, compile_cmd, run_cmd = LOCAL_COMMANDS[language]
+
+        deadline = time.monotonic() + timeout
+        with tempfile.TemporaryDirectory(prefix="exec_") as workdir:
+            paths = {"source": os.path.join(workdir, file_name), "binary": os.path.join(workdir, "main")}
+            with open(paths["source"], "w") as f:
+                f.write(code)
+
+            if compile_cmd:
+                result = await self._run_process([arg.format(**paths) for arg in compile_cmd], "", workdir, deadline)
+                if result.exit_code != 0 or result.timed_out:
+                    return result
+            return await self._run_process([arg.format(**paths) for arg in run_cmd], stdin, workdir, deadline)
+
+    async def _run_process(self, command: List[str], stdin: str, workdir: str, deadline: float) -> ExecutionResult:
+        if not shutil.which(command[0]):
+            raise ValueError(f"{command[0]} is not installed on this host")
+
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=workdir,
+            start_new_session=True
+        )
+        self._processes.add(process)
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(stdin.encode()), timeout=max(deadline - time.monotonic(), 0.1)
+            )
+        except asyncio.TimeoutError:
+            self._kill(process)
+            stdout, stderr = await process.communicate()
+            return ExecutionResult(
+                stdout=stdout.decode(errors="replace"),
+                stderr=stderr.decode(errors="replace"),
+                exit_code=-9,
+                timed_out=True,
+                backend=self.name
+            )
+        except BaseException:
+            # Cancelled (client gone, shutdown); nothing else would stop the program
+            self._kill(process)
+            raise
+        finally:
+            self._processes.discard(process)
+        return ExecutionResult(
+            stdout=stdout.decode(errors="replace"),
+            stderr=stderr.decode(errors="replace"),
+            exit_code=process.returncode,
+            backend=self.name
+        )
+
+class CodeExecutor:
+    """Bounded, retrying front end over the configured execution backend"""
+
+    def __init__(self, backend: str = EXECUTOR_BACKEND, max_concurrency: int = EXECUTOR_MAX_CONCURRENCY,
+                 max_retries: int = EXECUTOR_MAX_RETRIES):
+        self.backend = LocalBackend() if backend == "local" else PistonBackend()
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self._slots = asyncio.Semaphore(max_concurrency)
+
+        # Deterministic results are reused, e.g. /analyze_code right after /run_code
+        # or a class running the same scaffold
+        self.cache = ExecutionCache() if EXECUTION_CACHE_ENABLED else None
+
+    async def start(self) -> None:
+        await self.backend.start()
+        logger.info(f"Code executor started with the {self.backend.name} backend")
+
+    async def shutdown(self) -> None:
+        await self.backend.shutdown()
+
+    async def execute(self, code: str, language: ProgrammingLanguage, stdin: str = "",
+                      use_cache: bool = True) -> ExecutionResult:
+        """Run code and return its stdout, stderr and exit code, reusing a cached result when possible"""
+        if self.cache is None:
+            return await self._execute(code, language, stdin)
+
+        if not use_cache or not is_deterministic(code):
+            self.cache.bypass()
+            return await self._execute(code, language, stdin)
+
+        key = ExecutionCache.make_key(code, language, stdin)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        result = await self._execute(code, language, stdin)
+        self.cache.set(key, result)
+        return result
+
+    async def _execute(self, code: str, language: ProgrammingLanguage, stdin: str) -> ExecutionResult:
+        timeout = language_timeout(language)
+        start = time.monotonic()
+        attempt = 0
+        async with self._slots:
+            record_stage("queue", time.monotonic() - start)
+            while True:
+                try:
+                    with timed("upstream"):
+                        result = await self.backend.run(code, language, stdin, timeout)
+                    break
+                except asyncio.TimeoutError:
+                    # The program itself may be what's slow, so don't retry
+                    result = ExecutionResult(
+                        stderr=f"Execution timed out after {timeout} seconds",
+                        exit_code=-9,
+                        timed_out=True,
+                        backend=self.backend.name
+                    )
+                    break
+                except aiohttp.ClientError as e:
+                    if attempt >= self.max_retries:
+                        raise ExecutorUnavailableError(f"Execution backend unavailable: {str(e)}")
+                    attempt += 1
+                    delay = EXECUTOR_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+                    logger.warning(f"Retrying code execution in {delay:.2f}s after: {str(e)}")
+                    await asyncio.sleep(delay)
+
+        result.duration = time.monotonic() - start
+        return result
+
+executor = CodeExecutor()
+
+async def execute_code(code: str, language: ProgrammingLanguage, use_cache: bool = True) -> str:
+    """
+    Execute the given code using the configured backend and return the output.
+    Pass use_cache=False for code whose output changes between runs.
+    """
+    try:
+        result = await executor.execute(code, language, use_cache=use_cache)
+        return result.as_output()
     except Exception as e:
         logger.error(f"Error executing code: {str(e)}")
-        raise Exception(f"Failed to execute code: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Failed to execute code: {str(e)}")
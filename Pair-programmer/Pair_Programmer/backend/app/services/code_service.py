@@ -1,10 +1,12 @@
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
-import json
 from typing import Dict, Any, List
 
+from app.services.json_extract import JSONExtractionError, extract_json
+from app.services.llm_client import create_model, generate_content
+from app.services.error_classifier import format_errors
+from app.services.metrics import record_parse_failure
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,12 +20,7 @@ model = None
 def initialize_gemini():
     global model
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = create_model('gemini-2.0-flash')
         logger.info("Gemini API initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Gemini API: {str(e)}")
@@ -74,23 +71,16 @@ async def generate_code(task_description: str, language: str, use_boilerplate: b
           * Add comments explaining what needs to be implemented
           * Make sure the code is runnable even if incomplete"""
 
-        response = await model.generate_content_async(prompt)
+        response = await generate_content(model, prompt, template="generate_code")
         
         if not response or not response.text:
             raise ValueError("No response from AI model")
         
-        # Clean the response text to ensure it's valid JSON
-        response_text = response.text.strip()
-        # Remove any markdown code block indicators
-        response_text = response_text.replace('```json', '').replace('```', '')
-        # Remove any leading/trailing whitespace
-        response_text = response_text.strip()
+        response_text = response.text
         
-        # Parse the JSON response
+        # Parse the JSON object, skipping any code fence or prose around it
         try:
-            content = json.loads(response_text)
-            if not isinstance(content, dict):
-                raise ValueError("Response is not a dictionary")
+            content = extract_json(response_text, dict)
             if "code" not in content:
                 raise ValueError("Response missing 'code' field")
             if not isinstance(content["code"], str):
@@ -115,11 +105,13 @@ async def generate_code(task_description: str, language: str, use_boilerplate: b
                 ]
             
             return content
-        except json.JSONDecodeError as e:
+        except JSONExtractionError as e:
+            record_parse_failure("generate_code")
             logger.error(f"Error parsing code JSON: {str(e)}")
             logger.error(f"Raw response: {response_text}")
             raise ValueError("Failed to parse code: Invalid JSON format")
         except ValueError as e:
+            record_parse_failure("generate_code")
             logger.error(f"Error validating code format: {str(e)}")
             raise ValueError(f"Failed to parse code: {str(e)}")
     
@@ -127,11 +119,15 @@ async def generate_code(task_description: str, language: str, use_boilerplate: b
         logger.error(f"Error generating code: {str(e)}")
         raise Exception(f"Failed to generate code: {str(e)}")
 
-async def analyze_code(code: str, task_description: str, language: str, has_errors: bool = False) -> str:
+async def analyze_code(code: str, task_description: str, language: str, has_errors: bool = False,
+                       errors: List[Dict[str, Any]] = None) -> str:
     """
     Analyze the user's code and provide feedback:
     - If code is correct: Provide alternative approaches or success messages
     - If code has errors: Provide abstract hints without directly revealing errors or solutions
+
+    errors are the classified execution errors ({type, message, line, frame}),
+    given to the model as context for its hints.
     """
     if not model:
         try:
@@ -142,6 +138,12 @@ async def analyze_code(code: str, task_description: str, language: str, has_erro
     try:
         # Use different prompts based on whether the code has errors
         if has_errors:
+            error_context = ""
+            if errors:
+                error_context = f"""
+            Errors reported when running the code (for your understanding only):
+            {format_errors(errors)}
+            """
             prompt = f"""Analyze the following {language} code for the task:
             
             Task: {task_description}
@@ -150,7 +152,7 @@ async def analyze_code(code: str, task_description: str, language: str, has_erro
             ```{language}
             {code}
             ```
-            
+            {error_context}
             Important instructions:
             1. The code has errors or isn't working correctly
             2. DO NOT directly solve the problem - your goal is to coach, not solve
@@ -203,7 +205,7 @@ async def analyze_code(code: str, task_description: str, language: str, has_erro
             Format your response as clear, concise sections with bullet points where appropriate.
             """
 
-        response = await model.generate_content_async(prompt)
+        response = await generate_content(model, prompt, template="analyze_code")
         
         if not response or not response.text:
             raise ValueError("No response from AI model")
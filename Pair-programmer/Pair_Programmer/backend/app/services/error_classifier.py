@@ -0,0 +1,112 @@
+import re
+from typing import Any, Dict, List, Optional
+
+# Records kept per execution and characters kept per message, to keep prompts small
+MAX_ERROR_RECORDS = 10
+MAX_MESSAGE_CHARS = 300
+
+# One automaton over stderr for the Python, JavaScript, Java and C++ error
+# formats; each alternative fills its own named groups
+ERROR_PATTERN = re.compile(r"""
+    ^\s*File\ "(?P<py_file>[^"]+)",\ line\ (?P<py_line>\d+)(?:,\ in\ (?P<py_func>\S+))?
+  | ^(?P<js_file>\S+\.(?:js|mjs|cjs|javascript)):(?P<js_line>\d+)\s*$
+  | ^\s+at\ (?:(?P<at_func>[^\s(]+)\s?\()?(?P<at_file>[^()\s]+?):(?P<at_line>\d+)(?::\d+)?\)?\s*$
+  | ^(?P<cc_file>[^\s:]+):(?P<cc_line>\d+):(?:\d+:)?\ (?:fatal\ )?error:\ (?P<cc_msg>.*)$
+  | ^Exception\ in\ thread\ "[^"]*"\ (?P<java_type>[\w.$]+)(?::\ (?P<java_msg>.*))?$
+  | ^terminate\ called\ after\ throwing\ an\ instance\ of\ '(?P<cpp_type>[^']+)'
+  | ^\s+what\(\):\s+(?P<cpp_what>.*)$
+  | ^(?:Caused\ by:\ )?(?P<exc_type>(?:[A-Za-z_$][\w.$]*)?(?:Error|Exception|Exit|Interrupt))(?::\ ?(?P<exc_msg>.*))?$
+  | ^(?P<signal>Segmentation\ fault|Aborted|Floating\ point\ exception|Killed)\b
+""", re.MULTILINE | re.VERBOSE)
+
+# Frames in the standard library or runtime rather than the learner's code
+LIBRARY_FRAME = re.compile(r"site-packages|/lib/python|node:internal|node_modules|^(?:java|jdk|sun)\.")
+
+# Exit codes a process killed by a signal reports, locally or through Piston
+SIGNAL_EXIT_CODES = {-11: "Segmentation fault", 139: "Segmentation fault", -6: "Aborted", 134: "Aborted",
+                     -8: "Floating point exception", 136: "Floating point exception"}
+
+def _clip(message: Optional[str]) -> str:
+    message = (message or "").strip()
+    if len(message) > MAX_MESSAGE_CHARS:
+        message = message[:MAX_MESSAGE_CHARS] + "..."
+    return message
+
+def _record(error_type: str, message: Optional[str], frame: Optional[Dict] = None) -> Dict[str, Any]:
+    return {
+        "type": error_type,
+        "message": _clip(message),
+        "line": frame["line"] if frame else None,
+        "frame": frame["name"] if frame else None
+    }
+
+def _frame(file: str, line: str, function: Optional[str] = None) -> Dict[str, Any]:
+    name = f"{file}:{line}" + (f" in {function}" if function else "")
+    library = LIBRARY_FRAME.search(file) or (function and LIBRARY_FRAME.search(function))
+    return {"line": int(line), "name": name, "user_code": not library}
+
+def classify_errors(stderr: str, exit_code: int, timed_out: bool = False) -> List[Dict[str, Any]]:
+    """
+    Parse tracebacks and compiler errors into {type, message, line, frame}
+    records in a single pass over stderr. A run that exited cleanly has none.
+    """
+    if exit_code == 0 and not timed_out:
+        return []
+
+    records = []
+    if timed_out:
+        records.append(_record("Timeout", "Execution timed out"))
+
+    # Python and Node print the frames before the exception; the innermost
+    # frame in the learner's code gives the line
+    pending_frame = None
+    # Java and Node list "at ..." frames after it; they fill in this record
+    open_record = None
+
+    for match in ERROR_PATTERN.finditer(stderr):
+        groups = match.groupdict()
+        if groups["py_file"] or groups["js_file"]:
+            frame = _frame(groups["py_file"] or groups["js_file"], groups["py_line"] or groups["js_line"],
+                           groups["py_func"])
+            if frame["user_code"] or pending_frame is None:
+                pending_frame = frame
+        elif groups["at_file"]:
+            frame = _frame(groups["at_file"], groups["at_line"], groups["at_func"])
+            if open_record is not None and open_record["line"] is None and frame["user_code"]:
+                open_record["line"] = frame["line"]
+                open_record["frame"] = frame["name"]
+        elif groups["cc_file"]:
+            open_record = None
+            records.append(_record("CompileError", groups["cc_msg"], _frame(groups["cc_file"], groups["cc_line"])))
+        elif groups["java_type"] or groups["exc_type"] or groups["cpp_type"]:
+            error_type = groups["java_type"] or groups["exc_type"] or groups["cpp_type"]
+            open_record = _record(error_type, groups["java_msg"] or groups["exc_msg"], pending_frame)
+            records.append(open_record)
+            pending_frame = None
+        elif groups["cpp_what"]:
+            if open_record is not None and not open_record["message"]:
+                open_record["message"] = _clip(groups["cpp_what"])
+        elif groups["signal"]:
+            records.append(_record(groups["signal"], ""))
+
+        if len(records) >= MAX_ERROR_RECORDS:
+            break
+
+    signal_name = SIGNAL_EXIT_CODES.get(exit_code)
+    if signal_name and not any(record["type"] == signal_name for record in records):
+        records.append(_record(signal_name, ""))
+
+    if not records:
+        # Nothing recognizable; report the last line the program wrote to stderr
+        last_line = next((line for line in reversed(stderr.splitlines()) if line.strip()), "")
+        records.append(_record("NonZeroExit", last_line or f"Exited with code {exit_code}"))
+    return records
+
+def format_errors(records: List[Dict[str, Any]]) -> str:
+    """One line per record, for use in a prompt"""
+    lines = []
+    for record in records:
+        location = f" (line {record['line']})" if record["line"] is not None else ""
+        message = f": {record['message']}" if record["message"] else ""
+        lines.append(f"- {record['type']}{location}{message}")
+    return "\n".join(lines)
@@ -0,0 +1,86 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from app.models.execution import ExecutionResult
+from app.models.task import ProgrammingLanguage
+from app.services.metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+# Set EXECUTION_CACHE_ENABLED=false to always execute
+EXECUTION_CACHE_ENABLED = os.getenv("EXECUTION_CACHE_ENABLED", "true").lower() == "true"
+EXECUTION_CACHE_TTL = int(os.getenv("EXECUTION_CACHE_TTL", "600"))
+EXECUTION_CACHE_MAX_ENTRIES = int(os.getenv("EXECUTION_CACHE_MAX_ENTRIES", "500"))
+
+# Results with more output than this aren't worth keeping in memory
+EXECUTION_CACHE_MAX_OUTPUT = int(os.getenv("EXECUTION_CACHE_MAX_OUTPUT", "65536"))
+
+# Code that reads the clock, randomness, the environment or the network can
+# print something different on every run, so its results are never cached
+NONDETERMINISTIC_PATTERN = re.compile(
+    r"\brandom\b|\brand\b|\bsrand\b|\buuid|\bUUID\b|\bsecrets\b|urandom|\bGuid\b"
+    r"|\btime\b|\bdatetime\b|\bDate\b|\bchrono\b|\bInstant\b|\bnanoTime\b|currentTimeMillis|\bhrtime\b|performance\.now"
+    r"|\bgetenv\b|\benviron\b|process\.env|\bENV\b"
+    r"|\bsocket\b|\burllib\b|\brequests\b|\bhttp\b|\bfetch\b|\bthreading\b|\bthread\b|\bgoroutine\b|\bgo\s+func\b"
+)
+
+EXECUTION_CACHE_LOOKUPS = REGISTRY.counter(
+    "execution_cache_lookups_total", "Code execution cache lookups by result (hit, miss or bypass)", ("result",))
+
+def is_deterministic(code: str) -> bool:
+    """Heuristic: False when the code looks like it depends on time, randomness or I/O"""
+    return NONDETERMINISTIC_PATTERN.search(code) is None
+
+class ExecutionCache:
+    """LRU cache of execution results with a per-entry TTL, keyed by language, code and stdin"""
+
+    def __init__(self, max_entries: int = EXECUTION_CACHE_MAX_ENTRIES, ttl: int = EXECUTION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(code: str, language: ProgrammingLanguage, stdin: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (language.value, code, stdin):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[ExecutionResult]:
+        """Return a copy of the cached result, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.time():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                EXECUTION_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            self._entries.move_to_end(key)
+        EXECUTION_CACHE_LOOKUPS.inc(result="hit")
+        return entry[1].model_copy(update={"cached": True})
+
+    def set(self, key: str, result: ExecutionResult) -> None:
+        """Keep a completed result; timeouts and very large outputs are skipped"""
+        if result.timed_out or len(result.stdout) + len(result.stderr) > EXECUTION_CACHE_MAX_OUTPUT:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, result.model_copy())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def bypass(self) -> None:
+        """Count an execution that skipped the cache"""
+        EXECUTION_CACHE_LOOKUPS.inc(result="bypass")
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+from typing import Any, Callable, Dict, List
+
+from google.api_core import exceptions as google_exceptions
+
+from app.services.llm_client import current_template, prompt_key
+
+logger = logging.getLogger(__name__)
+
+# JSONL file of {template, prompt_key, response} lines (as written with
+# LLM_RECORD_PATH) to replay; prompts without a recording get a synthesized response
+LLM_FAKE_RECORDINGS = os.getenv("LLM_FAKE_RECORDINGS", "")
+
+# Time to first token is lognormal with this median in seconds and this shape
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.8"))
+LLM_FAKE_LATENCY_SIGMA = float(os.getenv("LLM_FAKE_LATENCY_SIGMA", "0.5"))
+
+# Output speed in tokens per second, normally distributed with a 20% spread
+LLM_FAKE_TOKENS_PER_SECOND = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "80"))
+
+# Fraction of calls that fail with a retryable 503, to exercise the retry path
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+
+# Seeds the latencies and injected errors; responses depend only on the prompt
+LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+
+# Rough characters per token, for usage counts
+CHARS_PER_TOKEN = 4
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeResponse:
+    """The parts of a Gemini response the services read: text and usage"""
+
+    def __init__(self, text: str, usage: FakeUsage):
+        self.text = text
+        self.usage_metadata = usage
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel"""
+
+    def __init__(self, provider: "FakeProvider", model_name: str):
+        self.provider = provider
+        self.model_name = f"models/{model_name}"
+        self._generation_config = {}
+
+    async def generate_content_async(self, prompt: str) -> FakeResponse:
+        return await self.provider.respond(prompt)
+
+class FakeProvider:
+    """
+    Offline stand-in for Gemini for load tests: replays recorded responses, or
+    synthesizes ones that parse like the real thing, after a modelled delay.
+    """
+
+    def __init__(self, recordings_path: str = LLM_FAKE_RECORDINGS, seed: int = LLM_FAKE_SEED,
+                 latency: float = LLM_FAKE_LATENCY, latency_sigma: float = LLM_FAKE_LATENCY_SIGMA,
+                 tokens_per_second: float = LLM_FAKE_TOKENS_PER_SECOND, error_rate: float = LLM_FAKE_ERROR_RATE):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._by_key: Dict[str, str] = {}
+        self._by_template: Dict[str, List[str]] = {}
+        self.calls = 0
+        self.replayed = 0
+        if recordings_path:
+            self._load(recordings_path)
+
+    def _load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as recordings:
+            for line in recordings:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("prompt_key"):
+                    self._by_key[entry["prompt_key"]] = entry["response"]
+                self._by_template.setdefault(entry.get("template", "unknown"), []).append(entry["response"])
+        logger.info(f"Loaded {len(self._by_key)} recorded LLM responses from {path}")
+
+    def model(self, model_name: str) -> FakeModel:
+        return FakeModel(self, model_name)
+
+    def response_text(self, template: str, prompt: str) -> str:
+        """The recorded response for this prompt, else one recorded for the template, else a synthesized one"""
+        key = prompt_key(prompt)
+        if key in self._by_key:
+            self.replayed += 1
+            return self._by_key[key]
+        rng = random.Random(key)
+        if self._by_template.get(template):
+            self.replayed += 1
+            return rng.choice(self._by_template[template])
+        synthesize = SYNTHESIZERS.get(template, synthesize_text)
+        return synthesize(prompt, rng)
+
+    async def respond(self, prompt: str) -> FakeResponse:
+        self.calls += 1
+        template = current_template.get()
+        first_token = self._rng.lognormvariate(math.log(self.latency), self.latency_sigma) if self.latency > 0 else 0
+        rate = max(1.0, self._rng.gauss(self.tokens_per_second, self.tokens_per_second * 0.2))
+        if self._rng.random() < self.error_rate:
+            await asyncio.sleep(first_token)
+            raise google_exceptions.ServiceUnavailable("Injected failure from the fake LLM provider")
+
+        text = self.response_text(template, prompt)
+        output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        await asyncio.sleep(first_token + output_tokens / rate)
+        return FakeResponse(text, FakeUsage(len(prompt) // CHARS_PER_TOKEN, output_tokens))
+
+# Synthesized responses: enough varied text to model output length, in the
+# shape each prompt template asks for
+
+SUBJECTS = ("The function", "Your loop", "This variable", "The return value", "The recursion", "The list",
+            "Each iteration", "The condition", "The helper", "The counter", "The input", "The result")
+VERBS = ("updates", "stores", "validates", "returns", "reads", "handles", "prints", "checks", "builds", "sorts")
+OBJECTS = ("the input value", "the running total", "each element", "the base case", "the index",
+           "the final answer", "the edge cases", "the empty list", "the user's input", "the output")
+
+SAMPLE_CODE = {
+    "python": 'def solve(values):\n    total = 0\n    for value in values:\n        total += value\n    return total\n\n'
+              'if __name__ == "__main__":\n    print(solve([1, 2, 3]))\n',
+    "javascript": 'function solve(values) {\n  let total = 0;\n  for (const value of values) {\n    total += value;\n  }\n'
+                  '  return total;\n}\n\nconsole.log(solve([1, 2, 3]));\n',
+    "java": 'public class Main {\n    static int solve(int[] values) {\n        int total = 0;\n'
+            '        for (int value : values) total += value;\n        return total;\n    }\n\n'
+            '    public static void main(String[] args) {\n        System.out.println(solve(new int[]{1, 2, 3}));\n    }\n}\n',
+    "cpp": '#include <iostream>\n#include <vector>\n\nint solve(const std::vector<int>& values) {\n    int total = 0;\n'
+           '    for (int value : values) total += value;\n    return total;\n}\n\n'
+           'int main() {\n    std::cout << solve({1, 2, 3}) << std::endl;\n}\n'
+}
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}."
+
+def _text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(low, high)))
+
+def _number(pattern: str, prompt: str, default: int) -> int:
+    match = re.search(pattern, prompt)
+    return int(match.group(1)) if match else default
+
+def _code(prompt: str) -> str:
+    match = re.search(r"\bin (\w+)(?::|\s*$)", prompt, re.MULTILINE)
+    return SAMPLE_CODE.get(match.group(1).lower() if match else "python", SAMPLE_CODE["python"])
+
+def _explanation(rng: random.Random) -> Dict[str, Any]:
+    return {
+        "explanation": _text(rng, 3, 6),
+        "visual_explanation": {"type": "steps", "content": "\n".join(f"{i}. {_sentence(rng)}" for i in range(1, 4))},
+        "concept_keywords": rng.sample(["loops", "recursion", "indexing", "conditions", "scope", "types"], 2)
+    }
+
+def synthesize_scaffolding(prompt: str, rng: random.Random) -> str:
+    return json.dumps({"scaffolding": _code(prompt), "hints": [_sentence(rng) for _ in range(5)]})
+
+def synthesize_hints(prompt: str, rng: random.Random) -> str:
+    return json.dumps([_sentence(rng) for _ in range(_number(r"Generate (\d+) helpful hints", prompt, 3))])
+
+def synthesize_quiz(prompt: str, rng: random.Random) -> str:
+    questions = []
+    for index in range(1, 11):
+        options = [f"{letter}) {_sentence(rng)}" for letter in "ABCD"]
+        question = {
+            "id": f"q{index}",
+            "question": f"Which statement is true? {_sentence(rng)}",
+            "options": options,
+            "correct_answer": rng.choice(options)
+        }
+        if index <= 3:
+            question["code_snippet"] = _code(prompt)
+        questions.append(question)
+    return json.dumps(questions)
+
+def synthesize_explanation(prompt: str, rng: random.Random) -> str:
+    return json.dumps(_explanation(rng))
+
+def synthesize_explanation_batch(prompt: str, rng: random.Random) -> str:
+    count = _number(r"JSON array with exactly (\d+) objects", prompt, 1)
+    return json.dumps([_explanation(rng) for _ in range(count)])
+
+def synthesize_learning_content(prompt: str, rng: random.Random) -> str:
+    titles = ["Core Concepts", "Implementation Approach", "Best Practices", "Common Pitfalls",
+              "Language-Specific Features"]
+    sections = []
+    for title in titles:
+        section = {"title": title, "content": _text(rng, 5, 10)}
+        if rng.random() < 0.6:
+            section["code"] = _code(prompt)
+        sections.append(section)
+    return json.dumps({"sections": sections})
+
+def synthesize_generated_code(prompt: str, rng: random.Random) -> str:
+    return json.dumps({"code": _code(prompt), "dependencies": [], "setup_instructions": _text(rng, 1, 3)})
+
+def synthesize_text(prompt: str, rng: random.Random) -> str:
+    return "\n".join(f"- {_text(rng, 1, 3)}" for _ in range(rng.randint(3, 6)))
+
+SYNTHESIZERS: Dict[str, Callable[[str, random.Random], str]] = {
+    "scaffolding": synthesize_scaffolding,
+    "additional_hints": synthesize_hints,
+    "quiz": synthesize_quiz,
+    "wrong_answer_explanation": synthesize_explanation,
+    "wrong_answer_explanation_batch": synthesize_explanation_batch,
+    "learning_content": synthesize_learning_content,
+    "generate_code": synthesize_generated_code,
+    "analyze_code": synthesize_text
+}
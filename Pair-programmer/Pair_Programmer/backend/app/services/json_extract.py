@@ -0,0 +1,126 @@
+import json
+import logging
+import re
+from collections import deque
+from functools import lru_cache
+from typing import Any, List, Optional, Tuple
+
+from pydantic import TypeAdapter, ValidationError
+
+from app.services.request_timing import timed
+
+logger = logging.getLogger(__name__)
+
+# json.loads may be handed at most this many times the response length in
+# total, so a response full of near-JSON can't make extraction quadratic
+PARSE_BUDGET_FACTOR = 4
+
+OPENERS = {"{": "}", "[": "]"}
+CLOSERS = {"}": "{", "]": "["}
+
+# Characters that matter to the scan, and the rest of a JSON string after its opening quote
+TOKEN = re.compile(r'[{}\[\]"]')
+STRING_TAIL = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+# A markdown code fence around a whole response, with an optional language tag
+CODE_FENCE = re.compile(r"\A\s*```[\w+-]*[ \t]*\n?(.*?)\n?```\s*\Z", re.DOTALL)
+
+class JSONExtractionError(ValueError):
+    """No JSON value in a response, or none that matched the expected schema"""
+
+class _Span:
+    __slots__ = ("start", "end", "children")
+
+    def __init__(self, start: int, end: int, children: List["_Span"]):
+        self.start = start
+        self.end = end
+        self.children = children
+
+def balanced_spans(text: str) -> List[_Span]:
+    """
+    The outermost balanced {...} and [...] spans in text, in order, found in one
+    pass. Brackets inside JSON strings don't count. A closer that doesn't match
+    the innermost opener abandons everything still open, so a stray bracket in
+    prose can't swallow the JSON after it; an opener that never closes still
+    leaves the balanced spans inside it as candidates.
+    """
+    spans: List[_Span] = []
+    # Openers not yet closed: (bracket, position, index into spans where its children start)
+    stack: List[Tuple[str, int, int]] = []
+    position = 0
+
+    while True:
+        match = TOKEN.search(text, position)
+        if match is None:
+            break
+        char = match.group()
+        position = match.end()
+        if char == '"':
+            # Quotes only delimit strings inside a candidate; in prose they're just text
+            if stack:
+                string_end = STRING_TAIL.match(text, position)
+                if string_end is None:
+                    break
+                position = string_end.end()
+        elif char in OPENERS:
+            stack.append((char, match.start(), len(spans)))
+        elif stack and stack[-1][0] == CLOSERS[char]:
+            _, start, first_child = stack.pop()
+            children = spans[first_child:]
+            del spans[first_child:]
+            spans.append(_Span(start, position, children))
+        else:
+            stack.clear()
+    return spans
+
+def strip_code_fence(text: str) -> str:
+    """The response without a markdown code fence around it, for responses that aren't JSON"""
+    match = CODE_FENCE.match(text)
+    return (match.group(1) if match else text).strip()
+
+@lru_cache(maxsize=64)
+def _adapter(schema: Any) -> TypeAdapter:
+    return TypeAdapter(schema)
+
+def _validate(value: Any, schema: Any) -> Any:
+    return value if schema is None else _adapter(schema).validate_python(value)
+
+def extract_json(text: str, schema: Any = None) -> Any:
+    """
+    Extract the first JSON object or array in an LLM response, tolerating code
+    fences, leading and trailing prose. With a schema (a pydantic model, or any
+    type pydantic can validate such as List[Dict[str, Any]] or dict), candidates
+    that don't validate are skipped and the validated value is returned.
+    Runs in time linear in the length of the response.
+    """
+    with timed("parse"):
+        return _extract_json(text, schema)
+
+def _extract_json(text: str, schema: Any) -> Any:
+    if not isinstance(text, str) or not text.strip():
+        raise JSONExtractionError("Empty response")
+
+    last_error: Optional[Exception] = None
+
+    # Most responses are bare JSON. json.loads raises RecursionError rather
+    # than JSONDecodeError on deeply nested brackets, so both mean "not JSON"
+    try:
+        value = json.loads(text)
+        if isinstance(value, (dict, list)):
+            return _validate(value, schema)
+    except (json.JSONDecodeError, RecursionError, ValidationError) as e:
+        last_error = e
+
+    budget = PARSE_BUDGET_FACTOR * len(text)
+    candidates = deque(balanced_spans(text))
+    while candidates and budget > 0:
+        span = candidates.popleft()
+        budget -= span.end - span.start
+        try:
+            return _validate(json.loads(text[span.start:span.end]), schema)
+        except (json.JSONDecodeError, RecursionError, ValidationError) as e:
+            last_error = e
+            # The value may be nested in something that isn't JSON, like {{ ... }}
+            candidates.extendleft(reversed(span.children))
+
+    raise JSONExtractionError(f"No valid JSON found in the response: {str(last_error)}")
@@ -1,10 +1,13 @@
 import os
-import google.generativeai as genai
+import asyncio
 from dotenv import load_dotenv
 import logging
-import json
 from typing import Dict, Any, List
 
+from app.services.json_extract import JSONExtractionError, extract_json
+from app.services.llm_client import create_model, generate_content
+from app.services.metrics import record_parse_failure
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -12,18 +15,23 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# How wrong-answer explanations are generated: "concurrent" makes one call per
+# wrong answer in parallel, "batch" asks for all of them in a single call
+LEARNING_EXPLANATION_MODE = os.getenv("LEARNING_EXPLANATION_MODE", "concurrent")
+
+# Maximum Gemini calls in flight for a single learning-content request
+LEARNING_MAX_CONCURRENCY = int(os.getenv("LEARNING_MAX_CONCURRENCY", "4"))
+
+# Timeout in seconds for each explanation call; a slow one falls back to the default explanation
+LEARNING_CALL_TIMEOUT = float(os.getenv("LEARNING_CALL_TIMEOUT", "30"))
+
 # Initialize model as None
 model = None
 
 def initialize_gemini():
     global model
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = create_model('gemini-2.0-flash')
         logger.info("Gemini API initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Gemini API: {str(e)}")
@@ -35,33 +43,21 @@ try:
 except Exception as e:
     logger.error(f"Failed to initialize Gemini API during startup: {str(e)}")
 
-async def generate_learning_content(task_description: str, language: str, wrong_answers: List[Dict[str, Any]] = None) -> Dict[str, Any]:
-    """
-    Generate learning content based on the task description and wrong answers.
-    """
-    if not model:
-        try:
-            initialize_gemini()
-        except Exception as e:
-            raise Exception("Failed to initialize Gemini API. Please check your API key.")
+def default_explanation() -> Dict[str, Any]:
+    """Placeholder used when an explanation couldn't be generated"""
+    return {
+        "explanation": "Sorry, we couldn't generate an explanation for this question.",
+        "visual_explanation": {"type": "none", "content": ""},
+        "concept_keywords": []
+    }
 
-    try:
-        logger.info(f"Generating learning content for task: {task_description}")
-        logger.info(f"Number of wrong answers: {len(wrong_answers) if wrong_answers else 0}")
-        
-        # Generate explanations for wrong answers
-        wrong_answer_explanations = []
-        concept_keywords_set = set()
-        
-        if wrong_answers:
-            for wrong in wrong_answers:
-                explanation_prompt = f"""For the following programming question in {language}:
-                Question: {wrong['question']}
+def describe_wrong_answer(wrong: Dict[str, Any]) -> str:
+    return f"""Question: {wrong['question']}
                 {f"Code snippet: {wrong['code_snippet']}" if 'code_snippet' in wrong and wrong['code_snippet'] else ""}
                 Correct answer: {wrong['correct_answer']}
-                User's answer: {wrong['user_answer']}
-                
-                Provide a detailed explanation that includes:
+                User's answer: {wrong['user_answer']}"""
+
+EXPLANATION_REQUIREMENTS = """Provide a detailed explanation that includes:
                 1. Why the correct answer is right (2-3 sentences)
                 2. What the user might have misunderstood
                 3. A visual explanation if the question involves:
@@ -69,74 +65,113 @@ async def generate_learning_content(task_description: str, language: str, wrong_
                    - Data structures
                    - Algorithm steps
                    - Memory/stack operations
-                   - Object relationships
-                
-                Format the response as JSON:
-                {{
+                   - Object relationships"""
+
+EXPLANATION_FORMAT = """{
                     "explanation": "Main explanation text",
-                    "visual_explanation": {{
+                    "visual_explanation": {
                         "type": "flowchart|diagram|steps|memory|none",
                         "content": "ASCII art or text-based visualization if needed"
-                    }},
+                    },
                     "concept_keywords": ["keyword1", "keyword2", ...]  # Key concepts to focus on
-                }}
+                }"""
+
+def normalize_explanation(explanation: Any) -> Dict[str, Any]:
+    """Ensure all fields of an explanation exist"""
+    if not isinstance(explanation, dict):
+        raise ValueError("Explanation is not an object")
+    
+    if "explanation" not in explanation:
+        explanation["explanation"] = "No explanation provided."
+    
+    if "visual_explanation" not in explanation:
+        explanation["visual_explanation"] = {"type": "none", "content": ""}
+    elif "type" not in explanation["visual_explanation"]:
+        explanation["visual_explanation"]["type"] = "none"
+    elif "content" not in explanation["visual_explanation"]:
+        explanation["visual_explanation"]["content"] = ""
+    
+    if "concept_keywords" not in explanation:
+        explanation["concept_keywords"] = []
+    
+    return explanation
+
+async def explain_wrong_answer(wrong: Dict[str, Any], language: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """Explain one wrong answer, falling back to the default explanation on any failure"""
+    explanation_prompt = f"""For the following programming question in {language}:
+                {describe_wrong_answer(wrong)}
+                
+                {EXPLANATION_REQUIREMENTS}
+                
+                Format the response as JSON:
+                {EXPLANATION_FORMAT}
                 
                 If no visual explanation is needed, set visual_explanation.type to "none" and content to empty string."""
+    
+    try:
+        async with semaphore:
+            response = await generate_content(model, explanation_prompt, template="wrong_answer_explanation",
+                                              timeout=LEARNING_CALL_TIMEOUT)
+        if not response or not response.text:
+            return default_explanation()
+        try:
+            return normalize_explanation(extract_json(response.text, dict))
+        except ValueError as e:
+            record_parse_failure("wrong_answer_explanation")
+            logger.error(f"Failed to parse explanation JSON: {response.text}")
+            logger.error(f"Error: {str(e)}")
+            return default_explanation()
+    except Exception as e:
+        logger.error(f"Error generating explanation: {str(e)}")
+        return default_explanation()
+
+async def explain_wrong_answers_batch(wrong_answers: List[Dict[str, Any]], language: str,
+                                      semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """Explain all wrong answers with a single call; falls back to per-answer calls if the batch fails"""
+    questions = "\n\n".join(
+        f"""Item {index + 1}:
+                {describe_wrong_answer(wrong)}""" for index, wrong in enumerate(wrong_answers)
+    )
+    prompt = f"""For each of the following {len(wrong_answers)} programming questions in {language} that the user answered incorrectly:
+                
+                {questions}
+                
+                For EACH item, {EXPLANATION_REQUIREMENTS[0].lower() + EXPLANATION_REQUIREMENTS[1:]}
                 
-                try:
-                    response = await model.generate_content_async(explanation_prompt)
-                    if response and response.text:
-                        try:
-                            # Clean the response text
-                            clean_text = response.text.strip()
-                            if clean_text.startswith("```json"):
-                                clean_text = clean_text[7:]
-                            if clean_text.endswith("```"):
-                                clean_text = clean_text[:-3]
-                            clean_text = clean_text.strip()
-                            
-                            explanation = json.loads(clean_text)
-                            
-                            # Ensure all fields exist
-                            if "explanation" not in explanation:
-                                explanation["explanation"] = "No explanation provided."
-                            
-                            if "visual_explanation" not in explanation:
-                                explanation["visual_explanation"] = {"type": "none", "content": ""}
-                            elif "type" not in explanation["visual_explanation"]:
-                                explanation["visual_explanation"]["type"] = "none"
-                            elif "content" not in explanation["visual_explanation"]:
-                                explanation["visual_explanation"]["content"] = ""
-                            
-                            if "concept_keywords" not in explanation:
-                                explanation["concept_keywords"] = []
-                            
-                            # Add to explanations list
-                            wrong_answer_explanations.append(explanation)
-                            
-                            # Add keywords to set
-                            if explanation["concept_keywords"]:
-                                concept_keywords_set.update(explanation["concept_keywords"])
-                                
-                        except json.JSONDecodeError as e:
-                            logger.error(f"Failed to parse explanation JSON: {response.text}")
-                            logger.error(f"Error: {str(e)}")
-                            # Add a default explanation
-                            wrong_answer_explanations.append({
-                                "explanation": "Sorry, we couldn't generate an explanation for this question.",
-                                "visual_explanation": {"type": "none", "content": ""},
-                                "concept_keywords": []
-                            })
-                except Exception as e:
-                    logger.error(f"Error generating explanation: {str(e)}")
-                    wrong_answer_explanations.append({
-                        "explanation": "Sorry, we couldn't generate an explanation for this question.",
-                        "visual_explanation": {"type": "none", "content": ""},
-                        "concept_keywords": []
-                    })
-
-        # Generate general learning content
-        prompt = f"""Generate comprehensive learning content for the following programming task in {language}:
+                Format the response as a JSON array with exactly {len(wrong_answers)} objects, one per item and in the same order, each like:
+                {EXPLANATION_FORMAT}
+                
+                If no visual explanation is needed, set visual_explanation.type to "none" and content to empty string.
+                Return ONLY the JSON array."""
+    
+    try:
+        async with semaphore:
+            response = await generate_content(model, prompt, template="wrong_answer_explanation_batch",
+                                              timeout=LEARNING_CALL_TIMEOUT)
+        explanations = extract_json(response.text, list)
+        if len(explanations) != len(wrong_answers):
+            raise ValueError(f"Expected {len(wrong_answers)} explanations")
+        return [normalize_explanation(explanation) for explanation in explanations]
+    except ValueError as e:
+        record_parse_failure("wrong_answer_explanation_batch")
+        logger.error(f"Failed to parse batched explanations, explaining individually: {str(e)}")
+    except Exception as e:
+        logger.error(f"Error generating batched explanations, explaining individually: {str(e)}")
+    
+    return await asyncio.gather(*(explain_wrong_answer(wrong, language, semaphore) for wrong in wrong_answers))
+
+async def explain_wrong_answers(wrong_answers: List[Dict[str, Any]], language: str,
+                                semaphore: asyncio.Semaphore) -> List[Dict[str, Any]]:
+    """Explanations for every wrong answer, in order; failed ones get the default explanation"""
+    if not wrong_answers:
+        return []
+    if LEARNING_EXPLANATION_MODE == "batch" and len(wrong_answers) > 1:
+        return await explain_wrong_answers_batch(wrong_answers, language, semaphore)
+    return await asyncio.gather(*(explain_wrong_answer(wrong, language, semaphore) for wrong in wrong_answers))
+
+async def generate_general_content(task_description: str, language: str, semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+    """Generate the sectioned learning content for the task"""
+    prompt = f"""Generate comprehensive learning content for the following programming task in {language}:
         Task: {task_description}
         
         Requirements:
@@ -167,69 +202,97 @@ async def generate_learning_content(task_description: str, language: str, wrong_
         - If no code example is needed for a section, omit the 'code' field entirely
         - Make sure the JSON is properly formatted and valid"""
 
-        try:
-            response = await model.generate_content_async(prompt)
-            
-            if not response or not response.text:
-                raise ValueError("No response from AI model")
-            
-            # Clean the response text to ensure it's valid JSON
-            response_text = response.text.strip()
-            # Remove any markdown code block indicators
-            response_text = response_text.replace('```json', '').replace('```', '')
-            # Remove any leading/trailing whitespace
-            response_text = response_text.strip()
-            
-            # Parse the JSON response
-            content = json.loads(response_text)
-            
-            # Validate the structure
-            if not isinstance(content, dict):
-                raise ValueError("Response is not a dictionary")
-            
-            if "sections" not in content:
-                content["sections"] = []
-            
-            # Validate each section has the required fields
-            for i, section in enumerate(content["sections"]):
-                if "title" not in section:
-                    section["title"] = f"Section {i+1}"
-                if "content" not in section:
-                    section["content"] = "No content provided."
-                
-                # Convert all fields to strings
-                section["title"] = str(section["title"])
-                section["content"] = str(section["content"])
-                
-                if "code" in section:
-                    if section["code"] is None:
-                        del section["code"]
-                    else:
-                        section["code"] = str(section["code"])
-            
-            # Add wrong answer explanations if available
-            if wrong_answer_explanations:
-                content["wrong_answers"] = wrong_answer_explanations
-                
-                # Add concept keywords
-                content["concept_keywords"] = list(concept_keywords_set)
-            else:
-                content["wrong_answers"] = []
-                content["concept_keywords"] = []
+    try:
+        async with semaphore:
+            response = await generate_content(model, prompt, template="learning_content")
+        
+        if not response or not response.text:
+            raise ValueError("No response from AI model")
+        
+        # Parse the JSON object, skipping any code fence or prose around it
+        content = extract_json(response.text, dict)
+        
+        if "sections" not in content:
+            content["sections"] = []
+        
+        # Validate each section has the required fields
+        for i, section in enumerate(content["sections"]):
+            if "title" not in section:
+                section["title"] = f"Section {i+1}"
+            if "content" not in section:
+                section["content"] = "No content provided."
             
-            # Add a flag to indicate that boilerplate code should be used
-            content["use_boilerplate"] = True
+            # Convert all fields to strings
+            section["title"] = str(section["title"])
+            section["content"] = str(section["content"])
             
-            logger.info("Successfully generated learning content")
-            return content
+            if "code" in section:
+                if section["code"] is None:
+                    del section["code"]
+                else:
+                    section["code"] = str(section["code"])
+        
+        return content
+        
+    except JSONExtractionError as e:
+        record_parse_failure("learning_content")
+        logger.error(f"Error parsing learning content JSON: {str(e)}")
+        raise ValueError(f"Failed to parse learning content: Invalid JSON format - {str(e)}")
+    except ValueError as e:
+        record_parse_failure("learning_content")
+        logger.error(f"Error validating learning content format: {str(e)}")
+        raise ValueError(f"Failed to parse learning content: {str(e)}")
+
+async def generate_learning_content(task_description: str, language: str, wrong_answers: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generate learning content based on the task description and wrong answers.
+    
+    The general content and the wrong-answer explanations are generated
+    concurrently (at most LEARNING_MAX_CONCURRENCY calls at once). An
+    explanation that fails or times out is replaced by a default one so the
+    rest of the content is still returned.
+    """
+    if not model:
+        try:
+            initialize_gemini()
+        except Exception as e:
+            raise Exception("Failed to initialize Gemini API. Please check your API key.")
+
+    try:
+        logger.info(f"Generating learning content for task: {task_description}")
+        logger.info(f"Number of wrong answers: {len(wrong_answers) if wrong_answers else 0}")
+        
+        semaphore = asyncio.Semaphore(LEARNING_MAX_CONCURRENCY)
+        content_task = asyncio.ensure_future(generate_general_content(task_description, language, semaphore))
+        explanations_task = asyncio.ensure_future(explain_wrong_answers(wrong_answers or [], language, semaphore))
+        try:
+            content = await content_task
+        except Exception:
+            # Without the main content there's nothing to return
+            explanations_task.cancel()
+            raise
+        wrong_answer_explanations = await explanations_task
+        
+        # Add wrong answer explanations if available
+        if wrong_answer_explanations:
+            content["wrong_answers"] = wrong_answer_explanations
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Error parsing learning content JSON: {str(e)}")
-            raise ValueError(f"Failed to parse learning content: Invalid JSON format - {str(e)}")
-        except ValueError as e:
-            logger.error(f"Error validating learning content format: {str(e)}")
-            raise ValueError(f"Failed to parse learning content: {str(e)}")
+            # Add concept keywords
+            concept_keywords_set = set()
+            for explanation in wrong_answer_explanations:
+                if explanation["concept_keywords"]:
+                    concept_keywords_set.update(explanation["concept_keywords"])
+            content["concept_keywords"] = list(concept_keywords_set)
+        else:
+            content["wrong_answers"] = []
+            content["concept_keywords"] = []
+        
+        # Add a flag to indicate that boilerplate code should be used
+        content["use_boilerplate"] = True
+        
+        logger.info("Successfully generated learning content")
+        return content
     
     except Exception as e:
         logger.error(f"Error generating learning content: {str(e)}")
-        raise Exception(f"Failed to generate learning content: {str(e)}") 
\ No newline at end of file
+        raise Exception(f"Failed to generate learning content: {str(e)}")
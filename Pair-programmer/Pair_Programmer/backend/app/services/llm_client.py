@@ -0,0 +1,144 @@
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions as google_exceptions
+
+from app.services.metrics import (LLM_COALESCED, LLM_INPUT_TOKENS, LLM_LATENCY, LLM_OUTPUT_TOKENS,
+                                  LLM_REQUESTS, LLM_RETRIES, llm_labels)
+from app.services.request_timing import timed
+from app.services.single_flight import SingleFlight, request_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Load environment variables, so .env can select the provider
+load_dotenv()
+
+# Per-call timeout in seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Retries for rate limiting and transient server errors, with exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded
+)
+
+# Share one Gemini call among concurrent identical requests (e.g. a class
+# generating the same quiz at once); set LLM_SINGLE_FLIGHT=false to disable
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true"
+
+# "gemini" for the real API, "fake" for the offline stand-in used in load tests
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+# Append every response to this JSONL file, for the fake provider to replay later
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+
+single_flight = SingleFlight()
+
+# Prompt template of the call in progress, so the fake provider knows what kind
+# of response to produce
+current_template = contextvars.ContextVar("current_template", default="unknown")
+
+_record_lock = threading.Lock()
+_fake_provider = None
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call doesn't finish within its timeout"""
+
+def create_model(model_name: str = "gemini-2.0-flash"):
+    """A Gemini model, or the offline fake's stand-in when LLM_PROVIDER=fake"""
+    global _fake_provider
+    if LLM_PROVIDER == "fake":
+        if _fake_provider is None:
+            from app.services.fake_llm import FakeProvider
+            logger.warning("Using the offline fake LLM provider; responses are synthetic")
+            _fake_provider = FakeProvider()
+        return _fake_provider.model(model_name)
+
+    api_key = os.getenv("GEMINI_API_KEY")
+    if not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable is not set")
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+def prompt_key(prompt: str) -> str:
+    """Key a recorded response by its prompt"""
+    return request_key(prompt)
+
+def _record(template: str, prompt: str, text: str) -> None:
+    line = json.dumps({"template": template, "prompt_key": prompt_key(prompt), "response": text})
+    try:
+        with _record_lock, open(LLM_RECORD_PATH, "a", encoding="utf-8") as recording:
+            recording.write(line + "\n")
+    except OSError as e:
+        logger.warning(f"Could not record LLM response to {LLM_RECORD_PATH}: {str(e)}")
+
+def _model_name(model) -> str:
+    return getattr(model, "model_name", "unknown").replace("models/", "")
+
+async def generate_content(model, prompt: str, template: str = "unknown", timeout: Optional[float] = None):
+    """
+    Call model.generate_content_async with retries and a timeout, recording
+    latency, token counts and the outcome per endpoint and prompt template.
+    Concurrent calls with the same model, config and prompt share one request.
+    """
+    labels = llm_labels(template, _model_name(model))
+    with timed("upstream"):
+        if not LLM_SINGLE_FLIGHT:
+            return await _generate_content(model, prompt, labels, timeout)
+
+        key = request_key(_model_name(model), getattr(model, "_generation_config", None), prompt)
+        return await single_flight.do(
+            key, lambda: _generate_content(model, prompt, labels, timeout), lambda: LLM_COALESCED.inc(**labels)
+        )
+
+async def _generate_content(model, prompt: str, labels: Dict[str, str], timeout: Optional[float]):
+    template = labels["template"]
+    timeout = timeout or LLM_TIMEOUT
+    start = time.monotonic()
+    status = "error"
+    attempt = 0
+    current_template.set(template)
+    try:
+        while True:
+            try:
+                response = await asyncio.wait_for(model.generate_content_async(prompt), timeout=timeout)
+                break
+            except asyncio.TimeoutError:
+                status = "timeout"
+                raise LLMTimeoutError(f"Gemini call timed out after {timeout} seconds")
+            except RETRYABLE_ERRORS as e:
+                if attempt >= LLM_MAX_RETRIES:
+                    raise
+                attempt += 1
+                LLM_RETRIES.inc(**labels)
+                delay = LLM_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+                logger.warning(f"Retrying Gemini call ({template}) in {delay:.2f}s after: {str(e)}")
+                await asyncio.sleep(delay)
+
+        status = "ok"
+        usage = getattr(response, "usage_metadata", None)
+        if usage is not None:
+            LLM_INPUT_TOKENS.observe(getattr(usage, "prompt_token_count", 0) or 0, **labels)
+            LLM_OUTPUT_TOKENS.observe(getattr(usage, "candidates_token_count", 0) or 0, **labels)
+        if LLM_RECORD_PATH:
+            _record(template, prompt, response.text)
+        return response
+    finally:
+        LLM_LATENCY.observe(time.monotonic() - start, **labels)
+        LLM_REQUESTS.inc(status=status, **labels)
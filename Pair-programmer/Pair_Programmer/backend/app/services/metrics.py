@@ -0,0 +1,135 @@
+import bisect
+import threading
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Route of the request being served, used to label LLM metrics by endpoint
+current_endpoint = ContextVar("current_endpoint", default="background")
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Counter:
+    """Monotonic counter with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """Bucketed histogram with labels, rendered in Prometheus text format"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labelnames, key, ("le", "+Inf"))
+                lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+                lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class MetricsRegistry:
+    """Collects metrics and renders them for a /metrics endpoint"""
+
+    def __init__(self):
+        self._metrics = {}
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+LLM_LABELS = ("endpoint", "template", "model")
+
+LLM_REQUESTS = REGISTRY.counter(
+    "llm_requests_total", "Gemini calls by outcome", LLM_LABELS + ("status",))
+LLM_LATENCY = REGISTRY.histogram(
+    "llm_request_duration_seconds", "Gemini call latency including retries", LLM_LABELS)
+LLM_FIRST_TOKEN = REGISTRY.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed chunk arrives", LLM_LABELS)
+LLM_INPUT_TOKENS = REGISTRY.histogram(
+    "llm_input_tokens", "Prompt tokens per Gemini call", LLM_LABELS, TOKEN_BUCKETS)
+LLM_OUTPUT_TOKENS = REGISTRY.histogram(
+    "llm_output_tokens", "Response tokens per Gemini call", LLM_LABELS, TOKEN_BUCKETS)
+LLM_RETRIES = REGISTRY.counter(
+    "llm_retries_total", "Gemini calls retried after a transient error", LLM_LABELS)
+LLM_COALESCED = REGISTRY.counter(
+    "llm_coalesced_requests_total", "Gemini calls that shared an identical in-flight request", LLM_LABELS)
+LLM_PARSE_FAILURES = REGISTRY.counter(
+    "llm_parse_failures_total", "Gemini responses that could not be parsed or validated", ("endpoint", "template"))
+REQUEST_STAGE_DURATION = REGISTRY.histogram(
+    "request_stage_duration_seconds", "Time requests spent per stage (queue, upstream, parse, serialize, app)",
+    ("endpoint", "stage"), STAGE_BUCKETS)
+
+def record_parse_failure(template: str) -> None:
+    """Count a response from this prompt template that didn't parse"""
+    LLM_PARSE_FAILURES.inc(endpoint=current_endpoint.get(), template=template)
+
+def llm_labels(template: str, model_name: str) -> Dict[str, str]:
+    return {"endpoint": current_endpoint.get(), "template": template, "model": model_name}
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from types import FrameType
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Write sampled profiles to <PROFILE_PATH>.cpu.folded and <PROFILE_PATH>.wall.folded
+# on shutdown; unset, the profiler doesn't run
+PROFILE_PATH = os.getenv("PROFILE_PATH", "")
+
+# Seconds between samples
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.005"))
+
+# Only request handling shows up in the wall-clock profile
+REQUEST_MODULE_PREFIX = "app.api."
+
+# Where the event loop waits for I/O; CPU samples here are idle time
+IDLE_FRAMES_MODULE = "selectors"
+
+def _frame_name(frame: FrameType) -> str:
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}"
+
+def _thread_stack(frame: Optional[FrameType]) -> List[str]:
+    """Frame names from the outermost call to the innermost"""
+    stack = []
+    while frame is not None:
+        stack.append(_frame_name(frame))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+def _task_stack(task: asyncio.Task) -> List[str]:
+    """The chain of coroutines a task is suspended in, from its root to the innermost await"""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_frame_name(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+    return stack
+
+class SamplingProfiler:
+    """
+    Samples the server two ways and writes both as folded stacks, the input
+    format of flamegraph.pl and speedscope:
+
+    - cpu: what the event loop thread is executing, from a background thread;
+      samples where the loop is idle waiting for I/O are left out
+    - wall: where each in-flight request's coroutines are awaiting, from a
+      callback on the loop; shows which service call a request spends its time in
+    """
+
+    def __init__(self, path: str = PROFILE_PATH, interval: float = PROFILE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.cpu_stacks: Counter = Counter()
+        self.wall_stacks: Counter = Counter()
+        self.idle_samples = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    async def start(self) -> None:
+        if not self.path or self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._sample_cpu, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        self._timer = self._loop.call_later(self.interval, self._sample_tasks)
+        logger.info(f"Sampling profiler started, writing to {self.path}.*.folded")
+
+    async def shutdown(self) -> None:
+        if self._thread is None:
+            return
+        self._stopping.set()
+        if self._timer is not None:
+            self._timer.cancel()
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        self.write()
+
+    def _sample_cpu(self) -> None:
+        while not self._stopping.wait(self.interval):
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = _thread_stack(frame)
+            if not stack:
+                continue
+            module, _, function = stack[-1].partition(":")
+            if module == IDLE_FRAMES_MODULE and function.endswith("select"):
+                self.idle_samples += 1
+                continue
+            self.cpu_stacks[";".join(stack)] += 1
+
+    def _sample_tasks(self) -> None:
+        for task in asyncio.all_tasks(self._loop):
+            stack = _task_stack(task)
+            if any(name.startswith(REQUEST_MODULE_PREFIX) for name in stack):
+                self.wall_stacks[";".join(stack)] += 1
+        self._timer = self._loop.call_later(self.interval, self._sample_tasks)
+
+    def write(self) -> None:
+        for kind, stacks in (("cpu", self.cpu_stacks), ("wall", self.wall_stacks)):
+            path = f"{self.path}.{kind}.folded"
+            with open(path, "w") as folded:
+                for stack, count in stacks.most_common():
+                    folded.write(f"{stack} {count}\n")
+        total = sum(self.cpu_stacks.values())
+        busy = total / (total + self.idle_samples) if total + self.idle_samples else 0.0
+        logger.info(f"Wrote {total} CPU and {sum(self.wall_stacks.values())} request samples "
+                    f"to {self.path}.*.folded (event loop busy {busy:.0%} of samples)")
+
+profiler = SamplingProfiler()
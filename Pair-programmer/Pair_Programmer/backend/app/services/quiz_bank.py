@@ -0,0 +1,227 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from app.services.metrics import REGISTRY
+from app.services.quiz_service import generate_quiz
+from app.services import sqlite_db
+from app.services.single_flight import request_key
+
+logger = logging.getLogger(__name__)
+
+# Serve quizzes from pre-generated questions instead of calling Gemini per request
+QUIZ_BANK_ENABLED = os.getenv("QUIZ_BANK_ENABLED", "true").lower() == "true"
+QUIZ_BANK_PATH = os.getenv("QUIZ_BANK_PATH", "quiz_bank.db")
+
+# Where the server keeps its data; a relative QUIZ_BANK_PATH is resolved against it
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                              "pair-programmer"))
+
+# Questions in one served quiz; generate_quiz always produces this many
+QUIZ_SIZE = 10
+
+# Keep refilling a task's pool in the background until it holds this many distinct questions
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET", "30"))
+
+# Banked questions are dropped this many seconds after they were generated
+QUIZ_BANK_TTL = int(os.getenv("QUIZ_BANK_TTL", str(7 * 24 * 3600)))
+
+# Background generations running at once, and refills allowed to wait for one
+QUIZ_BANK_REFILL_CONCURRENCY = int(os.getenv("QUIZ_BANK_REFILL_CONCURRENCY", "2"))
+QUIZ_BANK_QUEUE_SIZE = int(os.getenv("QUIZ_BANK_QUEUE_SIZE", "100"))
+
+QUIZ_BANK_LOOKUPS = REGISTRY.counter(
+    "quiz_bank_lookups_total", "Quiz bank lookups by result (hit, miss or bypass)", ("result",))
+QUIZ_BANK_REFILLS = REGISTRY.counter(
+    "quiz_bank_refills_total", "Background quiz bank refills by result (ok, error or dropped)", ("result",))
+
+def quiz_bank_path() -> str:
+    return os.path.join(DATA_DIR, QUIZ_BANK_PATH)
+
+def task_fingerprint(task_description: str) -> str:
+    """Identify a task by its description, ignoring case and whitespace"""
+    return request_key("quiz", " ".join(task_description.lower().split()))
+
+def question_key(question: Dict[str, Any]) -> str:
+    """Identify a question by its text and code, so the same question is only banked once"""
+    text = " ".join(question["question"].lower().split()) + "\0" + (question.get("code_snippet") or "").strip()
+    return hashlib.sha256(text.encode()).hexdigest()
+
+class QuizBankStore:
+    """Banked questions in SQLite (WAL mode), indexed by task fingerprint and language"""
+
+    # Drop expired questions every this many inserts
+    TRIM_EVERY = 100
+
+    def __init__(self, path: Optional[str] = None, ttl: int = QUIZ_BANK_TTL):
+        path = path or quiz_bank_path()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite_db.connect(path)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quiz_bank ("
+                "fingerprint TEXT NOT NULL, language TEXT NOT NULL, question_key TEXT NOT NULL, "
+                "data TEXT NOT NULL, served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, language, question_key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS quiz_bank_created_at ON quiz_bank (created_at)")
+
+    def add(self, fingerprint: str, language: str, questions: List[Dict[str, Any]], served: bool = False) -> int:
+        """Bank questions not already held for this task; returns how many were new"""
+        now = time.time()
+        rows = [(fingerprint, language, question_key(question), json.dumps(question), int(served), now)
+                for question in questions]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO quiz_bank (fingerprint, language, question_key, data, served, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            added = self._conn.total_changes - before
+            self._inserts += added
+            if self._inserts >= self.TRIM_EVERY:
+                self._inserts = 0
+                self._conn.execute("DELETE FROM quiz_bank WHERE created_at < ?", (now - self.ttl,))
+        return added
+
+    def count(self, fingerprint: str, language: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM quiz_bank WHERE fingerprint = ? AND language = ? AND created_at >= ?",
+                (fingerprint, language, time.time() - self.ttl)
+            ).fetchone()[0]
+
+    def take(self, fingerprint: str, language: str, count: int) -> Optional[List[Dict[str, Any]]]:
+        """
+        A random set of count distinct questions, least served first so repeat
+        quizzes rotate through the pool; None if the pool is smaller than that.
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT question_key, data FROM quiz_bank "
+                "WHERE fingerprint = ? AND language = ? AND created_at >= ? "
+                "ORDER BY served, RANDOM() LIMIT ?",
+                (fingerprint, language, time.time() - self.ttl, count)
+            ).fetchall()
+            if len(rows) < count:
+                return None
+            self._conn.executemany(
+                "UPDATE quiz_bank SET served = served + 1 "
+                "WHERE fingerprint = ? AND language = ? AND question_key = ?",
+                [(fingerprint, language, row[0]) for row in rows]
+            )
+        questions = [json.loads(row[1]) for row in rows]
+        random.shuffle(questions)
+        return questions
+
+class QuizBank:
+    """Validated quizzes per task, served instantly and refilled by background workers"""
+
+    def __init__(self, store: Optional[QuizBankStore] = None,
+                 generate: Callable[[str, str], Awaitable[List[Dict[str, Any]]]] = generate_quiz,
+                 target: int = QUIZ_BANK_TARGET, concurrency: int = QUIZ_BANK_REFILL_CONCURRENCY):
+        # Opened in start(), so importing the module doesn't create the database
+        self.store = store
+        self.generate = generate
+        self.target = target
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self.store is None and QUIZ_BANK_ENABLED:
+            self.store = QuizBankStore()
+            logger.info(f"Quiz bank opened at {self.store.path}")
+        if self.store is not None and not self._workers:
+            self._queue = asyncio.Queue(maxsize=QUIZ_BANK_QUEUE_SIZE)
+            self._workers = [asyncio.ensure_future(self._refill_forever()) for _ in range(self.concurrency)]
+
+    async def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._pending.clear()
+
+    async def get_quiz(self, task_description: str, language: str, use_bank: bool = True) -> List[Dict[str, Any]]:
+        """
+        A quiz for the task: a random set from the bank when it holds enough
+        questions, otherwise generated now and banked. Either way the pool is
+        topped up in the background. Until start() opens the bank, quizzes are
+        generated directly.
+        """
+        if self.store is None or not use_bank:
+            QUIZ_BANK_LOOKUPS.inc(result="bypass")
+            return await self.generate(task_description, language)
+
+        fingerprint = task_fingerprint(task_description)
+        try:
+            questions = self.store.take(fingerprint, language, QUIZ_SIZE)
+        except sqlite3.OperationalError as e:
+            # Busy with another worker's write; generating the quiz beats stalling the event loop
+            logger.warning(f"Quiz bank lookup failed: {str(e)}")
+            questions = None
+        QUIZ_BANK_LOOKUPS.inc(result="hit" if questions else "miss")
+        if questions:
+            questions = [{**question, "id": f"q{index}"} for index, question in enumerate(questions, 1)]
+        else:
+            questions = await self.generate(task_description, language)
+            try:
+                self.store.add(fingerprint, language, questions, served=True)
+            except sqlite3.OperationalError as e:
+                logger.warning(f"Could not bank quiz questions: {str(e)}")
+        self.prefetch(task_description, language)
+        return questions
+
+    def prefetch(self, task_description: str, language: str) -> bool:
+        """Queue a background generation for the task unless its pool is already full; never blocks"""
+        if self.store is None or not self._workers:
+            return False
+        fingerprint = task_fingerprint(task_description)
+        key = f"{fingerprint}:{language}"
+        try:
+            if key in self._pending or self.store.count(fingerprint, language) >= self.target:
+                return False
+        except sqlite3.OperationalError:
+            return False
+        try:
+            self._queue.put_nowait((key, task_description, language))
+        except asyncio.QueueFull:
+            QUIZ_BANK_REFILLS.inc(result="dropped")
+            return False
+        self._pending.add(key)
+        return True
+
+    async def _refill_forever(self) -> None:
+        while True:
+            key, task_description, language = await self._queue.get()
+            try:
+                questions = await self.generate(task_description, language)
+                added = self.store.add(task_fingerprint(task_description), language, questions)
+                QUIZ_BANK_REFILLS.inc(result="ok")
+                logger.info(f"Banked {added} new quiz questions for task: {task_description[:60]}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                QUIZ_BANK_REFILLS.inc(result="error")
+                logger.warning(f"Quiz bank refill failed: {str(e)}")
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+quiz_bank = QuizBank()
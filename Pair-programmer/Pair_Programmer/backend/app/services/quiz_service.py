@@ -1,10 +1,11 @@
-import os
-import google.generativeai as genai
 from dotenv import load_dotenv
 import logging
-import json
 from typing import List, Dict, Any
 
+from app.services.json_extract import JSONExtractionError, extract_json
+from app.services.llm_client import create_model, generate_content
+from app.services.metrics import record_parse_failure
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -18,12 +19,7 @@ model = None
 def initialize_gemini():
     global model
     try:
-        api_key = os.getenv("GEMINI_API_KEY")
-        if not api_key:
-            raise ValueError("GEMINI_API_KEY environment variable is not set")
-        
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        model = create_model('gemini-2.0-flash')
         logger.info("Gemini API initialized successfully")
     except Exception as e:
         logger.error(f"Failed to initialize Gemini API: {str(e)}")
@@ -78,23 +74,16 @@ async def generate_quiz(task_description: str, language: str) -> List[Dict[str,
         - For questions without code snippets, focus on conceptual understanding
         - The code_snippet field should be omitted for non-code questions"""
 
-        response = await model.generate_content_async(prompt)
+        response = await generate_content(model, prompt, template="quiz")
         
         if not response or not response.text:
             raise ValueError("No response from AI model")
         
-        # Clean the response text to ensure it's valid JSON
-        response_text = response.text.strip()
-        # Remove any markdown code block indicators
-        response_text = response_text.replace('```json', '').replace('```', '')
-        # Remove any leading/trailing whitespace
-        response_text = response_text.strip()
+        response_text = response.text
         
-        # Parse the JSON response
+        # Parse the JSON array, skipping any code fence or prose around it
         try:
-            questions = json.loads(response_text)
-            if not isinstance(questions, list):
-                raise ValueError("Response is not a list")
+            questions = extract_json(response_text, list)
             if len(questions) != 10:
                 raise ValueError(f"Expected 10 questions, got {len(questions)}")
             
@@ -113,11 +102,13 @@ async def generate_quiz(task_description: str, language: str) -> List[Dict[str,
                         raise ValueError(f"Question {i+1} code_snippet must be a string")
             
             return questions
-        except json.JSONDecodeError as e:
+        except JSONExtractionError as e:
+            record_parse_failure("quiz")
             logger.error(f"Error parsing quiz JSON: {str(e)}")
             logger.error(f"Raw response: {response_text}")
             raise ValueError("Failed to parse quiz questions: Invalid JSON format")
         except ValueError as e:
+            record_parse_failure("quiz")
             logger.error(f"Error validating quiz format: {str(e)}")
             raise ValueError(f"Failed to parse quiz questions: {str(e)}")
     
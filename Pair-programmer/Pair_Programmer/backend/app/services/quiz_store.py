@@ -0,0 +1,190 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from app.services import sqlite_db
+
+logger = logging.getLogger(__name__)
+
+# "memory" for a single worker, "sqlite" to keep quizzes across restarts and share them between workers
+QUIZ_STORE = os.getenv("QUIZ_STORE", "memory")
+QUIZ_DB_PATH = os.getenv("QUIZ_DB_PATH", "quiz_sessions.db")
+
+# Quiz sessions expire this many seconds after they were generated
+QUIZ_SESSION_TTL = int(os.getenv("QUIZ_SESSION_TTL", "7200"))
+
+# Hard cap on stored quiz sessions; the oldest are evicted beyond it
+QUIZ_MAX_SESSIONS = int(os.getenv("QUIZ_MAX_SESSIONS", "10000"))
+
+# Seconds between background expiry sweeps
+QUIZ_REAP_INTERVAL = int(os.getenv("QUIZ_REAP_INTERVAL", "60"))
+
+class MemoryQuizStore:
+    """In-process quiz sessions kept in creation order, so expiry only looks at the oldest entries"""
+
+    def __init__(self, max_sessions: int = QUIZ_MAX_SESSIONS, ttl: int = QUIZ_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self._sessions = OrderedDict()  # session_id -> data, oldest first
+        self._lock = threading.Lock()
+
+    def create(self, session_id: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._sessions[session_id] = data
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._sessions.get(session_id)
+            if data is None:
+                return None
+            if time.time() - data["created_at"] > self.ttl:
+                del self._sessions[session_id]
+                return None
+            return data
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def expire(self) -> int:
+        """Drop sessions older than the TTL"""
+        cutoff = time.time() - self.ttl
+        expired = 0
+        with self._lock:
+            while self._sessions:
+                data = next(iter(self._sessions.values()))
+                if data["created_at"] >= cutoff:
+                    break
+                self._sessions.popitem(last=False)
+                expired += 1
+        return expired
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class SQLiteQuizStore:
+    """Quiz sessions in SQLite (WAL mode), shared by every worker on the host"""
+
+    # Enforce the capacity limit every this many inserts rather than on each one
+    TRIM_EVERY = 100
+
+    def __init__(self, path: str = QUIZ_DB_PATH, max_sessions: int = QUIZ_MAX_SESSIONS,
+                 ttl: int = QUIZ_SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite_db.connect(path)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quiz_sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS quiz_sessions_created_at ON quiz_sessions (created_at)"
+            )
+
+    def create(self, session_id: str, data: Dict[str, Any]) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO quiz_sessions (session_id, data, created_at) VALUES (?, ?, ?)",
+                (session_id, json.dumps(data), data["created_at"])
+            )
+            self._inserts += 1
+            if self._inserts % self.TRIM_EVERY == 0:
+                self._trim()
+
+    def _trim(self) -> None:
+        cursor = self._conn.execute(
+            "DELETE FROM quiz_sessions WHERE session_id IN ("
+            "SELECT session_id FROM quiz_sessions ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,)
+        )
+        self.evicted += cursor.rowcount
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data FROM quiz_sessions WHERE session_id = ? AND created_at >= ?",
+                (session_id, time.time() - self.ttl)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM quiz_sessions WHERE session_id = ?", (session_id,))
+            return cursor.rowcount > 0
+
+    def expire(self) -> int:
+        """Drop sessions older than the TTL and enforce the capacity limit"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM quiz_sessions WHERE created_at < ?", (time.time() - self.ttl,)
+            )
+            self._trim()
+            return cursor.rowcount
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM quiz_sessions").fetchone()[0]
+
+def create_quiz_store():
+    """Build the quiz store configured through the environment"""
+    if QUIZ_STORE == "sqlite":
+        return SQLiteQuizStore()
+    return MemoryQuizStore()
+
+class QuizSessions:
+    """Generated quizzes kept until their answers are checked, expired by a background reaper"""
+
+    def __init__(self, store=None):
+        self.store = store or create_quiz_store()
+        self._reaper = None
+
+    async def start(self) -> None:
+        if self._reaper is None:
+            self._reaper = asyncio.ensure_future(self._reap_forever())
+
+    async def shutdown(self) -> None:
+        if self._reaper is not None:
+            self._reaper.cancel()
+            self._reaper = None
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(QUIZ_REAP_INTERVAL)
+            try:
+                expired = self.store.expire()
+                if expired:
+                    logger.info(f"Cleaned up {expired} old quiz sessions")
+            except Exception as e:
+                logger.error(f"Error expiring quiz sessions: {str(e)}")
+
+    def create(self, questions: List[Dict[str, Any]], task_description: str, language: str) -> str:
+        """Store a quiz and return its session ID"""
+        session_id = str(uuid.uuid4())
+        self.store.create(session_id, {
+            "questions": questions,
+            "task_description": task_description,
+            "language": language,
+            "created_at": time.time()
+        })
+        return session_id
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(session_id)
+
+quiz_sessions = QuizSessions()
@@ -0,0 +1,99 @@
+import functools
+import inspect
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+from app.services.metrics import REQUEST_STAGE_DURATION
+
+# Stages reported in the Server-Timing header, in order; "app" is whatever the
+# request spent outside the others
+STAGES = ("queue", "upstream", "parse", "serialize", "app")
+
+class RequestTimings:
+    """Where one request spent its time, by stage"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.handler_done: Optional[float] = None
+        # Stages with work in flight: stage -> (how many, when the first began)
+        self._open: Dict[str, Tuple[int, float]] = {}
+
+    def add(self, stage: str, seconds: float) -> None:
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def enter(self, stage: str) -> None:
+        count, since = self._open.get(stage, (0, time.perf_counter()))
+        self._open[stage] = (count + 1, since)
+
+    def exit(self, stage: str) -> None:
+        """Concurrent work in one stage (e.g. LLM calls gathered together) counts once, as wall time"""
+        count, since = self._open[stage]
+        if count > 1:
+            self._open[stage] = (count - 1, since)
+        else:
+            del self._open[stage]
+            self.add(stage, time.perf_counter() - since)
+
+    def finish(self, endpoint: str) -> Dict[str, float]:
+        """Close the request: stage durations in seconds, including the total, recorded as metrics"""
+        now = time.perf_counter()
+        if self.handler_done is not None:
+            self.add("serialize", now - self.handler_done)
+        total = now - self.started
+        # Different stages can overlap within one request, e.g. a run queued while an LLM call is out
+        self.stages["app"] = max(0.0, total - sum(self.stages.values()))
+        for stage, seconds in self.stages.items():
+            REQUEST_STAGE_DURATION.observe(seconds, endpoint=endpoint, stage=stage)
+        return {**self.stages, "total": total}
+
+    @staticmethod
+    def server_timing(durations: Dict[str, float]) -> str:
+        """Format stage durations as a Server-Timing header value"""
+        names = [stage for stage in STAGES if stage in durations] + ["total"]
+        return ", ".join(f"{name};dur={durations[name] * 1000:.1f}" for name in names)
+
+# Timings of the request being served; None outside a request
+current_timings: ContextVar[Optional[RequestTimings]] = ContextVar("current_timings", default=None)
+
+def record_stage(stage: str, seconds: float) -> None:
+    """Add time to the current request's stage, if there is a request"""
+    timings = current_timings.get()
+    if timings is not None:
+        timings.add(stage, seconds)
+
+@contextmanager
+def timed(stage: str):
+    """Add the time spent in this block to the current request's stage"""
+    timings = current_timings.get()
+    if timings is None:
+        yield
+        return
+    timings.enter(stage)
+    try:
+        yield
+    finally:
+        timings.exit(stage)
+
+def _mark_handler_done(endpoint):
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await endpoint(*args, **kwargs)
+        finally:
+            timings = current_timings.get()
+            if timings is not None:
+                timings.handler_done = time.perf_counter()
+    return wrapper
+
+class TimedRoute(APIRoute):
+    """An API route that notes when its handler returns, so response serialization can be timed"""
+
+    def __init__(self, path: str, endpoint, **kwargs):
+        if inspect.iscoroutinefunction(endpoint):
+            endpoint = _mark_handler_done(endpoint)
+        super().__init__(path, endpoint, **kwargs)
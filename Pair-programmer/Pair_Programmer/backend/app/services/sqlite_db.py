@@ -0,0 +1,10 @@
+import os
+import sqlite3
+
+# Seconds a write waits for another worker's lock before raising "database is locked".
+# The stores are called on the event loop, so this bounds how long a busy database can stall it
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", "0.2"))
+
+def connect(path: str) -> sqlite3.Connection:
+    """Open a connection that may be used from any thread and gives up quickly on a locked database"""
+    return sqlite3.connect(path, check_same_thread=False, timeout=SQLITE_BUSY_TIMEOUT)
@@ -0,0 +1,54 @@
+"""
+Local stand-in for the Piston execute API, for load tests. Answers
+POST /api/v2/piston/execute after a lognormal delay, without running anything.
+
+    python bench/piston_stub.py --port 2000 --latency 0.3
+    PISTON_API_URL=http://127.0.0.1:2000/api/v2/piston/execute uvicorn app.main:app
+"""
+import argparse
+import asyncio
+import math
+import random
+
+from aiohttp import web
+
+def create_app(latency: float, sigma: float, failure_rate: float, seed: int) -> web.Application:
+    rng = random.Random(seed)
+
+    async def execute(request: web.Request) -> web.Response:
+        payload = await request.json()
+        code = payload["files"][0]["content"]
+        delay = rng.lognormvariate(math.log(latency), sigma) if latency > 0 else 0
+        await asyncio.sleep(delay)
+
+        if rng.random() < failure_rate:
+            run = {"stdout": "", "stderr": "Traceback (most recent call last):\nNameError: name 'x' is not defined\n",
+                   "code": 1, "signal": None}
+        else:
+            run = {"stdout": f"ok: ran {len(code.splitlines())} lines\n", "stderr": "", "code": 0, "signal": None}
+        run["output"] = run["stdout"] + run["stderr"]
+        return web.json_response({"language": payload["language"], "version": "stub", "run": run})
+
+    async def runtimes(request: web.Request) -> web.Response:
+        return web.json_response([{"language": language, "version": "stub", "aliases": []}
+                                  for language in ("python", "javascript", "java", "c++")])
+
+    app = web.Application()
+    app.router.add_post("/api/v2/piston/execute", execute)
+    app.router.add_get("/api/v2/piston/runtimes", runtimes)
+    return app
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Local stand-in for the Piston API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.3, help="Median seconds per execution")
+    parser.add_argument("--sigma", type=float, default=0.5, help="Shape of the lognormal latency")
+    parser.add_argument("--failure-rate", type=float, default=0.2, help="Fraction of runs that exit with an error")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    web.run_app(create_app(args.latency, args.sigma, args.failure_rate, args.seed),
+                host=args.host, port=args.port, print=None)
+
+if __name__ == "__main__":
+    main()
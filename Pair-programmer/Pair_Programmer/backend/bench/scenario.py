@@ -0,0 +1,321 @@
+"""
+Scenario runner for the pair programmer's learner funnel.
+
+N virtual users each work through generate_scaffolding -> run_code ->
+analyze_code -> generate_quiz -> check_quiz -> generate_learning against the
+app, which runs with the offline fake Gemini (LLM_PROVIDER=fake) and a local
+Piston stub (bench/piston_stub.py). Every response's Server-Timing header
+breaks its time down into queueing, upstream wait, parsing, serialization and
+the rest; the report gives those per stage. The server runs with the sampling
+profiler on, leaving flame-graph-ready folded stacks next to the report.
+
+Run from the backend directory:
+
+    python bench/scenario.py --users 10 --iterations 3 --output-dir scenario-results
+
+    # Render a profile (or open the .folded file in https://www.speedscope.app)
+    flamegraph.pl scenario-results/profile.wall.folded > wall.svg
+"""
+import argparse
+import asyncio
+import json
+import math
+import logging
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("scenario")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+FUNNEL = ("generate_scaffolding", "run_code", "analyze_code", "generate_quiz", "check_quiz", "generate_learning")
+STAGES = ("queue", "upstream", "parse", "serialize", "app", "transport")
+
+TASKS = ("Write a function that reverses a string", "Sum the even numbers in a list",
+         "Count the words in a sentence", "Find the largest number in a list",
+         "Check whether a word is a palindrome", "Compute the factorial of a number")
+LANGUAGES = ("python", "javascript")
+
+# Wraps every route handler, so it is in every request stack; left out of the top functions
+TIMING_WRAPPER = "app.services.request_timing:"
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def parse_server_timing(header: str) -> Dict[str, float]:
+    """Stage durations in ms from a Server-Timing header like "upstream;dur=812.4, total;dur=820.1" """
+    durations = {}
+    for entry in header.split(","):
+        name, _, params = entry.strip().partition(";")
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "dur":
+                durations[name] = float(value)
+    return durations
+
+class Recorder:
+    """Client latency and server stage timings per endpoint"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, Dict[str, List[float]]] = defaultdict(lambda: defaultdict(list))
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, payload: Dict) -> Optional[Dict]:
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"/api/{endpoint}", json=payload)
+        except httpx.HTTPError as e:
+            logger.debug(f"{endpoint} failed: {str(e)}")
+            response = None
+        elapsed = (time.perf_counter() - started) * 1000
+        self.latencies[endpoint].append(elapsed)
+        if response is None or response.status_code != 200:
+            self.errors[endpoint] += 1
+            return None
+
+        timing = parse_server_timing(response.headers.get("server-timing", ""))
+        if "total" in timing:
+            for stage in STAGES[:-1]:
+                self.stages[endpoint][stage].append(timing.get(stage, 0.0))
+            # Time outside the app: network, HTTP parsing and the client itself
+            self.stages[endpoint]["transport"].append(max(0.0, elapsed - timing["total"]))
+        return response.json()
+
+    def endpoint_report(self, endpoint: str, duration: float) -> Dict:
+        latencies = self.latencies[endpoint]
+        stages = self.stages[endpoint]
+        mean_total = sum(latencies) / len(latencies)
+        breakdown = {}
+        for stage in STAGES:
+            values = stages.get(stage) or []
+            mean = sum(values) / len(values) if values else 0.0
+            breakdown[stage] = {"mean_ms": round(mean, 2), "p95_ms": round(percentile(values, 0.95), 2),
+                                "share": round(mean / mean_total, 4) if mean_total else 0.0}
+        return {
+            "requests": len(latencies),
+            "errors": self.errors[endpoint],
+            "throughput_rps": round(len(latencies) / duration, 3),
+            "latency_ms": {"mean": round(mean_total, 2),
+                           **{key: round(percentile(latencies, q), 2)
+                              for key, q in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99))},
+                           "max": round(max(latencies), 2)},
+            "stages": breakdown
+        }
+
+async def learner(user: int, args: argparse.Namespace, client: httpx.AsyncClient, recorder: Recorder) -> int:
+    """One virtual user working through the funnel args.iterations times; returns funnels completed"""
+    rng = random.Random(args.seed * 7919 + user)
+    completed = 0
+
+    async def think() -> None:
+        if args.think_time > 0:
+            await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+    for _ in range(args.iterations):
+        task = rng.choice(TASKS)
+        language = rng.choice(LANGUAGES)
+
+        scaffold = await recorder.call(client, "generate_scaffolding", {
+            "task_description": task, "difficulty_level": rng.choice(("newbie", "beginner", "intermediate")),
+            "language": language
+        })
+        if scaffold is None:
+            continue
+        await think()
+
+        # A learner's own edit, so runs aren't all served from the execution cache
+        code = f"{scaffold['scaffolding']}\n{'#' if language == 'python' else '//'} attempt {user}-{rng.random()}\n"
+        await recorder.call(client, "run_code", {"code": code, "language": language})
+        await think()
+        await recorder.call(client, "analyze_code", {"code": code, "language": language, "task_description": task})
+        await think()
+
+        quiz = await recorder.call(client, "generate_quiz", {"task_description": task, "language": language})
+        if quiz is None:
+            continue
+        answers = {question["id"]: rng.choice(question["options"]) for question in quiz["questions"]}
+        await think()
+        result = await recorder.call(client, "check_quiz", {"session_id": quiz["session_id"], "answers": answers})
+        if result is None:
+            continue
+
+        learning = await recorder.call(client, "generate_learning", {
+            "task_description": task, "language": language, "wrong_answers": result.get("wrong_answers", [])
+        })
+        completed += learning is not None
+    return completed
+
+def fold_top_functions(path: str, limit: int) -> List[Dict]:
+    """App functions by the share of profile samples whose stack includes them"""
+    if not os.path.exists(path):
+        return []
+    inclusive, total = Counter(), 0
+    with open(path) as folded:
+        for line in folded:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            total += int(count)
+            for name in set(stack.split(";")):
+                if name.startswith("app.") and not name.startswith(TIMING_WRAPPER):
+                    inclusive[name] += int(count)
+    return [{"function": name, "samples": count, "share": round(count / total, 4)}
+            for name, count in inclusive.most_common(limit)]
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_process(command: List[str], env: Dict[str, str], log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                            start_new_session=True)
+
+def stop_process(process: subprocess.Popen) -> None:
+    """SIGTERM lets uvicorn run the app's shutdown, which writes the profiles"""
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(process.pid, signal.SIGKILL)
+        process.wait()
+    except ProcessLookupError:
+        pass
+
+async def wait_until_ready(url: str, path: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get(path)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+def start_stack(args: argparse.Namespace) -> Tuple[List[subprocess.Popen], str]:
+    """Start the Piston stub and the app with the fake LLM and the profiler"""
+    processes = []
+    env = dict(os.environ)
+
+    piston_url = args.piston_url
+    if piston_url is None:
+        port = free_port()
+        processes.append(start_process(
+            [sys.executable, "bench/piston_stub.py", "--port", str(port), "--latency", str(args.piston_latency),
+             "--seed", str(args.seed)],
+            env, os.path.join(args.output_dir, "piston_stub.log")
+        ))
+        piston_url = f"http://127.0.0.1:{port}/api/v2/piston/execute"
+        try:
+            asyncio.run(wait_until_ready(f"http://127.0.0.1:{port}", "/api/v2/piston/runtimes"))
+        except RuntimeError:
+            stop_process(processes[0])
+            raise
+
+    env.update({
+        "LLM_PROVIDER": "fake",
+        "LLM_FAKE_SEED": str(args.seed),
+        "EXECUTOR_BACKEND": "piston",
+        "PISTON_API_URL": piston_url,
+        "QUIZ_BANK_PATH": os.path.join(args.output_dir, "quiz_bank.db"),
+        "PROFILE_PATH": os.path.join(os.path.abspath(args.output_dir), "profile"),
+        "PROFILE_INTERVAL": str(args.profile_interval)
+    })
+    port = free_port()
+    processes.append(start_process(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        env, os.path.join(args.output_dir, "server.log")
+    ))
+    return processes, f"http://127.0.0.1:{port}"
+
+async def run_scenario(args: argparse.Namespace, url: str) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.users * 2, max_keepalive_connections=args.users * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        started = time.perf_counter()
+        completed = await asyncio.gather(*(learner(user, args, client, recorder) for user in range(args.users)))
+        duration = time.perf_counter() - started
+
+    return {
+        "duration_s": round(duration, 3),
+        "funnels": {"attempted": args.users * args.iterations, "completed": sum(completed),
+                    "per_minute": round(sum(completed) / duration * 60, 2)},
+        "endpoints": {endpoint: recorder.endpoint_report(endpoint, duration)
+                      for endpoint in FUNNEL if recorder.latencies.get(endpoint)}
+    }
+
+def print_report(report: Dict) -> None:
+    print(f"\n{'endpoint':<22}{'reqs':>6}{'err':>5}{'p50 ms':>9}{'p95 ms':>9}"
+          + "".join(f"{stage:>11}" for stage in STAGES))
+    for endpoint, stats in report["endpoints"].items():
+        shares = "".join(f"{stats['stages'][stage]['share']:>11.0%}" for stage in STAGES)
+        print(f"{endpoint:<22}{stats['requests']:>6}{stats['errors']:>5}"
+              f"{stats['latency_ms']['p50']:>9.1f}{stats['latency_ms']['p95']:>9.1f}{shares}")
+    for kind in ("wall", "cpu"):
+        top = report.get("profile", {}).get(kind) or []
+        if top:
+            print(f"\nTop app functions ({kind}):")
+            for entry in top[:8]:
+                print(f"  {entry['share']:>6.1%}  {entry['function']}")
+    print(f"\n{report['funnels']['completed']}/{report['funnels']['attempted']} funnels completed "
+          f"in {report['duration_s']}s\n")
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay the learner funnel against the pair programmer")
+    parser.add_argument("--url", help="Run against a running server instead of starting one (no profiles)")
+    parser.add_argument("--piston-url", help="Use this Piston execute URL instead of starting the stub")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--iterations", type=int, default=3, help="Funnels each user works through")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a user's requests")
+    parser.add_argument("--piston-latency", type=float, default=0.3, help="Median seconds per stub execution")
+    parser.add_argument("--profile-interval", type=float, default=0.005, help="Seconds between profile samples")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output-dir", default="scenario-results",
+                        help="Where to write report.json, the folded profiles and server logs")
+    args = parser.parse_args()
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    processes, url = [], args.url
+    if url is None:
+        processes, url = start_stack(args)
+    try:
+        asyncio.run(wait_until_ready(url, "/health"))
+        logger.info(f"Running {args.users} users x {args.iterations} funnels against {url}")
+        report = asyncio.run(run_scenario(args, url))
+    finally:
+        for process in reversed(processes):
+            stop_process(process)
+
+    report["options"] = vars(args)
+    profile_path = os.path.join(args.output_dir, "profile")
+    report["profile"] = {
+        kind: fold_top_functions(f"{profile_path}.{kind}.folded", 20) for kind in ("wall", "cpu")
+    }
+    with open(os.path.join(args.output_dir, "report.json"), "w") as output:
+        json.dump(report, output, indent=2)
+    print_report(report)
+    logger.info(f"Report and profiles written to {args.output_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,16 @@
+# Multi-worker deployment: gunicorn -c gunicorn.conf.py app.main:app
+import multiprocessing
+import os
+
+bind = os.getenv("BIND", "0.0.0.0:8003")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Gemini calls can take a while; give in-flight requests time to finish on shutdown
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Quiz sessions must be visible to whichever worker checks the answers. Set
+# before the workers import the app; an explicit environment setting still wins.
+os.environ.setdefault("QUIZ_STORE", "sqlite")
@@ -0,0 +1,68 @@
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from app.models.task import ProgrammingLanguage
+from app.services.code_executor import LocalBackend, PistonBackend
+from app.services.error_classifier import classify_errors
+
+def run_on_piston(run: dict):
+    """Run code through PistonBackend against a local server that answers with the given run result"""
+    async def execute(request: web.Request) -> web.Response:
+        return web.json_response({"language": "cpp", "version": "stub", "run": {"stdout": "", "stderr": "", **run}})
+
+    async def main():
+        app = web.Application()
+        app.router.add_post("/execute", execute)
+        async with TestServer(app) as server:
+            backend = PistonBackend(api_url=str(server.make_url("/execute")))
+            try:
+                return await backend.run("int main() {}", ProgrammingLanguage.CPP, "", 5)
+            finally:
+                await backend.shutdown()
+
+    return asyncio.run(main())
+
+def test_clean_exit():
+    result = run_on_piston({"stdout": "ok\n", "code": 0, "signal": None})
+    assert (result.exit_code, result.timed_out) == (0, False)
+
+def test_nonzero_exit():
+    result = run_on_piston({"stderr": "boom", "code": 3, "signal": None})
+    assert (result.exit_code, result.timed_out) == (3, False)
+
+@pytest.mark.parametrize("signal_name, exit_code, error_type", [
+    ("SIGSEGV", -11, "Segmentation fault"),
+    ("SIGABRT", -6, "Aborted"),
+    ("SIGFPE", -8, "Floating point exception")
+])
+def test_signal_killed_run_fails(signal_name, exit_code, error_type):
+    result = run_on_piston({"code": None, "signal": signal_name})
+    assert result.exit_code == exit_code
+    assert not result.timed_out
+    assert [record["type"] for record in classify_errors(result.stderr, result.exit_code)] == [error_type]
+
+def test_sigkill_is_a_timeout():
+    result = run_on_piston({"code": None, "signal": "SIGKILL"})
+    assert (result.exit_code, result.timed_out) == (-9, True)
+
+def test_cancelled_local_run_kills_the_program(tmp_path):
+    marker = tmp_path / "alive"
+    code = f"import time\nwhile True:\n    open({str(marker)!r}, 'w').close()\n    time.sleep(0.05)\n"
+
+    async def main():
+        backend = LocalBackend()
+        run = asyncio.ensure_future(backend.run(code, ProgrammingLanguage.PYTHON, "", 30))
+        await asyncio.sleep(0.5)
+        assert marker.exists()
+        run.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await run
+        await asyncio.sleep(0.2)
+        marker.unlink()
+        await asyncio.sleep(0.3)
+        assert not marker.exists()
+
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+import pytest
+
+from app.services.error_classifier import classify_errors, format_errors
+
+PYTHON_TRACEBACK = """Traceback (most recent call last):
+  File "/piston/jobs/1/main.python", line 5, in <module>
+    main()
+  File "/piston/jobs/1/main.python", line 3, in main
+    return int(value)
+ValueError: invalid literal for int() with base 10: 'x'
+"""
+
+PYTHON_LIBRARY_FRAME = """Traceback (most recent call last):
+  File "main.py", line 2, in <module>
+    json.loads("{")
+  File "/usr/lib/python3.11/json/__init__.py", line 346, in loads
+    return _default_decoder.decode(s)
+json.decoder.JSONDecodeError: Expecting property name enclosed in double quotes: line 1 column 2 (char 1)
+"""
+
+PYTHON_BARE_EXCEPTION = """Traceback (most recent call last):
+  File "main.py", line 1, in <module>
+    raise Exception("bad input")
+Exception: bad input
+"""
+
+NODE_PISTON = """/piston/jobs/2/main.javascript:1
+throw new Error('boom')
+^
+
+Error: boom
+    at Object.<anonymous> (/piston/jobs/2/main.javascript:1:7)
+    at Module._compile (node:internal/modules/cjs/loader:1105:14)
+    at node:internal/main/run_main_module:17:47
+"""
+
+NODE_TYPE_ERROR = """/tmp/run/main.js:3
+  user.name.toUpperCase();
+            ^
+
+TypeError: Cannot read properties of undefined (reading 'toUpperCase')
+    at greet (/tmp/run/main.js:3:13)
+    at Object.<anonymous> (/tmp/run/main.js:6:1)
+    at Module._compile (node:internal/modules/cjs/loader:1105:14)
+"""
+
+JAVA_EXCEPTION = """Exception in thread "main" java.lang.ArrayIndexOutOfBoundsException: Index 5 out of bounds for length 3
+\tat Main.get(Main.java:4)
+\tat Main.main(Main.java:8)
+"""
+
+CPP_COMPILE_ERRORS = """main.cpp: In function 'int main()':
+main.cpp:4:5: error: 'cout' was not declared in this scope
+main.cpp:7:1: error: expected ';' before '}' token
+"""
+
+CPP_UNCAUGHT = """terminate called after throwing an instance of 'std::out_of_range'
+  what():  vector::_M_range_check: __n (which is 10) >= this->size() (which is 2)
+Aborted (core dumped)
+"""
+
+def record(error_type, message, line=None, frame=None):
+    return {"type": error_type, "message": message, "line": line, "frame": frame}
+
+CASES = [
+    ("python traceback", PYTHON_TRACEBACK, 1, [
+        record("ValueError", "invalid literal for int() with base 10: 'x'", 3, "/piston/jobs/1/main.python:3 in main")
+    ]),
+    ("python error raised in the standard library", PYTHON_LIBRARY_FRAME, 1, [
+        record("json.decoder.JSONDecodeError",
+               "Expecting property name enclosed in double quotes: line 1 column 2 (char 1)", 2, "main.py:2 in <module>")
+    ]),
+    ("python bare Exception", PYTHON_BARE_EXCEPTION, 1, [
+        record("Exception", "bad input", 1, "main.py:1 in <module>")
+    ]),
+    ("node bare Error on piston", NODE_PISTON, 1, [
+        record("Error", "boom", 1, "/piston/jobs/2/main.javascript:1")
+    ]),
+    ("node TypeError", NODE_TYPE_ERROR, 1, [
+        record("TypeError", "Cannot read properties of undefined (reading 'toUpperCase')", 3, "/tmp/run/main.js:3")
+    ]),
+    ("java uncaught exception", JAVA_EXCEPTION, 1, [
+        record("java.lang.ArrayIndexOutOfBoundsException", "Index 5 out of bounds for length 3", 4,
+               "Main.java:4 in Main.get")
+    ]),
+    ("c++ compile errors", CPP_COMPILE_ERRORS, 1, [
+        record("CompileError", "'cout' was not declared in this scope", 4, "main.cpp:4"),
+        record("CompileError", "expected ';' before '}' token", 7, "main.cpp:7")
+    ]),
+    ("c++ uncaught exception", CPP_UNCAUGHT, 134, [
+        record("std::out_of_range", "vector::_M_range_check: __n (which is 10) >= this->size() (which is 2)"),
+        record("Aborted", "")
+    ]),
+    ("segfault reported only by exit code", "", -11, [
+        record("Segmentation fault", "")
+    ]),
+    ("killed", "Killed\n", 137, [
+        record("Killed", "")
+    ]),
+    ("unrecognized output", "something went wrong\n", 2, [
+        record("NonZeroExit", "something went wrong")
+    ]),
+    ("no output", "", 3, [
+        record("NonZeroExit", "Exited with code 3")
+    ]),
+]
+
+@pytest.mark.parametrize("stderr, exit_code, expected", [case[1:] for case in CASES], ids=[case[0] for case in CASES])
+def test_classify_errors(stderr, exit_code, expected):
+    assert classify_errors(stderr, exit_code) == expected
+
+def test_clean_exit_has_no_records():
+    assert classify_errors("DeprecationWarning: old api\n", 0) == []
+
+def test_timeout_is_reported_first():
+    records = classify_errors("", -1, timed_out=True)
+    assert records == [record("Timeout", "Execution timed out")]
+
+def test_format_errors():
+    assert format_errors(classify_errors(PYTHON_TRACEBACK, 1)) == (
+        "- ValueError (line 3): invalid literal for int() with base 10: 'x'"
+    )
@@ -0,0 +1,144 @@
+import json
+import random
+import string
+import time
+from typing import Any, Dict, List
+
+import pytest
+from pydantic import BaseModel
+
+from app.services.json_extract import JSONExtractionError, extract_json
+
+# Seconds any 100 KB response may take; extraction is linear, so this is generous
+LARGE_RESPONSE_SECONDS = 0.5
+
+FUZZ_SEED = 20240520
+FUZZ_CASES = 300
+
+class Step(BaseModel):
+    title: str
+    code: str
+
+def random_string(rng: random.Random) -> str:
+    # Brackets, quotes and backslashes inside strings must not confuse the scan
+    alphabet = string.ascii_letters + string.digits + ' {}[]"\\:,\n'
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+
+def random_value(rng: random.Random, depth: int = 0) -> Any:
+    kind = rng.choice(["dict", "list", "scalar"] if depth < 4 else ["scalar"])
+    if kind == "dict":
+        return {random_string(rng): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if kind == "list":
+        return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+    return rng.choice([random_string(rng), rng.randint(-1000, 1000), rng.random(), True, False, None])
+
+def random_container(rng: random.Random) -> Any:
+    while True:
+        value = random_value(rng)
+        if isinstance(value, (dict, list)):
+            return value
+
+def random_prose(rng: random.Random) -> str:
+    """Words with stray, unbalanced brackets, never enclosing valid JSON on their own"""
+    words = []
+    for _ in range(rng.randint(0, 15)):
+        word = "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(1, 8)))
+        stray = rng.random()
+        if stray < 0.1:
+            word = rng.choice("{[") + word
+        elif stray < 0.2:
+            word = word + rng.choice("}]")
+        words.append(word)
+    return " ".join(words)
+
+def embed(rng: random.Random, payload: str) -> str:
+    if rng.random() < 0.5:
+        payload = f"```{rng.choice(['json', 'JSON', ''])}\n{payload}\n```"
+    return f"{random_prose(rng)}\n{payload}\n{random_prose(rng)}"
+
+@pytest.mark.parametrize("case", range(FUZZ_CASES))
+def test_fuzz_json_in_prose(case):
+    rng = random.Random(FUZZ_SEED + case)
+    value = random_container(rng)
+    payload = json.dumps(value, indent=rng.choice([None, 2]))
+    assert extract_json(embed(rng, payload)) == value
+
+@pytest.mark.parametrize("case", range(FUZZ_CASES // 3))
+def test_fuzz_schema_rejection_falls_back_to_later_candidates(case):
+    rng = random.Random(FUZZ_SEED - case)
+    decoy = random_container(rng)
+    step = {"title": random_string(rng), "code": random_string(rng)}
+    text = embed(rng, json.dumps(decoy)) + "\n" + embed(rng, json.dumps(step))
+    assert extract_json(text, Step) == Step(**step)
+
+def test_bare_json():
+    assert extract_json('{"a": [1, 2]}') == {"a": [1, 2]}
+
+def test_code_fence_with_prose():
+    assert extract_json('Sure!\n```json\n[{"q": "x"}]\n```\nGood luck') == [{"q": "x"}]
+
+def test_brackets_inside_strings():
+    assert extract_json('Result: {"code": "print(\\"}\\")", "list": "[["} done') == {"code": 'print("}")', "list": "[["}
+
+def test_stray_closer_before_json():
+    assert extract_json('oops] and } then {"ok": true}') == {"ok": True}
+
+def test_unclosed_opener_before_json():
+    assert extract_json('Note { this never closes {"ok": true} more text') == {"ok": True}
+
+def test_json_nested_in_template_braces():
+    assert extract_json('{{"ok": true}}') == {"ok": True}
+
+def test_first_candidate_wins_without_schema():
+    assert extract_json('[1] then {"a": 1}') == [1]
+
+def test_schema_type_validation():
+    assert extract_json('{"a": 1} then [{"b": 2}]', List[Dict[str, Any]]) == [{"b": 2}]
+
+@pytest.mark.parametrize("text", ["", "   ", "no json here", "{not json}", "[unterminated", '"just a string"'])
+def test_no_json(text):
+    with pytest.raises(JSONExtractionError):
+        extract_json(text)
+
+def test_no_candidate_matches_schema():
+    with pytest.raises(JSONExtractionError):
+        extract_json('{"title": "only a title"}', Step)
+
+def large_document() -> Dict:
+    steps = [{"title": f"Step {i} [part {{a}}]", "code": "def f(x):\n    return {'k': [x]}\n" * 3} for i in range(700)]
+    document = {"steps": steps}
+    assert len(json.dumps(document)) >= 100_000
+    return document
+
+def timed_extract(text: str, schema: Any = None) -> Any:
+    start = time.perf_counter()
+    try:
+        return extract_json(text, schema)
+    finally:
+        assert time.perf_counter() - start < LARGE_RESPONSE_SECONDS
+
+def test_large_bare_json():
+    document = large_document()
+    assert timed_extract(json.dumps(document)) == document
+
+def test_large_fenced_json_with_prose():
+    document = large_document()
+    text = "Here is the plan:\n```json\n" + json.dumps(document, indent=2) + "\n```\nLet me know!"
+    assert timed_extract(text) == document
+
+def test_large_json_after_prose_with_stray_brackets():
+    document = large_document()
+    text = "word { [see ] } ] " * 2000 + json.dumps(document)
+    assert timed_extract(text) == document
+
+@pytest.mark.parametrize("text", [
+    "{" * 100_000,
+    "}" * 100_000,
+    "[" * 50_000 + "]" * 50_000,
+    "{" * 50_000 + "}" * 50_000,
+    '{"a": 1, ' * 10_000,
+    "{x} " * 25_000
+], ids=["unbalanced openers", "unbalanced closers", "deep lists", "deep braces", "near json", "many candidates"])
+def test_large_adversarial_input(text):
+    with pytest.raises(JSONExtractionError):
+        timed_extract(text)
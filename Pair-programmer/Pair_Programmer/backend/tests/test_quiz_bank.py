@@ -0,0 +1,24 @@
+import asyncio
+import sqlite3
+
+from app.services.quiz_bank import QuizBank, QuizBankStore
+
+QUESTIONS = [{"id": f"q{index}", "question": f"Question {index}?", "code_snippet": ""} for index in range(1, 11)]
+
+def test_busy_bank_falls_back_to_generating(tmp_path):
+    path = str(tmp_path / "quiz_bank.db")
+    generated = []
+
+    async def generate(task_description, language):
+        generated.append(task_description)
+        return QUESTIONS
+
+    bank = QuizBank(store=QuizBankStore(path), generate=generate)
+    other_worker = sqlite3.connect(path)
+    other_worker.execute("BEGIN IMMEDIATE")
+    try:
+        questions = asyncio.run(bank.get_quiz("Build a to-do app", "python"))
+    finally:
+        other_worker.rollback()
+    assert questions == QUESTIONS
+    assert generated == ["Build a to-do app"]
@@ -0,0 +1,17 @@
+from app.services.quiz_bank import task_fingerprint
+from app.services.single_flight import request_key
+
+NESTED = "Fix this:\nif x:\n    a()\n    b()\n"
+DEDENTED = "Fix this:\nif x:\n    a()\nb()\n"
+
+def test_indentation_changes_the_key():
+    assert request_key("gemini", NESTED) != request_key("gemini", DEDENTED)
+
+def test_surrounding_whitespace_is_ignored():
+    assert request_key("gemini", f"\n  {NESTED}  \n") == request_key("gemini", NESTED)
+
+def test_non_text_parts_are_kept():
+    assert request_key("gemini", {"temperature": 0.2}) != request_key("gemini", {"temperature": 0.7})
+
+def test_task_fingerprint_ignores_case_and_whitespace():
+    assert task_fingerprint("Build a  To-Do\napp") == task_fingerprint("build a to-do app")
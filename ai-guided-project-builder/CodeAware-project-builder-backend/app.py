@@ -1,7 +1,9 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+import asyncio
 from fastapi.middleware.cors import CORSMiddleware
 import logging
 import os
+from contextlib import asynccontextmanager
 from fastapi.responses import PlainTextResponse  
 
 
@@ -17,17 +19,47 @@ os.environ["GOOGLE_API_KEY"] = GOOGLE_API_KEY
 # Import servicesa
 from services.project.project_service import ProjectService
 from services.project.session_service import SessionService
+from services.project.quiz_bank import create_quiz_bank
+from services.project.step_speculator import StepSpeculator
 from services.execution.execution_service import ExecutionService
+from services.algorithm.conversation_service import ConversationService
+from services.llm.llm_client import LLMClient
+from services.llm.response_cache import create_response_cache
+from utils.metrics import EVENT_LOOP_LAG_INTERVAL, REGISTRY, current_endpoint, monitor_event_loop_lag
 
 # Import API routes
 from routes.api import project, execution, algorithm_designer
 
 # Initialize services as singletons
+llm_client = LLMClient(GOOGLE_API_KEY)
+quiz_bank = create_quiz_bank()
+project_service = ProjectService(llm_client, create_response_cache(), quiz_bank)
+step_speculator = StepSpeculator(project_service)
 session_service = SessionService()
 execution_service = ExecutionService()
+conversation_service = ConversationService()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start and stop long-lived service resources with the server"""
+    await session_service.start()
+    await conversation_service.start()
+    await execution_service.start()
+    if quiz_bank is not None:
+        await quiz_bank.start()
+    lag_monitor = asyncio.ensure_future(monitor_event_loop_lag()) if EVENT_LOOP_LAG_INTERVAL > 0 else None
+    yield
+    if lag_monitor is not None:
+        lag_monitor.cancel()
+    await step_speculator.shutdown()
+    if quiz_bank is not None:
+        await quiz_bank.shutdown()
+    await execution_service.shutdown()
+    await conversation_service.shutdown()
+    await session_service.shutdown()
 
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -38,6 +70,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Label LLM metrics with the route that triggered the call
+@app.middleware("http")
+async def track_endpoint(request: Request, call_next):
+    token = current_endpoint.set(request.url.path)
+    try:
+        return await call_next(request)
+    finally:
+        current_endpoint.reset(token)
+
 # Include routers
 app.include_router(project.router, prefix="/api", tags=["project"])
 app.include_router(execution.router, prefix="/api", tags=["execution"])
@@ -47,12 +88,29 @@ app.include_router(algorithm_designer.router, prefix="/api", tags=["algorithm_de
 def get_google_api_key():
     return GOOGLE_API_KEY
 
+def get_llm_client():
+    return llm_client
+
+def get_project_service():
+    return project_service
+
 def get_session_service():
     return session_service
 
+def get_step_speculator():
+    return step_speculator
+
 def get_execution_service():
     return execution_service
 
+def get_conversation_service():
+    return conversation_service
+
+# Prometheus scrape endpoint
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
 # Root endpoint for health check
 @app.get("/")
 async def root():
@@ -65,8 +123,8 @@ async def test_endpoint():
 # Import original endpoints to maintain compatibility during migration
 # These will redirect to the modularized versions
 from routes.api.project import start_project, get_next_step, get_step_questions
-from routes.api.execution import execute_code, render_website, verify_step_completion, ask_question, terminate_streamlit
-from routes.api.algorithm_designer import algorithm_designer_chat
+from routes.api.execution import execute_code, render_website, verify_step_completion, ask_question, ask_question_stream, terminate_streamlit
+from routes.api.algorithm_designer import algorithm_designer_chat, algorithm_designer_stream
 
 # Add aliases to maintain compatibility with existing frontend code
 app.post("/start_project")(start_project)
@@ -76,8 +134,10 @@ app.post("/execute")(execute_code)
 app.post("/render_website")(render_website)
 app.post("/verify_step_completion")(verify_step_completion)
 app.post("/ask_question")(ask_question)
+app.post("/ask_question_stream")(ask_question_stream)
 app.post("/terminate_streamlit")(terminate_streamlit)
 app.post("/algorithm_designer")(algorithm_designer_chat)
+app.post("/algorithm_designer_stream")(algorithm_designer_stream)
 
 
 @app.get("/hello")
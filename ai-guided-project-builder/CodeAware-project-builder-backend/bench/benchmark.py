@@ -0,0 +1,544 @@
+"""
+End-to-end benchmark for the project builder API.
+
+Drives simulated learner journeys (start a project, run code, answer the step
+quiz, ask a question, move to the next step) against the API and reports
+throughput and latency per endpoint, event-loop lag, server RSS and
+child-process counts as JSON.
+
+Run from the backend directory:
+
+    # Start the app with the offline fake LLM and benchmark it
+    python bench/benchmark.py run --journeys 40 --concurrency 8 --output base.json
+
+    # Benchmark a server that is already running (pass its pid for RSS sampling)
+    python bench/benchmark.py run --url http://localhost:8001 --pid 12345 --output candidate.json
+
+    # Compare two runs; exits with status 1 on a regression
+    python bench/benchmark.py compare base.json candidate.json --threshold 0.10
+
+Per-endpoint lag, RSS and child counts are attributed from the samples taken
+while that endpoint had requests in flight.
+"""
+import argparse
+import asyncio
+import json
+import math
+import logging
+import os
+import platform
+import random
+import re
+import signal
+import socket
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+import psutil
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+logger = logging.getLogger("benchmark")
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROJECT_TYPES = ("python+streamlit", "html+css+js")
+PROJECT_IDEAS = ("habit tracker", "expense splitter", "quiz game", "weather dashboard", "recipe box",
+                 "reading list", "pomodoro timer", "flashcards")
+QUESTIONS = ("Why does my code print nothing?", "How do I store the values between runs?",
+             "What does this function return?", "Is there a simpler way to write this loop?")
+
+PYTHON_CODE = "values = [{seed} * i for i in range(200)]\nprint(sum(values), max(values))\n"
+JAVASCRIPT_CODE = "const values = Array.from({{length: 200}}, (_, i) => {seed} * i);\nconsole.log(values.reduce((a, b) => a + b, 0));\n"
+STREAMLIT_CODE = 'import streamlit as st\n\nst.title("Benchmark {seed}")\nst.write({seed})\n'
+
+LAG_METRIC = re.compile(r'^event_loop_lag_seconds_(bucket|sum|count)(?:\{le="([^"]+)"\})? (\S+)$', re.MULTILINE)
+
+# Latency percentiles compared between runs
+LATENCY_KEYS = ("p50", "p95", "p99")
+
+def percentile(values: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of unsorted values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"mean": 0.0, "p50": 0.0, "p95": 0.0, "p99": 0.0, "max": 0.0}
+    return {
+        "mean": round(sum(values) / len(values), 2),
+        "p50": round(percentile(values, 0.50), 2),
+        "p95": round(percentile(values, 0.95), 2),
+        "p99": round(percentile(values, 0.99), 2),
+        "max": round(max(values), 2)
+    }
+
+def parse_lag_histogram(text: str) -> Tuple[Dict[float, float], float, float]:
+    """Cumulative buckets, sum and count of event_loop_lag_seconds from a /metrics scrape"""
+    buckets, total, count = {}, 0.0, 0.0
+    for kind, bound, value in LAG_METRIC.findall(text):
+        if kind == "bucket":
+            buckets[float(bound)] = float(value)
+        elif kind == "sum":
+            total = float(value)
+        else:
+            count = float(value)
+    return buckets, total, count
+
+def bucket_percentile(buckets: Dict[float, float], count: float, fraction: float) -> float:
+    """Upper bound of the bucket holding this percentile of a cumulative histogram"""
+    for bound in sorted(buckets):
+        if buckets[bound] >= fraction * count:
+            return bound
+    return float("inf")
+
+class Recorder:
+    """Request timings, and resource samples tagged with the endpoints in flight when taken"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self.samples: List[Dict] = []
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, payload: Dict) -> Optional[Dict]:
+        self.in_flight[endpoint] += 1
+        started = time.perf_counter()
+        try:
+            response = await client.post(f"/api/{endpoint}", json=payload)
+            ok = response.status_code == 200
+        except httpx.HTTPError as e:
+            logger.debug(f"{endpoint} failed: {str(e)}")
+            response, ok = None, False
+        finally:
+            self.in_flight[endpoint] -= 1
+        self.latencies[endpoint].append((time.perf_counter() - started) * 1000)
+        if not ok:
+            self.errors[endpoint] += 1
+            return None
+        return response.json()
+
+    def busy_endpoints(self) -> List[str]:
+        return [endpoint for endpoint, count in self.in_flight.items() if count > 0]
+
+class ResourceSampler:
+    """Samples server RSS, child processes and event-loop lag on an interval"""
+
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, pid: Optional[int], interval: float):
+        self.client = client
+        self.recorder = recorder
+        self.process = psutil.Process(pid) if pid else None
+        self.interval = interval
+        self.first_lag: Optional[Tuple[Dict[float, float], float, float]] = None
+        self.last_lag: Optional[Tuple[Dict[float, float], float, float]] = None
+
+    def processes(self) -> Tuple[float, int]:
+        """RSS in MB of the server and all its descendants, and how many descendants it has"""
+        if self.process is None:
+            return 0.0, 0
+        try:
+            children = self.process.children(recursive=True)
+            rss = self.process.memory_info().rss
+        except psutil.Error:
+            return 0.0, 0
+        for child in children:
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss / (1024 * 1024), len(children)
+
+    async def lag(self) -> Optional[Tuple[Dict[float, float], float, float]]:
+        try:
+            response = await self.client.get("/metrics")
+        except httpx.HTTPError:
+            return None
+        histogram = parse_lag_histogram(response.text)
+        return histogram if histogram[2] else None
+
+    async def sample(self) -> Dict:
+        rss, children = self.processes()
+        sample = {"t": time.monotonic(), "rss_mb": round(rss, 2), "children": children,
+                  "busy": self.recorder.busy_endpoints(), "lag_ms": None}
+        lag = await self.lag()
+        if lag is not None:
+            if self.last_lag is not None and lag[2] > self.last_lag[2]:
+                sample["lag_ms"] = round((lag[1] - self.last_lag[1]) / (lag[2] - self.last_lag[2]) * 1000, 3)
+            self.first_lag = self.first_lag or lag
+            self.last_lag = lag
+        self.recorder.samples.append(sample)
+        return sample
+
+    async def run(self) -> None:
+        while True:
+            await self.sample()
+            await asyncio.sleep(self.interval)
+
+    def lag_summary(self) -> Dict[str, float]:
+        """Lag over the whole run, from the difference between the first and last scrape"""
+        if self.first_lag is None or self.last_lag is None or self.last_lag[2] <= self.first_lag[2]:
+            return {}
+        first_buckets, first_sum, first_count = self.first_lag
+        last_buckets, last_sum, last_count = self.last_lag
+        count = last_count - first_count
+        buckets = {bound: value - first_buckets.get(bound, 0.0) for bound, value in last_buckets.items()}
+        return {
+            "samples": int(count),
+            "mean": round((last_sum - first_sum) / count * 1000, 3),
+            "p50": bucket_percentile(buckets, count, 0.50) * 1000,
+            "p99": bucket_percentile(buckets, count, 0.99) * 1000
+        }
+
+class Journey:
+    """One learner working through a project"""
+
+    def __init__(self, index: int, args: argparse.Namespace, recorder: Recorder):
+        self.index = index
+        self.args = args
+        self.recorder = recorder
+        self.rng = random.Random(args.seed + index)
+        self.project_type = PROJECT_TYPES[index % len(PROJECT_TYPES)]
+        self.project_idea = PROJECT_IDEAS[self.rng.randrange(len(PROJECT_IDEAS))]
+
+    async def think(self) -> None:
+        if self.args.think_time > 0:
+            await asyncio.sleep(self.rng.uniform(0, 2 * self.args.think_time))
+
+    async def execute(self, client: httpx.AsyncClient, session_id: str, step: int) -> List[str]:
+        """Run the learner's code a few times; returns the Streamlit executions to stop"""
+        runs = [("python", PYTHON_CODE), ("javascript", JAVASCRIPT_CODE)]
+        if self.project_type == "python+streamlit":
+            runs.append(("python", STREAMLIT_CODE))
+
+        streamlit_ids = []
+        for attempt in range(self.args.executions_per_step):
+            language, template = runs[attempt % len(runs)]
+            # Distinct code per learner and step, so the execution cache only absorbs true repeats
+            code = template.format(seed=self.index * 1000 + step)
+            execution_id = str(uuid.uuid4())
+            result = await self.recorder.call(client, "execute", {
+                "code": code, "language": language, "session_id": session_id,
+                "execution_id": execution_id, "cache": not self.args.no_cache
+            })
+            if result and result.get("is_streamlit"):
+                streamlit_ids.append(execution_id)
+            await self.think()
+        return streamlit_ids
+
+    async def run(self, client: httpx.AsyncClient) -> bool:
+        project = await self.recorder.call(client, "start_project", {
+            "project_type": self.project_type,
+            "expertise_level": self.rng.choice(("beginner", "intermediate", "expert")),
+            "project_idea": self.project_idea,
+            "use_cache": not self.args.no_cache
+        })
+        if project is None:
+            return False
+        session_id = project["session_id"]
+        code = ""
+        try:
+            steps = json.loads(project["response"]).get("steps") or []
+            code = (steps[0].get("code") or "") if steps else ""
+        except (ValueError, AttributeError):
+            pass
+
+        streamlit_ids = []
+        for step in range(self.args.steps):
+            await self.think()
+            streamlit_ids.extend(await self.execute(client, session_id, step))
+
+            quiz = await self.recorder.call(client, "get_step_questions", {
+                "session_id": session_id, "step_number": step, "use_cache": not self.args.no_cache
+            })
+            questions = (quiz or {}).get("questions") or []
+            await self.recorder.call(client, "verify_step_completion", {
+                "session_id": session_id,
+                "step_number": step,
+                "user_answers": [{
+                    "question_id": question.get("question_id"),
+                    "answer": self.rng.choice(question.get("options") or [""]),
+                    "correct_answer": question.get("correct_answer")
+                } for question in questions]
+            })
+
+            await self.think()
+            await self.recorder.call(client, "ask_question", {
+                "question": self.rng.choice(QUESTIONS), "code": code or PYTHON_CODE.format(seed=step),
+                "project_type": self.project_type, "session_id": session_id
+            })
+
+            await self.think()
+            next_step = await self.recorder.call(client, "next_step", {
+                "project_type": self.project_type,
+                "expertise_level": "beginner",
+                "project_idea": self.project_idea,
+                "current_step": step,
+                "user_code": code or PYTHON_CODE.format(seed=step),
+                "session_id": session_id,
+                "use_cache": not self.args.no_cache
+            })
+            if next_step is None:
+                return False
+            try:
+                step_data = json.loads(next_step["response"])
+            except ValueError:
+                return False
+            if step_data.get("project_completed"):
+                break
+            code = step_data.get("code") or code
+
+        for execution_id in streamlit_ids:
+            await self.recorder.call(client, "terminate_streamlit", {"execution_id": execution_id})
+        return True
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(args: argparse.Namespace) -> Tuple[subprocess.Popen, str]:
+    """Start the app with uvicorn (or gunicorn with --workers) and the offline fake LLM"""
+    port = free_port()
+    env = dict(os.environ)
+    env.setdefault("LLM_PROVIDER", "fake")
+    env.setdefault("LLM_FAKE_SEED", str(args.seed))
+    if args.workers > 1:
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+        env["BIND"] = f"127.0.0.1:{port}"
+        env["WEB_CONCURRENCY"] = str(args.workers)
+    else:
+        command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--log-level", "warning"]
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    server = subprocess.Popen(command, cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+                              start_new_session=True)
+    return server, f"http://127.0.0.1:{port}"
+
+def stop_server(server: subprocess.Popen) -> None:
+    try:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.wait()
+    except ProcessLookupError:
+        pass
+
+async def wait_until_ready(url: str, timeout: float = 60.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/hello")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.25)
+    raise RuntimeError(f"Server at {url} did not become ready within {timeout:.0f}s")
+
+def endpoint_resources(samples: List[Dict], endpoint: str) -> Dict:
+    during = [sample for sample in samples if endpoint in sample["busy"]]
+    lags = [sample["lag_ms"] for sample in during if sample["lag_ms"] is not None]
+    return {
+        "samples": len(during),
+        "event_loop_lag_ms": {"mean": round(sum(lags) / len(lags), 3) if lags else None,
+                              "max": max(lags) if lags else None},
+        "rss_mb": {"mean": round(sum(s["rss_mb"] for s in during) / len(during), 2) if during else None,
+                   "max": max((s["rss_mb"] for s in during), default=None)},
+        "children_max": max((s["children"] for s in during), default=None)
+    }
+
+async def run_benchmark(args: argparse.Namespace, url: str, pid: Optional[int]) -> Dict:
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=url, timeout=args.timeout, limits=limits) as client:
+        # Scrape /metrics on its own connection so it isn't queued behind journey requests
+        async with httpx.AsyncClient(base_url=url, timeout=10) as metrics_client:
+            sampler = ResourceSampler(metrics_client, recorder, pid, args.sample_interval)
+            baseline = await sampler.sample()
+            sampling = asyncio.ensure_future(sampler.run())
+
+            pending = iter(range(args.journeys))
+            completed, failed = 0, 0
+
+            async def learner() -> None:
+                nonlocal completed, failed
+                for index in pending:
+                    try:
+                        ok = await Journey(index, args, recorder).run(client)
+                    except Exception as e:
+                        logger.warning(f"Journey {index} crashed: {str(e)}")
+                        ok = False
+                    completed += ok
+                    failed += not ok
+
+            started = time.perf_counter()
+            await asyncio.gather(*(learner() for _ in range(args.concurrency)))
+            duration = time.perf_counter() - started
+
+            sampling.cancel()
+            await asyncio.gather(sampling, return_exceptions=True)
+            final = await sampler.sample()
+
+    samples = recorder.samples
+    endpoints = {}
+    for endpoint, latencies in sorted(recorder.latencies.items()):
+        endpoints[endpoint] = {
+            "requests": len(latencies),
+            "errors": recorder.errors[endpoint],
+            "error_rate": round(recorder.errors[endpoint] / len(latencies), 4),
+            "throughput_rps": round(len(latencies) / duration, 3),
+            "latency_ms": summarize(latencies),
+            **endpoint_resources(samples, endpoint)
+        }
+
+    total_requests = sum(len(latencies) for latencies in recorder.latencies.values())
+    return {
+        "meta": {
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "url": url,
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "options": {key: value for key, value in vars(args).items() if key not in ("func", "output")}
+        },
+        "duration_s": round(duration, 3),
+        "journeys": {"completed": completed, "failed": failed,
+                     "per_minute": round(completed / duration * 60, 2)},
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / duration, 3),
+        "endpoints": endpoints,
+        "server": {
+            "rss_mb": {"start": baseline["rss_mb"], "end": final["rss_mb"],
+                       "peak": max(sample["rss_mb"] for sample in samples),
+                       "growth": round(final["rss_mb"] - baseline["rss_mb"], 2)},
+            "children": {"start": baseline["children"], "end": final["children"],
+                         "max": max(sample["children"] for sample in samples)},
+            "event_loop_lag_ms": sampler.lag_summary()
+        },
+        "timeline": [{**sample, "t": round(sample["t"] - baseline["t"], 2)} for sample in samples]
+    }
+
+def run_command(args: argparse.Namespace) -> int:
+    server = None
+    url, pid = args.url, args.pid
+    if url is None:
+        server, url = start_server(args)
+        pid = server.pid
+    try:
+        asyncio.run(wait_until_ready(url))
+        logger.info(f"Running {args.journeys} journeys against {url} with concurrency {args.concurrency}")
+        report = asyncio.run(run_benchmark(args, url, pid))
+    finally:
+        if server is not None:
+            stop_server(server)
+
+    with open(args.output, "w") as output:
+        json.dump(report, output, indent=2)
+    print_report(report)
+    logger.info(f"Report written to {args.output}")
+    return 0
+
+def print_report(report: Dict) -> None:
+    print(f"\n{'endpoint':<24}{'reqs':>7}{'err':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, stats in report["endpoints"].items():
+        latency = stats["latency_ms"]
+        print(f"{endpoint:<24}{stats['requests']:>7}{stats['errors']:>6}{stats['throughput_rps']:>9.2f}"
+              f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}")
+    server = report["server"]
+    print(f"\njourneys {report['journeys']['completed']} ok / {report['journeys']['failed']} failed "
+          f"in {report['duration_s']}s; RSS {server['rss_mb']['start']} -> {server['rss_mb']['end']} MB "
+          f"(peak {server['rss_mb']['peak']}); children max {server['children']['max']}; "
+          f"loop lag {server['event_loop_lag_ms'] or 'n/a'}\n")
+
+def compare_reports(base: Dict, candidate: Dict, threshold: float, min_delta_ms: float) -> List[Dict]:
+    """Every compared metric, flagged when the candidate is worse than base by more than threshold"""
+    rows = []
+
+    def check(name: str, before: Optional[float], after: Optional[float], higher_is_worse: bool = True,
+              floor: float = 0.0) -> None:
+        if before is None or after is None:
+            return
+        delta = after - before
+        change = delta / before if before else (0.0 if not delta else float("inf"))
+        worse = delta > floor if higher_is_worse else -delta > floor
+        regressed = worse and (change if higher_is_worse else -change) > threshold
+        rows.append({"metric": name, "base": before, "candidate": after,
+                     "change": round(change, 4), "regression": regressed})
+
+    for endpoint, stats in base["endpoints"].items():
+        other = candidate["endpoints"].get(endpoint)
+        if other is None:
+            continue
+        for key in LATENCY_KEYS:
+            check(f"{endpoint} {key} ms", stats["latency_ms"][key], other["latency_ms"][key], floor=min_delta_ms)
+        check(f"{endpoint} rps", stats["throughput_rps"], other["throughput_rps"], higher_is_worse=False)
+        check(f"{endpoint} error rate", stats["error_rate"], other["error_rate"], floor=0.005)
+
+    check("journeys per minute", base["journeys"]["per_minute"], candidate["journeys"]["per_minute"],
+          higher_is_worse=False)
+    check("RSS growth MB", base["server"]["rss_mb"]["growth"], candidate["server"]["rss_mb"]["growth"], floor=5.0)
+    check("peak children", base["server"]["children"]["max"], candidate["server"]["children"]["max"], floor=1)
+    base_lag, candidate_lag = base["server"]["event_loop_lag_ms"], candidate["server"]["event_loop_lag_ms"]
+    if base_lag and candidate_lag:
+        check("event loop lag mean ms", base_lag["mean"], candidate_lag["mean"], floor=min_delta_ms / 5)
+        check("event loop lag p99 ms", base_lag["p99"], candidate_lag["p99"], floor=min_delta_ms / 5)
+    return rows
+
+def compare_command(args: argparse.Namespace) -> int:
+    with open(args.base) as base_file, open(args.candidate) as candidate_file:
+        base, candidate = json.load(base_file), json.load(candidate_file)
+    rows = compare_reports(base, candidate, args.threshold, args.min_delta_ms)
+
+    print(f"\n{'metric':<40}{'base':>12}{'candidate':>12}{'change':>10}")
+    for row in rows:
+        marker = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<40}{row['base']:>12}{row['candidate']:>12}{row['change']:>+10.1%}{marker}")
+    regressions = [row for row in rows if row["regression"]]
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}\n")
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump({"threshold": args.threshold, "rows": rows}, output, indent=2)
+    return 1 if regressions else 0
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the project builder API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Run learner journeys and write a JSON report")
+    run.add_argument("--url", help="Benchmark a running server instead of starting one with the fake LLM")
+    run.add_argument("--pid", type=int, help="Server pid to sample RSS and child processes from, with --url")
+    run.add_argument("--workers", type=int, default=1, help="Start the server under gunicorn with this many workers")
+    run.add_argument("--journeys", type=int, default=20, help="Learner journeys to run in total")
+    run.add_argument("--concurrency", type=int, default=4, help="Learners active at once")
+    run.add_argument("--steps", type=int, default=3, help="Project steps each learner works through")
+    run.add_argument("--executions-per-step", type=int, default=3, help="Code runs per step")
+    run.add_argument("--think-time", type=float, default=0.0, help="Mean pause between a learner's requests")
+    run.add_argument("--no-cache", action="store_true", help="Bypass the LLM response and execution caches")
+    run.add_argument("--seed", type=int, default=1, help="Seed for the journeys and the fake LLM")
+    run.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    run.add_argument("--sample-interval", type=float, default=0.5, help="Seconds between resource samples")
+    run.add_argument("--server-log", help="Write the started server's output to this file")
+    run.add_argument("--output", default="benchmark.json", help="Where to write the report")
+    run.set_defaults(func=run_command)
+
+    compare = commands.add_parser("compare", help="Compare two reports and flag regressions")
+    compare.add_argument("base")
+    compare.add_argument("candidate")
+    compare.add_argument("--threshold", type=float, default=0.10, help="Relative change that counts as a regression")
+    compare.add_argument("--min-delta-ms", type=float, default=5.0, help="Ignore latency changes smaller than this")
+    compare.add_argument("--output", help="Also write the comparison as JSON")
+    compare.set_defaults(func=compare_command)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,31 @@
+# Multi-worker deployment: gunicorn -c gunicorn.conf.py app:app
+import multiprocessing
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+bind = os.getenv("BIND", "0.0.0.0:8001")
+workers = int(os.getenv("WEB_CONCURRENCY", str(multiprocessing.cpu_count())))
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# LLM calls can take a while; give in-flight requests time to finish on shutdown
+timeout = int(os.getenv("WORKER_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Workers share state through SQLite rather than their own memory. Set before
+# the workers import the app; an explicit environment setting still wins.
+os.environ.setdefault("SESSION_STORE", "sqlite")
+os.environ.setdefault("RESPONSE_CACHE_BACKEND", "sqlite")
+os.environ.setdefault("PROCESS_REGISTRY", "sqlite")
+
+def child_exit(server, worker):
+    """Stop the processes of a worker that died without shutting them down itself"""
+    from services.execution.process_registry import create_process_registry, stop_entry
+
+    registry = create_process_registry()
+    for entry in registry.owned_by(worker.pid):
+        server.log.info(f"Stopping {entry['kind']} {entry['execution_id']} left by worker {worker.pid}")
+        stop_entry(entry)
+        registry.remove(entry["execution_id"])
@@ -0,0 +1,110 @@
+import json
+import logging
+from typing import Dict, Optional
+
+from pydantic import ValidationError
+
+from models.schemas import ProjectData, ProjectStep, QuizQuestion
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def _normalize_step(step_data: Dict, step_number: int) -> Dict:
+    """Fill in fields the model sometimes leaves out and drop malformed quiz questions"""
+    step_data = dict(step_data)
+    step_data.setdefault("step_number", step_number)
+    if step_data.get("code") is None:
+        step_data["code"] = ""
+
+    questions = []
+    for question in step_data.get("quiz_questions") or []:
+        if isinstance(question, dict) and "question_id" in question:
+            question = {**question, "question_id": str(question["question_id"])}
+        try:
+            questions.append(QuizQuestion.model_validate(question))
+        except ValidationError:
+            logger.warning(f"Dropping malformed quiz question in step {step_number}: {question}")
+    if "quiz_questions" in step_data:
+        step_data["quiz_questions"] = questions
+    return step_data
+
+class ProjectDocument:
+    """A project plan parsed once, with O(1) step lookup and cached JSON for responses"""
+
+    def __init__(self, data: ProjectData, generated_steps: Optional[Dict[int, ProjectStep]] = None):
+        self.data = data
+
+        # Steps keyed by the session's step index: the plan's own steps first,
+        # replaced by the detailed steps generated as the learner moves on
+        self._steps = dict(enumerate(data.steps))
+        self._generated = dict(generated_steps or {})
+        self._steps.update(self._generated)
+
+        # Serialized forms, built on first use
+        self._json = None
+        self._step_json = {}
+
+    @classmethod
+    def from_dict(cls, project_data: Dict) -> "ProjectDocument":
+        """Validate a plan returned by the model"""
+        project_data = dict(project_data)
+        project_data["steps"] = [
+            _normalize_step(step, index + 1) for index, step in enumerate(project_data.get("steps") or [])
+        ]
+        return cls(ProjectData.model_validate(project_data))
+
+    @property
+    def total_steps(self) -> int:
+        return self.data.total_steps
+
+    def step(self, index: int) -> Optional[ProjectStep]:
+        """Return the step shown at this session step index"""
+        return self._steps.get(index)
+
+    def step_dict(self, index: int) -> Optional[Dict]:
+        step = self._steps.get(index)
+        return step.model_dump(exclude_unset=True) if step is not None else None
+
+    def set_step(self, index: int, step_data: Dict) -> ProjectStep:
+        """Validate and store a newly generated step"""
+        step = ProjectStep.model_validate(_normalize_step(step_data, index))
+        self._steps[index] = step
+        self._generated[index] = step
+        self._step_json.pop(index, None)
+        return step
+
+    def to_json(self) -> str:
+        """The plan as returned to the frontend"""
+        if self._json is None:
+            self._json = json.dumps(self.data.model_dump(exclude_unset=True))
+        return self._json
+
+    def step_json(self, index: int) -> Optional[str]:
+        """A single step as returned to the frontend"""
+        if index not in self._step_json:
+            step = self._steps.get(index)
+            if step is None:
+                return None
+            self._step_json[index] = json.dumps(step.model_dump(exclude_unset=True))
+        return self._step_json[index]
+
+    def to_storage(self) -> str:
+        """Serialize the plan and generated steps for a persistent session store"""
+        return json.dumps({
+            "project": self.data.model_dump(exclude_unset=True),
+            "generated_steps": {
+                str(index): step.model_dump(exclude_unset=True) for index, step in self._generated.items()
+            }
+        })
+
+    @classmethod
+    def from_storage(cls, value: str) -> "ProjectDocument":
+        stored = json.loads(value)
+        generated = {
+            int(index): ProjectStep.model_validate(step) for index, step in stored["generated_steps"].items()
+        }
+        return cls(ProjectData.model_validate(stored["project"]), generated)
+
+    def size_bytes(self) -> int:
+        """Approximate serialized size, used for session memory accounting"""
+        return len(self.to_json()) + sum(len(self.step_json(index)) for index in self._generated)
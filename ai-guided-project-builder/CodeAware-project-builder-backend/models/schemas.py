@@ -1,16 +1,19 @@
-from pydantic import BaseModel, ValidationError
+from pydantic import BaseModel, ConfigDict, ValidationError
 from typing import Optional, List, Dict, Any
 
 class CodeRequest(BaseModel):
     code: str
     language: str
     session_id: Optional[str] = None
+    execution_id: Optional[str] = None  # Lets the client cancel the run later
+    cache: bool = True  # False for code whose output changes between runs
 
 class ProjectRequest(BaseModel):
     project_type: str  # "python+streamlit" or "html+css+js"
     expertise_level: str  # "beginner", "intermediate", "expert"
     project_idea: Optional[str] = None
     current_step: Optional[int] = 0
+    use_cache: Optional[bool] = True  # Set to False to force a freshly generated plan
 
 class StepRequest(BaseModel):
     project_type: str
@@ -21,6 +24,7 @@ class StepRequest(BaseModel):
     user_question: Optional[str] = None
     session_id: str
     user_understanding: Optional[str] = None
+    use_cache: Optional[bool] = True
 
 class QuestionRequest(BaseModel):
     question: str
@@ -41,16 +45,21 @@ class QuizQuestion(BaseModel):
     correct_answer: str
 
 class ProjectStep(BaseModel):
-    step_number: int
+    # Keep any extra keys the model returns so they round-trip to the frontend
+    model_config = ConfigDict(extra="allow")
+
+    step_number: int = 0
     title: str
     description: str
-    language: str
+    language: str = ""
     code: str = ""
     expected_outcome: str
     quiz_questions: Optional[List[QuizQuestion]] = []
     feedback: Optional[str] = None
 
 class ProjectData(BaseModel):
+    model_config = ConfigDict(extra="allow")
+
     project_title: str
     project_description: str
     total_steps: int
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Body
+from fastapi.responses import StreamingResponse
 import logging
 import traceback
 import os
-from typing import Dict, List, Optional
-import google.generativeai as genai
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.streaming import SSE_HEADERS, TaggedStreamParser, sse_event
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -73,10 +75,224 @@ EXTREMELY CRITICAL INSTRUCTIONS - FOLLOW THESE EXACTLY:
 Start by introducing yourself briefly, then immediately ask your FIRST QUESTION about what the user wants to build. Remember to include the required progress and evaluation tags.
 """
 
-def get_api_key():
-    """Get the Google API key from environment or app config"""
-    from app import get_google_api_key
-    return get_google_api_key()
+# Canned reply for the frontend's connectivity check
+TEST_RESPONSE = "<progress>15%</progress>\n<evaluation>This is a test response</evaluation>\nThis is a test response from the Algorithm Designer. I'm working properly!"
+
+# Prepended to the final algorithm
+FINAL_RESPONSE_PREFIX = "<progress>100%</progress>\n<evaluation>Final algorithm complete!</evaluation>\n\n"
+
+# Generation settings for the (long) final algorithm
+FINAL_GENERATION_CONFIG = {"temperature": 0.7, "top_p": 0.9, "max_output_tokens": 4000}
+
+# ACCELERATED PROGRESS: minimum progress by number of exchanges, so the design
+# reaches 90% after 7-8 exchanges
+MIN_PROGRESS_BY_EXCHANGE = {
+    0: 0,  # Initial state
+    1: 15, # First exchange (user's initial description)
+    2: 30, # Second exchange
+    3: 45, # Third exchange
+    4: 60, # Fourth exchange
+    5: 70, # Fifth exchange
+    6: 80, # Sixth exchange
+    7: 90, # Seventh exchange - ready for final algorithm
+    8: 95, # Eighth exchange - definitely ready for final
+}
+
+def get_llm_client():
+    """Get the shared Gemini client from the app"""
+    from app import get_llm_client
+    return get_llm_client()
+
+def get_conversation_service():
+    """Get the conversation store from the app"""
+    from app import get_conversation_service
+    return get_conversation_service()
+
+def extract_progress(text: str) -> Optional[int]:
+    """Read the percentage from a <progress>X%</progress> tag, if there is one"""
+    progress_tag = "<progress>"
+    if progress_tag not in text:
+        return None
+    try:
+        start_idx = text.find(progress_tag) + len(progress_tag)
+        end_idx = text.find("%</progress>")
+        if end_idx > start_idx:
+            return int(text[start_idx:end_idx])
+    except ValueError:
+        pass
+    return None
+
+def format_history(conversation_history: List[Dict]) -> List[Dict]:
+    """Convert the frontend's conversation history into Gemini chat history"""
+    formatted_history = []
+    for msg in conversation_history:
+        role = "user" if msg['role'] == 'user' else "model"
+        formatted_history.append({"role": role, "parts": [msg['content']]})
+    return formatted_history
+
+def history_progress(conversation_history: List[Dict]) -> int:
+    """Recover the latest progress from a client-held conversation history"""
+    current_progress = 0
+    for msg in conversation_history:
+        if msg['role'] == 'assistant':
+            progress = extract_progress(msg['content'])
+            if progress is not None:
+                current_progress = progress
+    return current_progress
+
+def plan_turn(message: str, current_progress: int, exchange_count: int, request_final: bool) -> Dict:
+    """Work out the progress floor for this exchange and whether to produce the final algorithm"""
+    # Get the minimum progress for the current exchange count
+    min_expected_progress = MIN_PROGRESS_BY_EXCHANGE.get(exchange_count, 95)  # Default to 95% for higher counts
+    
+    # If actual progress is less than expected minimum, boost it
+    if current_progress < min_expected_progress:
+        current_progress = min_expected_progress
+        logger.debug(f"Boosting progress to {current_progress}% based on exchange count {exchange_count}")
+    
+    # Check if user is explicitly requesting final algorithm
+    requesting_final = False
+    final_keywords = ["final", "complete", "finish", "flowchart", "algorithm", "workflow", "done"]
+    
+    # AUTOMATICALLY TRIGGER FINAL after 7+ exchanges or if explicitly requested
+    if request_final or exchange_count >= 7 or (current_progress >= 85 and any(keyword in message.lower() for keyword in final_keywords)):
+        requesting_final = True
+        # Ensure progress is sufficient for final algorithm
+        if current_progress < 90:
+            current_progress = 90
+    
+    return {
+        "message": message,
+        "exchange_count": exchange_count,
+        "current_progress": current_progress,
+        "min_expected_progress": min_expected_progress,
+        "final": requesting_final and current_progress >= 90
+    }
+
+def prepare_turn(request: Dict) -> Dict:
+    """
+    Plan this exchange and gather the chat history to send.
+    
+    Requests without a conversation_id carry the whole conversation_history,
+    as before. Requests with one only carry the new message; history and
+    progress come from the server-held conversation, which is created (and
+    seeded from any conversation_history sent) when the id is empty or has
+    expired.
+    """
+    message = request.get('message', '')
+    request_final = request.get('request_final', False)
+    
+    if "conversation_id" not in request:
+        conversation_history = request.get('conversation_history', [])
+        turn = plan_turn(message, history_progress(conversation_history),
+                         request.get('exchange_count', 0), request_final)
+        turn.update(history=format_history(conversation_history), conversation_id=None)
+        return turn
+    
+    conversation_service = get_conversation_service()
+    conversation_id = request.get('conversation_id')
+    conversation = conversation_service.get_conversation(conversation_id) if conversation_id else None
+    if conversation is None:
+        seed_history = request.get('conversation_history') or []
+        conversation_id = conversation_service.create_conversation(
+            request.get('project_description', ''),
+            seed_history,
+            progress=history_progress(seed_history),
+            exchange_count=sum(1 for msg in seed_history if msg['role'] == 'user')
+        )
+        conversation = conversation_service.get_conversation(conversation_id)
+    
+    exchange_count = request.get('exchange_count') or conversation["exchange_count"] + 1
+    turn = plan_turn(message, conversation["progress"], exchange_count, request_final)
+    turn.update(
+        history=conversation_service.chat_history(conversation),
+        conversation_id=conversation_id,
+        conversation=conversation
+    )
+    return turn
+
+def finish_turn(turn: Dict, response_text: str, progress: int) -> Dict:
+    """Save the exchange to a server-held conversation; returns fields to add to the response"""
+    if turn["conversation_id"] is None:
+        return {}
+    get_conversation_service().record_turn(
+        turn["conversation_id"], turn["conversation"], turn["message"], response_text,
+        progress, turn["exchange_count"]
+    )
+    return {"conversation_id": turn["conversation_id"]}
+
+def final_algorithm_call(turn: Dict) -> Tuple[List[Dict], str, Dict]:
+    """Build the (history, message, options) chat call that asks for the complete algorithm"""
+    # Add special instruction for final algorithm generation
+    special_instruction = """
+    Please generate the complete algorithmic workflow now.
+    
+    1. Create a well-structured, numbered list showing all steps of the algorithm
+    2. Include clear headings for different sections
+    3. Format using proper markdown for clarity
+    4. Add the exact text "WORKFLOW_COMPLETE" at the very end
+    
+    DO NOT ask any more questions - this is the final output.
+    """
+    
+    # Our special instruction is sent as the message, not kept in the history
+    message = f"{turn['message']}\n\n{special_instruction}\nPlease provide the complete final algorithm now."
+    options = {"model_name": "gemini-1.5-flash", "generation_config": FINAL_GENERATION_CONFIG,
+               "template": "algorithm_final"}
+    if turn["conversation_id"] is not None:
+        options["system_instruction"] = ALGORITHM_DESIGN_PROMPT
+    return turn["history"], message, options
+
+def conversation_call(turn: Dict) -> Tuple[List[Dict], str, Dict]:
+    """Build the (history, message, options) chat call for the next design question"""
+    exchange_count = turn["exchange_count"]
+    current_progress = turn["current_progress"]
+    min_expected_progress = turn["min_expected_progress"]
+    
+    # ACCELERATED PROGRESS INSTRUCTION: Tell the AI to move faster through the process
+    progress_instruction = f"""
+    IMPORTANT: Please accelerate the algorithm design process.
+    
+    Current exchange: {exchange_count}
+    Current progress: {current_progress}%
+    Target progress: {min_expected_progress}%
+    
+    Please:
+    1. Ask a focused question that moves the design forward significantly
+    2. Set the progress to at least {min_expected_progress}%
+    3. If this is exchange 6+, prepare to move toward the final algorithm
+    4. Keep your response concise and focused
+    
+    We need to reach 90%+ progress within 7-8 exchanges total.
+    """
+    
+    if turn["conversation_id"] is not None:
+        # Server-held conversations carry the design prompt as the system
+        # instruction and send the user's message along with our instruction
+        logger.debug(f"Sending to Gemini API with history length: {len(turn['history'])}")
+        message = f"{turn['message']}\n\n{progress_instruction}"
+        return turn["history"], message, {
+            "model_name": "gemini-1.5-flash",
+            "system_instruction": ALGORITHM_DESIGN_PROMPT,
+            "template": "algorithm_conversation"
+        }
+    
+    # Format the conversation history for Gemini
+    formatted_history = turn["history"]
+        
+    # Add the system prompt if this is a new conversation
+    if len(formatted_history) <= 1:  # Only assistant welcome message
+        formatted_history = [{
+            "role": "model",
+            "parts": [ALGORITHM_DESIGN_PROMPT]
+        }] + formatted_history
+    
+    logger.debug(f"Sending to Gemini API with history length: {len(formatted_history) + 2}")
+    
+    # The user's message and our acceleration instruction are left out of the
+    # history; the instruction is sent as the message
+    return formatted_history, progress_instruction, {"model_name": "gemini-1.5-flash",
+                                                     "template": "algorithm_conversation"}
 
 @router.post("/algorithm_designer")
 async def algorithm_designer_chat(request: Dict = Body(...)):
@@ -93,207 +309,67 @@ async def algorithm_designer_chat(request: Dict = Body(...)):
     - request_final: Boolean indicating if user is requesting the final flowchart
     - boost_progress: Boolean indicating if progress should be boosted due to stalling
     - exchange_count: Integer indicating the number of exchanges so far
+    - conversation_id: Optional; when present the server keeps the conversation
+      and conversation_history can be left out (see prepare_turn)
     """
     
     try:
         # Log the incoming request for debugging
         logger.debug(f"Received algorithm designer request")
         
-        message = request.get('message', '')
-        conversation_history = request.get('conversation_history', [])
-        project_description = request.get('project_description', '')
-        request_final = request.get('request_final', False)
-        boost_progress = request.get('boost_progress', False)
-        exchange_count = request.get('exchange_count', 0)
-        
-        # Get API key
-        api_key = get_api_key()
-        
-        # Initialize Gemini
-        genai.configure(api_key=api_key)
-        
         # For simple test requests
-        if message == 'test':
+        if request.get('message', '') == 'test':
             return {
-                "response": "<progress>15%</progress>\n<evaluation>This is a test response</evaluation>\nThis is a test response from the Algorithm Designer. I'm working properly!",
+                "response": TEST_RESPONSE,
                 "progress": 15
             }
-            
-        # Extract current progress from conversation history if available
-        current_progress = 0
-        for msg in conversation_history:
-            if msg['role'] == 'assistant':
-                progress_tag = "<progress>"
-                if progress_tag in msg['content']:
-                    try:
-                        start_idx = msg['content'].find(progress_tag) + len(progress_tag)
-                        end_idx = msg['content'].find("%</progress>")
-                        if end_idx > start_idx:
-                            current_progress = int(msg['content'][start_idx:end_idx])
-                    except:
-                        pass
-        
-        # ACCELERATED PROGRESS: Increase progress based on exchange count to complete in 7-8 exchanges
-        # Calculate minimum progress based on number of exchanges (should reach 90% after 7-8 exchanges)
-        min_progress_by_exchange = {
-            0: 0,  # Initial state
-            1: 15, # First exchange (user's initial description)
-            2: 30, # Second exchange
-            3: 45, # Third exchange
-            4: 60, # Fourth exchange
-            5: 70, # Fifth exchange
-            6: 80, # Sixth exchange
-            7: 90, # Seventh exchange - ready for final algorithm
-            8: 95, # Eighth exchange - definitely ready for final
-        }
-        
-        # Get the minimum progress for the current exchange count
-        min_expected_progress = min_progress_by_exchange.get(exchange_count, 95)  # Default to 95% for higher counts
-        
-        # If actual progress is less than expected minimum, boost it
-        if current_progress < min_expected_progress:
-            current_progress = min_expected_progress
-            logger.debug(f"Boosting progress to {current_progress}% based on exchange count {exchange_count}")
         
-        # Check if user is explicitly requesting final algorithm
-        requesting_final = False
-        final_keywords = ["final", "complete", "finish", "flowchart", "algorithm", "workflow", "done"]
-        
-        # AUTOMATICALLY TRIGGER FINAL after 7+ exchanges or if explicitly requested
-        if request_final or exchange_count >= 7 or (current_progress >= 85 and any(keyword in message.lower() for keyword in final_keywords)):
-            requesting_final = True
-            # Ensure progress is sufficient for final algorithm
-            if current_progress < 90:
-                current_progress = 90
+        # Get the shared Gemini client
+        llm_client = get_llm_client()
+        turn = prepare_turn(request)
         
         # If requesting final flowchart and progress is sufficient (>= 90%)
-        if requesting_final and current_progress >= 90:
-            # Add special instruction for final algorithm generation
-            special_instruction = """
-            Please generate the complete algorithmic workflow now.
-            
-            1. Create a well-structured, numbered list showing all steps of the algorithm
-            2. Include clear headings for different sections
-            3. Format using proper markdown for clarity
-            4. Add the exact text "WORKFLOW_COMPLETE" at the very end
-            
-            DO NOT ask any more questions - this is the final output.
-            """
-            
-            # Special system message for final algorithm generation
-            formatted_history = []
-            for msg in conversation_history:
-                role = "user" if msg['role'] == 'user' else "model"
-                formatted_history.append({"role": role, "parts": [msg['content']]})
-            
-            # Add our special instruction
-            formatted_history.append({
-                "role": "user",
-                "parts": [f"{message}\n\n{special_instruction}\nPlease provide the complete final algorithm now."]
-            })
-            
-            # Generate response with special instruction
-            model = genai.GenerativeModel("gemini-1.5-flash", 
-                generation_config={"temperature": 0.7, "top_p": 0.9, "max_output_tokens": 4000})
-            chat = model.start_chat(history=formatted_history[:-1])  # Don't include our special instruction in history
-            response = chat.send_message(formatted_history[-1]["parts"][0])
+        if turn["final"]:
+            history, message, options = final_algorithm_call(turn)
+            final_text = await llm_client.chat(history, message, **options)
             
             # Format the response with 100% progress
-            response_text = f"<progress>100%</progress>\n<evaluation>Final algorithm complete!</evaluation>\n\n{response.text}"
-            if "WORKFLOW_COMPLETE" not in response.text:
+            response_text = FINAL_RESPONSE_PREFIX + final_text
+            if "WORKFLOW_COMPLETE" not in final_text:
                 response_text += "\n\nWORKFLOW_COMPLETE"
                 
             return {
                 "response": response_text,
-                "progress": 100
+                "progress": 100,
+                **finish_turn(turn, response_text, 100)
             }
         
         # For normal conversation flow
-        else:
-            # Format the conversation history for Gemini
-            formatted_history = []
-            for msg in conversation_history:
-                role = "user" if msg['role'] == 'user' else "model"
-                formatted_history.append({"role": role, "parts": [msg['content']]})
-                
-            # Add the system prompt if this is a new conversation
-            if len(formatted_history) <= 1:  # Only assistant welcome message
-                formatted_history = [{
-                    "role": "model",
-                    "parts": [ALGORITHM_DESIGN_PROMPT]
-                }] + formatted_history
-            
-            # Add the new message from the user
-            formatted_history.append({
-                "role": "user", 
-                "parts": [message]
-            })
-            
-            # ACCELERATED PROGRESS INSTRUCTION: Tell the AI to move faster through the process
-            progress_instruction = f"""
-            IMPORTANT: Please accelerate the algorithm design process.
-            
-            Current exchange: {exchange_count}
-            Current progress: {current_progress}%
-            Target progress: {min_expected_progress}%
-            
-            Please:
-            1. Ask a focused question that moves the design forward significantly
-            2. Set the progress to at least {min_expected_progress}%
-            3. If this is exchange 6+, prepare to move toward the final algorithm
-            4. Keep your response concise and focused
-            
-            We need to reach 90%+ progress within 7-8 exchanges total.
-            """
-            
-            # Add the progress instruction
-            formatted_history.append({
-                "role": "user",
-                "parts": [progress_instruction]
-            })
-            
-            logger.debug(f"Sending to Gemini API with history length: {len(formatted_history)}")
-            
-            # Generate response from Gemini
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            
-            # Don't include our acceleration instruction in the history
-            chat_history = formatted_history[:-1]
-            chat = model.start_chat(history=chat_history[:-1])  # Don't include the last user message in history
-            
-            # Use the last message that includes our instructions
-            response = chat.send_message(formatted_history[-1]["parts"][0])
-            
-            logger.debug("Successfully received response from Gemini API")
-            
-            # Extract progress from response if available
-            progress = current_progress
-            response_text = response.text
-            progress_tag = "<progress>"
-            if progress_tag in response_text:
-                try:
-                    start_idx = response_text.find(progress_tag) + len(progress_tag)
-                    end_idx = response_text.find("%</progress>")
-                    if end_idx > start_idx:
-                        progress = int(response_text[start_idx:end_idx])
-                except:
-                    pass
-            
-            # FORCE PROGRESS: Ensure progress meets or exceeds the expected minimum
-            if progress < min_expected_progress:
-                progress = min_expected_progress
-                
-                # Update progress tag in response if present
-                if progress_tag in response_text:
-                    response_text = response_text.replace(
-                        f"<progress>{response_text[start_idx:end_idx]}%</progress>",
-                        f"<progress>{progress}%</progress>"
-                    )
+        history, message, options = conversation_call(turn)
+        response_text = await llm_client.chat(history, message, **options)
+        
+        logger.debug("Successfully received response from Gemini API")
+        
+        # Extract progress from response if available
+        response_progress = extract_progress(response_text)
+        progress = response_progress if response_progress is not None else turn["current_progress"]
+        
+        # FORCE PROGRESS: Ensure progress meets or exceeds the expected minimum
+        if progress < turn["min_expected_progress"]:
+            progress = turn["min_expected_progress"]
             
-            return {
-                "response": response_text,
-                "progress": progress
-            }
+            # Update progress tag in response if present
+            if response_progress is not None:
+                response_text = response_text.replace(
+                    f"<progress>{response_progress}%</progress>",
+                    f"<progress>{progress}%</progress>"
+                )
+        
+        return {
+            "response": response_text,
+            "progress": progress,
+            **finish_turn(turn, response_text, progress)
+        }
         
     except Exception as e:
         error_detail = f"Error in algorithm designer: {str(e)}\n{traceback.format_exc()}"
@@ -303,4 +379,85 @@ async def algorithm_designer_chat(request: Dict = Body(...)):
             "response": f"I'm sorry, there was an error processing your request: {str(e)}. Please try again later.",
             "error": str(e),
             "progress": 0
-        } 
\ No newline at end of file
+        }
+
+@router.post("/algorithm_designer_stream")
+async def algorithm_designer_stream(request: Dict = Body(...)):
+    """
+    Streaming variant of /algorithm_designer using Server-Sent Events.
+    
+    Takes the same request body. Emits "chunk" events with {"text"} as the
+    reply arrives, "progress" and "evaluation" events as soon as those tags
+    are complete, "complete" when WORKFLOW_COMPLETE is seen, and finally a
+    "done" event with the same {"response", "progress"} the non-streaming
+    endpoint returns (or an "error" event).
+    """
+    return StreamingResponse(_stream_algorithm_designer(request), media_type="text/event-stream",
+                             headers=SSE_HEADERS)
+
+def _sse_events(events: List[Tuple[str, Any]], include_tags: bool = True) -> List[str]:
+    """Turn parser events into SSE messages"""
+    messages = []
+    for kind, value in events:
+        if kind == "text":
+            messages.append(sse_event("chunk", {"text": value}))
+        elif kind == "complete":
+            messages.append(sse_event("complete", {}))
+        elif include_tags:
+            messages.append(sse_event(kind, {kind: value}))
+    return messages
+
+async def _stream_algorithm_designer(request: Dict):
+    try:
+        if request.get('message', '') == 'test':
+            parser = TaggedStreamParser()
+            for message in _sse_events(parser.feed(TEST_RESPONSE) + parser.close()):
+                yield message
+            yield sse_event("done", {"response": TEST_RESPONSE, "progress": 15})
+            return
+        
+        llm_client = get_llm_client()
+        turn = prepare_turn(request)
+        
+        if turn["final"]:
+            history, message, options = final_algorithm_call(turn)
+            yield sse_event("progress", {"progress": 100})
+            yield sse_event("evaluation", {"evaluation": "Final algorithm complete!"})
+            yield sse_event("chunk", {"text": FINAL_RESPONSE_PREFIX})
+            
+            # Tags inside the algorithm itself don't change the reported progress
+            parser = TaggedStreamParser()
+            async for text in llm_client.chat_stream(history, message, **options):
+                for event in _sse_events(parser.feed(text), include_tags=False):
+                    yield event
+            for event in _sse_events(parser.close(), include_tags=False):
+                yield event
+            
+            response_text = FINAL_RESPONSE_PREFIX + parser.text
+            if not parser.complete:
+                response_text += "\n\nWORKFLOW_COMPLETE"
+                yield sse_event("chunk", {"text": "\n\nWORKFLOW_COMPLETE"})
+                yield sse_event("complete", {})
+            yield sse_event("done", {"response": response_text, "progress": 100,
+                                     **finish_turn(turn, response_text, 100)})
+            return
+        
+        # Progress tags below the expected minimum are raised as they stream by
+        history, message, options = conversation_call(turn)
+        parser = TaggedStreamParser(min_progress=turn["min_expected_progress"])
+        async for text in llm_client.chat_stream(history, message, **options):
+            for event in _sse_events(parser.feed(text)):
+                yield event
+        for event in _sse_events(parser.close()):
+            yield event
+        
+        progress = parser.progress if parser.progress is not None else turn["current_progress"]
+        yield sse_event("done", {"response": parser.text, "progress": progress,
+                                 **finish_turn(turn, parser.text, progress)})
+    except Exception as e:
+        logger.error(f"Error in algorithm designer stream: {str(e)}\n{traceback.format_exc()}")
+        yield sse_event("error", {
+            "response": f"I'm sorry, there was an error processing your request: {str(e)}. Please try again later.",
+            "error": str(e),
+            "progress": 0
+        })
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
+import asyncio
+import codecs
+import json
 import logging
 import traceback
+import uuid
 from typing import Dict
 
+from pydantic import ValidationError
+
 from models.schemas import CodeRequest, StepCompletionRequest, QuestionRequest
+from services.execution.execution_service import STREAM_STDIN_MAX_BYTES
 from utils.helpers import generate_quiz_verification
-from services.project.project_service import ProjectService
+from utils.streaming import SSE_HEADERS, sse_event
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -18,13 +27,17 @@ def get_execution_service():
     return get_execution_service()
 
 def get_project_service():
-    from app import get_google_api_key
-    return ProjectService(get_google_api_key())
+    from app import get_project_service
+    return get_project_service()
 
 def get_session_service():
     from app import get_session_service
     return get_session_service()
 
+def get_llm_client():
+    from app import get_llm_client
+    return get_llm_client()
+
 @router.post("/execute")
 async def execute_code(request: CodeRequest):
     """Execute code in the specified language"""
@@ -36,13 +49,122 @@ async def execute_code(request: CodeRequest):
             session_service = get_session_service()
             session_service.increment_execution_attempts(request.session_id)
             
-        result = execution_service.execute_code(request.code, request.language)
+        result = await execution_service.execute_code(
+            request.code,
+            request.language,
+            request.execution_id,
+            request.session_id,
+            use_cache=request.cache
+        )
         return result
     except Exception as e:
         error_detail = f"Error executing code: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_detail)
         raise HTTPException(status_code=500, detail=error_detail)
 
+@router.websocket("/ws/execute")
+async def execute_stream(websocket: WebSocket):
+    """Run code and stream its output over a WebSocket as it is produced
+    
+    The client first sends a CodeRequest as JSON, then any number of
+    {"type": "stdin", "data"}, {"type": "eof"} and {"type": "cancel"}
+    messages. The server sends {"type": "started", "execution_id"}, then
+    {"type": "stdout" | "stderr", "data"} chunks, and finally
+    {"type": "exit", ...} with the exit code and resource usage, or
+    {"type": "error", "detail"}. Output is read from the program only as fast
+    as the client takes it.
+    """
+    await websocket.accept()
+    execution_service = get_execution_service()
+    
+    try:
+        request = CodeRequest(**await websocket.receive_json())
+    except WebSocketDisconnect:
+        return
+    except (ValidationError, ValueError, TypeError) as e:
+        await websocket.send_json({"type": "error", "detail": f"Invalid execution request: {str(e)}"})
+        await websocket.close(code=1003)
+        return
+    
+    # If there's a session ID provided, increment execution attempts
+    if request.session_id:
+        session_service = get_session_service()
+        session_service.increment_execution_attempts(request.session_id)
+    
+    execution_id = request.execution_id or str(uuid.uuid4())
+    decoders = {stream: codecs.getincrementaldecoder("utf-8")(errors="replace") for stream in ("stdout", "stderr")}
+    
+    async def on_output(stream: str, chunk: bytes) -> None:
+        # Chunks can end mid-character, so decode incrementally
+        text = decoders[stream].decode(chunk)
+        if text:
+            await websocket.send_json({"type": stream, "data": text})
+    
+    stdin = asyncio.Queue()
+    await websocket.send_json({"type": "started", "execution_id": execution_id})
+    run = asyncio.ensure_future(
+        execution_service.execute_stream(request.code, request.language, on_output, stdin, execution_id)
+    )
+    reader = asyncio.ensure_future(_read_stream_input(websocket, stdin, execution_id))
+    try:
+        done, _ = await asyncio.wait({run, reader}, return_when=asyncio.FIRST_COMPLETED)
+        if run not in done:
+            logger.info(f"Client left during streamed execution {execution_id}, stopping it")
+            return
+        
+        result = run.result()
+        for stream, decoder in decoders.items():
+            text = decoder.decode(b"", final=True)
+            if text:
+                await websocket.send_json({"type": stream, "data": text})
+        
+        message = {"type": "exit", **result}
+        if result.get("limit_exceeded"):
+            message["message"] = f"Execution stopped: {execution_service.sandbox_limits.describe(result['limit_exceeded'])}"
+        elif result.get("timed_out"):
+            message["message"] = "Execution timed out"
+        await websocket.send_json(message)
+    except WebSocketDisconnect:
+        logger.info(f"Client left during streamed execution {execution_id}")
+    except ValueError as e:
+        await websocket.send_json({"type": "error", "detail": str(e)})
+    except Exception as e:
+        logger.error(f"Error streaming execution {execution_id}: {str(e)}\n{traceback.format_exc()}")
+        await websocket.send_json({"type": "error", "detail": f"Error executing code: {str(e)}"})
+    finally:
+        # Stops the program if it is still running
+        run.cancel()
+        reader.cancel()
+        if websocket.client_state == WebSocketState.CONNECTED:
+            await websocket.close()
+
+async def _read_stream_input(websocket: WebSocket, stdin: asyncio.Queue, execution_id: str) -> None:
+    """Forward the client's input and cancel requests to a streamed execution until it disconnects"""
+    received = 0
+    try:
+        while True:
+            try:
+                message = json.loads(await websocket.receive_text())
+            except ValueError:
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            
+            if kind == "stdin":
+                data = str(message.get("data", "")).encode()
+                received += len(data)
+                if received > STREAM_STDIN_MAX_BYTES:
+                    # Close stdin so the program sees end of input
+                    await websocket.send_json({"type": "error", "detail": f"Input limit of {STREAM_STDIN_MAX_BYTES} bytes exceeded"})
+                    stdin.put_nowait(None)
+                else:
+                    stdin.put_nowait(data)
+            elif kind == "eof":
+                stdin.put_nowait(None)
+            elif kind == "cancel":
+                get_execution_service().cancel_execution(execution_id)
+    except WebSocketDisconnect:
+        return
+
 @router.post("/render_website")
 async def render_website(html_code: str = Body(..., embed=True), css_code: str = Body(..., embed=True), session_id: str = Body(None, embed=True)):
     """Render an HTML website with CSS"""
@@ -75,12 +197,78 @@ async def verify_step_completion(request: StepCompletionRequest):
         logger.error(error_detail)
         raise HTTPException(status_code=500, detail=error_detail)
 
+def build_question_prompt(request: QuestionRequest, session: Dict, execution_attempts: int) -> str:
+    """Build the Gemini prompt for a learner's question, giving hints or a full solution by attempt count"""
+    # Determine question type and response approach
+    show_solution = execution_attempts >= 4  # Show solution if 4+ attempts made
+    
+    # Prepare the base context for all question types
+    context = f"""
+    I'm building a project using {request.project_type} with expertise level {session["expertise_level"]}.
+    Project idea: {session["project_idea"]}
+    
+    Here is my current code:
+    ```
+    {request.code}
+    ```
+    
+    My question is: {request.question}
+    """
+    
+    # Trial message to be added to responses
+    trial_message = f"This is your {execution_attempts}{'st' if execution_attempts == 1 else 'nd' if execution_attempts == 2 else 'rd' if execution_attempts == 3 else 'th'} attempt! "
+    
+    # Prepare prompt for Gemini based on question type and execution attempts
+    if request.is_error_related:
+        if show_solution:
+            # User has made many attempts - provide the full solution
+            prompt = f"""
+            {context}
+            
+            The user has made {execution_attempts} attempts to solve this problem.
+            Since they've been struggling, provide a complete solution with detailed code.
+            Be very clear and thorough in explaining both the error and how to fix it.
+            
+            Start your response with "{trial_message}" followed by an encouraging message like "Keep going!" or "You're making progress!".
+            Then provide your detailed solution.
+            """
+        else:
+            # User is still early in debugging - provide hints only
+            prompt = f"""
+            {context}
+            
+            The user has made only {execution_attempts} attempts to solve this problem.
+            DO NOT give them the full solution yet. Instead, provide helpful debugging hints
+            that will guide them toward fixing the error on their own.
+            
+            Start your response with "{trial_message}" followed by an encouraging message like "Keep trying!" or "You're on the right track!".
+            
+            Focus on:
+            1. What might be causing the error
+            2. General approaches to fix it
+            3. Documentation references or concepts they should look up
+            
+            DO NOT provide any direct code solutions or exact fixes.
+            """
+    else:
+        # For general explanation questions, provide complete information
+        prompt = f"""
+        {context}
+        
+        Start your response with "{trial_message}" followed by a brief acknowledgment of their question.
+        
+        Please provide a helpful answer to this general question, considering the user's expertise level.
+        Include code examples if relevant to illustrate concepts, but focus on explaining the concepts clearly.
+        """
+    
+    return prompt
+
 @router.post("/ask_question")
 async def ask_question(request: QuestionRequest):
     """Answer a user's question about code or a step"""
     try:
         # Get services
-        project_service = get_project_service()
+        llm_client = get_llm_client()
         session_service = get_session_service()
         
         # Check if session exists
@@ -90,83 +278,52 @@ async def ask_question(request: QuestionRequest):
         
         # Get the number of execution attempts for the current step
         execution_attempts = session_service.get_current_step_execution_attempts(request.session_id)
+        prompt = build_question_prompt(request, session, execution_attempts)
         
-        # Determine question type and response approach
-        show_solution = execution_attempts >= 4  # Show solution if 4+ attempts made
-        
-        # Prepare the base context for all question types
-        context = f"""
-        I'm building a project using {request.project_type} with expertise level {session["expertise_level"]}.
-        Project idea: {session["project_idea"]}
-        
-        Here is my current code:
-        ```
-        {request.code}
-        ```
-        
-        My question is: {request.question}
-        """
-        
-        # Trial message to be added to responses
-        trial_message = f"This is your {execution_attempts}{'st' if execution_attempts == 1 else 'nd' if execution_attempts == 2 else 'rd' if execution_attempts == 3 else 'th'} attempt! "
-        
-        # Prepare prompt for Gemini based on question type and execution attempts
-        if request.is_error_related:
-            if show_solution:
-                # User has made many attempts - provide the full solution
-                prompt = f"""
-                {context}
-                
-                The user has made {execution_attempts} attempts to solve this problem.
-                Since they've been struggling, provide a complete solution with detailed code.
-                Be very clear and thorough in explaining both the error and how to fix it.
-                
-                Start your response with "{trial_message}" followed by an encouraging message like "Keep going!" or "You're making progress!".
-                Then provide your detailed solution.
-                """
-            else:
-                # User is still early in debugging - provide hints only
-                prompt = f"""
-                {context}
-                
-                The user has made only {execution_attempts} attempts to solve this problem.
-                DO NOT give them the full solution yet. Instead, provide helpful debugging hints
-                that will guide them toward fixing the error on their own.
-                
-                Start your response with "{trial_message}" followed by an encouraging message like "Keep trying!" or "You're on the right track!".
-                
-                Focus on:
-                1. What might be causing the error
-                2. General approaches to fix it
-                3. Documentation references or concepts they should look up
-                
-                DO NOT provide any direct code solutions or exact fixes.
-                """
-        else:
-            # For general explanation questions, provide complete information
-            prompt = f"""
-            {context}
-            
-            Start your response with "{trial_message}" followed by a brief acknowledgment of their question.
-            
-            Please provide a helpful answer to this general question, considering the user's expertise level.
-            Include code examples if relevant to illustrate concepts, but focus on explaining the concepts clearly.
-            """
-        
-        # Call Gemini API through project service
-        import google.generativeai as genai
-        model = genai.GenerativeModel("gemini-2.0-flash")
-        response = model.generate_content(prompt)
+        # Call Gemini API through the shared client
+        response_text = await llm_client.generate(prompt, model_name="gemini-2.0-flash", template="ask_question")
         
         # For questions, we don't need to process JSON, so return as is
         return {
-            "response": response.text
+            "response": response_text
         }
     except Exception as e:
         error_detail = f"Error generating answer: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_detail)
         raise HTTPException(status_code=500, detail=error_detail)
 
+@router.post("/ask_question_stream")
+async def ask_question_stream(request: QuestionRequest):
+    """Streaming variant of /ask_question that sends the answer as Server-Sent Events
+    
+    Emits "chunk" events with {"text"} as Gemini produces them, then a "done"
+    event with the full {"response"}, or an "error" event if generation fails.
+    """
+    session_service = get_session_service()
+    
+    # Check if session exists before starting the stream so a bad id is still a 404
+    session = session_service.get_session(request.session_id)
+    if not session:
+        raise HTTPException(status_code=404, detail=f"Session not found: {request.session_id}")
+    
+    execution_attempts = session_service.get_current_step_execution_attempts(request.session_id)
+    prompt = build_question_prompt(request, session, execution_attempts)
+    
+    return StreamingResponse(_stream_answer(prompt), media_type="text/event-stream", headers=SSE_HEADERS)
+
+async def _stream_answer(prompt: str):
+    """Forward Gemini's answer chunk by chunk"""
+    llm_client = get_llm_client()
+    chunks = []
+    try:
+        async for text in llm_client.generate_stream(prompt, model_name="gemini-2.0-flash", template="ask_question"):
+            chunks.append(text)
+            yield sse_event("chunk", {"text": text})
+        yield sse_event("done", {"response": "".join(chunks)})
+    except Exception as e:
+        logger.error(f"Error streaming answer: {str(e)}\n{traceback.format_exc()}")
+        yield sse_event("error", {"detail": f"Error generating answer: {str(e)}"})
+
 @router.get("/get_step_attempts")
 async def get_step_attempts(session_id: str, step_number: int):
     """Get the number of execution attempts for a specific step"""
@@ -197,5 +354,22 @@ async def terminate_streamlit(request: Dict):
         raise HTTPException(status_code=400, detail="Missing execution_id")
     
     execution_service = get_execution_service()
-    success = execution_service.terminate_streamlit_process(execution_id)
-    return {"success": success} 
\ No newline at end of file
+    success = await execution_service.terminate_streamlit_process(execution_id)
+    return {"success": success}
+
+@router.post("/cancel_execution")
+async def cancel_execution(request: Dict):
+    """API endpoint to cancel a queued or running code execution"""
+    execution_id = request.get("execution_id")
+    if not execution_id:
+        raise HTTPException(status_code=400, detail="Missing execution_id")
+    
+    execution_service = get_execution_service()
+    success = execution_service.cancel_execution(execution_id)
+    return {"success": success}
+
+@router.get("/execution_metrics")
+async def execution_metrics():
+    """Report execution queue depth and counters"""
+    execution_service = get_execution_service()
+    return execution_service.get_metrics() 
\ No newline at end of file
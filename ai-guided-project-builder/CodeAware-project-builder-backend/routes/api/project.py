@@ -4,8 +4,8 @@ import json
 import traceback
 from typing import Dict, Any
 
+from models.project_document import ProjectDocument
 from models.schemas import ProjectRequest, StepRequest
-from services.project.project_service import ProjectService
 from services.project.session_service import SessionService
 
 # Configure logging
@@ -15,13 +15,17 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 def get_project_service():
-    from app import get_google_api_key
-    return ProjectService(get_google_api_key())
+    from app import get_project_service
+    return get_project_service()
 
 def get_session_service():
     from app import get_session_service
     return get_session_service()
 
+def get_step_speculator():
+    from app import get_step_speculator
+    return get_step_speculator()
+
 @router.post("/start_project")
 async def start_project(request: ProjectRequest):
     """Start a new project based on user specifications"""
@@ -33,26 +37,38 @@ async def start_project(request: ProjectRequest):
         session_service = get_session_service()
         
         # Generate project steps
-        project_data = project_service.generate_project_steps(
+        project_data = await project_service.generate_project_steps(
             request.project_type, 
             request.expertise_level,
-            request.project_idea or "Simple Project"
+            request.project_idea or "Simple Project",
+            use_cache=request.use_cache is not False
         )
         
-        # Convert to JSON string for storage
-        gemini_response = json.dumps(project_data)
+        # Parse once; the session keeps the structured plan and its serialized form
+        project = ProjectDocument.from_dict(project_data)
         
         # Create a session
         session_id = session_service.create_session(
             request.project_type,
             request.expertise_level,
             request.project_idea or "AI suggested project",
-            gemini_response
+            project
+        )
+        
+        # Bank the first step's quiz while the learner works on it
+        first_step = project.step_dict(0)
+        if first_step:
+            project_service.prefetch_quiz_questions(first_step, request.project_type)
+        
+        # Draft step 1 while the learner works on step 0
+        get_step_speculator().speculate(
+            session_id, request.project_type, request.expertise_level,
+            request.project_idea or "Simple Project", 0, (first_step or {}).get("code")
         )
         
         return {
             "session_id": session_id,
-            "response": gemini_response
+            "response": project.to_json()
         }
     except Exception as e:
         error_detail = f"Error generating project: {str(e)}\n{traceback.format_exc()}"
@@ -118,16 +134,33 @@ async def get_next_step(request: Dict[str, Any]):
         if step_request.user_code:
             session_service.store_user_code(session_id, step_request.user_code)
         
+        # Use the step drafted while the learner worked on this one, if there is one
+        step_speculator = get_step_speculator()
+        next_step_data = None
+        if step_request.use_cache is not False:
+            next_step_data = await step_speculator.take(
+                session_id,
+                step_request.project_type,
+                step_request.expertise_level,
+                step_request.project_idea,
+                current_step,
+                step_request.user_code,
+                step_request.user_question,
+                step_request.user_understanding
+            )
+        
         # Generate the next step
-        next_step_data = project_service.generate_next_step(
-            step_request.project_type,
-            step_request.expertise_level,
-            step_request.project_idea,
-            current_step,
-            step_request.user_code,
-            step_request.user_question,
-            step_request.user_understanding
-        )
+        if next_step_data is None:
+            next_step_data = await project_service.generate_next_step(
+                step_request.project_type,
+                step_request.expertise_level,
+                step_request.project_idea,
+                current_step,
+                step_request.user_code,
+                step_request.user_question,
+                step_request.user_understanding,
+                use_cache=step_request.use_cache is not False
+            )
         
         # Ensure correct step numbering
         from utils.helpers import format_step_title
@@ -137,15 +170,25 @@ async def get_next_step(request: Dict[str, Any]):
         # Make sure step_number is correctly set in the data
         next_step_data["step_number"] = next_step
         
-        # Update the current step in the session
-        session_service.update_session(session_id, {
-            "current_step": next_step,
-            "current_step_data": next_step_data  # Store the current step data for quiz generation
-        })
+        # Add the step to the session's project (for quiz generation) and make it current
+        project = session_service.advance_to_step(session_id, next_step, next_step_data)
+        if project is None:
+            raise HTTPException(status_code=404, detail="Session data not found")
+        
+        # Bank the new step's quiz while the learner works on it
+        project_service.prefetch_quiz_questions(project.step_dict(next_step) or next_step_data,
+                                                step_request.project_type)
+        
+        # Draft the step after it, unless this is the last one
+        if next_step < total_steps:
+            step_speculator.speculate(
+                session_id, step_request.project_type, step_request.expertise_level,
+                step_request.project_idea, next_step, next_step_data.get("code")
+            )
         
         return {
             "session_id": session_id,
-            "response": json.dumps(next_step_data)
+            "response": project.step_json(next_step)
         }
     except Exception as e:
         error_detail = f"Error generating next step: {str(e)}\n{traceback.format_exc()}"
@@ -158,6 +201,7 @@ async def get_step_questions(request: Dict[str, Any]):
     try:
         session_id = request.get("session_id")
         step_number = request.get("step_number")
+        use_cache = request.get("use_cache", True) is not False
         
         # Get services
         project_service = get_project_service()
@@ -168,26 +212,16 @@ async def get_step_questions(request: Dict[str, Any]):
         if not session:
             raise HTTPException(status_code=404, detail=f"Session not found: {session_id}")
         
-        # Parse the gemini response to get the current step data
-        if 'gemini_response' not in session:
+        # The parsed project holds the initial step and every step generated since
+        project = session_service.get_project(session_id)
+        if project is None:
             raise HTTPException(status_code=404, detail="Session data not found")
-        
-        # Get step content, either from the first step in the initial response 
-        # or from generated responses stored in the session
-        response_object = json.loads(session['gemini_response'])
+        language = session.get("project_type", "")
         
         # Find current step data to generate questions for
-        step_data = None
-        
-        # Determine where to get the step data from
-        if step_number == 0 and "steps" in response_object and len(response_object["steps"]) > 0:
-            # For the first step, we can use the step from the initial project response
-            step_data = response_object["steps"][0]
-            logger.debug(f"Found step data for step 0 in initial project response")
-        elif "current_step_data" in session and session.get("current_step") == step_number:
-            # For subsequent steps, use the current step data stored in the session
-            step_data = session.get("current_step_data")
-            logger.debug(f"Found step data in session: current_step_data for step {step_number}")
+        step_data = project.step_dict(step_number) if isinstance(step_number, int) else None
+        if step_data:
+            logger.debug(f"Found step data for step {step_number} in session project")
         
         # If we still don't have step data, try to fallback to other sources
         if not step_data:
@@ -215,7 +249,7 @@ async def get_step_questions(request: Dict[str, Any]):
         
         if step_data:
             # Generate quiz questions about this step
-            questions = project_service.generate_quiz_questions(step_data)
+            questions = await project_service.generate_quiz_questions(step_data, use_cache=use_cache, language=language)
             logger.debug(f"Generated {len(questions)} quiz questions for step {step_number}")
             
             return {
@@ -228,7 +262,7 @@ async def get_step_questions(request: Dict[str, Any]):
                 "title": f"Step {step_number + 1}",
                 "description": "Building your project step by step"
             }
-            questions = project_service.generate_quiz_questions(generic_step)
+            questions = await project_service.generate_quiz_questions(generic_step, use_cache=use_cache, language=language)
             
             return {
                 "questions": questions
@@ -237,4 +271,23 @@ async def get_step_questions(request: Dict[str, Any]):
     except Exception as e:
         error_detail = f"Error getting questions: {str(e)}\n{traceback.format_exc()}"
         logger.error(error_detail)
-        raise HTTPException(status_code=500, detail=error_detail) 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=error_detail) 
+
+@router.get("/session_metrics")
+async def session_metrics():
+    """Report the number of stored sessions and their memory footprint"""
+    session_service = get_session_service()
+    return session_service.get_metrics()
+
+@router.get("/cache_metrics")
+async def cache_metrics():
+    """Report hit/miss counters for the LLM response cache"""
+    project_service = get_project_service()
+    if project_service.response_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **project_service.response_cache.get_metrics()}
+
+@router.get("/speculation_metrics")
+async def speculation_metrics():
+    """Report how often speculatively drafted steps were served, and the draft spend"""
+    return get_step_speculator().get_metrics()
@@ -0,0 +1 @@
+# Algorithm designer services package initialization 
\ No newline at end of file
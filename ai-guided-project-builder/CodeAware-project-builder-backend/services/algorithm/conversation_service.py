@@ -0,0 +1,142 @@
+import asyncio
+import logging
+import os
+import re
+import uuid
+from typing import Dict, List, Optional
+
+from services.project.session_store import create_session_store
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CONVERSATION_DB_PATH = os.getenv("CONVERSATION_DB_PATH", "conversations.db")
+
+# Approximate token budget for the history replayed to Gemini each turn; older
+# turns beyond it are folded into a short summary
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "4000"))
+
+# Most recent messages that are always kept verbatim
+CONVERSATION_KEEP_RECENT = int(os.getenv("CONVERSATION_KEEP_RECENT", "6"))
+
+# Each summarized message is clipped to this many characters
+SUMMARY_LINE_CHARS = 300
+
+# Seconds between background expiry sweeps
+CONVERSATION_EXPIRY_INTERVAL = 60
+
+TAG_PATTERN = re.compile(r"<(progress|evaluation)>.*?</\1>", re.DOTALL)
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+def _summary_line(message: Dict) -> str:
+    """Condense a message for the running summary"""
+    speaker = "User" if message["role"] == "user" else "Mentor"
+    content = " ".join(TAG_PATTERN.sub("", message["content"]).split())
+    if len(content) > SUMMARY_LINE_CHARS:
+        content = content[:SUMMARY_LINE_CHARS] + "..."
+    return f"{speaker}: {content}"
+
+class ConversationService:
+    """Server-held algorithm designer conversations, so clients only send their new message"""
+
+    def __init__(self, store=None, token_budget: int = CONVERSATION_TOKEN_BUDGET,
+                 keep_recent: int = CONVERSATION_KEEP_RECENT):
+        # Conversations reuse the session store backends (memory or SQLite)
+        self.store = store or create_session_store(CONVERSATION_DB_PATH)
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summarized_messages = 0
+        self._expiry_task = None
+
+    async def start(self) -> None:
+        """Start the background expiry sweep"""
+        if self._expiry_task is None:
+            self._expiry_task = asyncio.ensure_future(self._expire_forever())
+
+    async def shutdown(self) -> None:
+        """Stop the background expiry sweep"""
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+
+    async def _expire_forever(self) -> None:
+        while True:
+            await asyncio.sleep(CONVERSATION_EXPIRY_INTERVAL)
+            try:
+                self.store.expire()
+            except Exception as e:
+                logger.error(f"Error expiring conversations: {str(e)}")
+
+    def create_conversation(self, project_description: str = "", history: Optional[List[Dict]] = None,
+                            progress: int = 0, exchange_count: int = 0) -> str:
+        """Start a conversation, optionally seeded with history the client already holds"""
+        conversation_id = str(uuid.uuid4())
+        conversation = {
+            "project_description": project_description or "",
+            "history": [{"role": msg["role"], "content": msg["content"]} for msg in history or []],
+            "summary": [],
+            "progress": progress,
+            "exchange_count": exchange_count
+        }
+        self._compact(conversation)
+        self.store.create(conversation_id, conversation)
+        logger.debug(f"Created algorithm designer conversation {conversation_id}")
+        return conversation_id
+
+    def get_conversation(self, conversation_id: str) -> Optional[Dict]:
+        return self.store.get(conversation_id)
+
+    def chat_history(self, conversation: Dict) -> List[Dict]:
+        """The conversation in Gemini chat format, led by the summary of older turns"""
+        history = []
+        if conversation["summary"]:
+            summary = "\n".join(conversation["summary"])
+            history.append({"role": "user", "parts": [f"Summary of our earlier discussion:\n{summary}"]})
+            history.append({"role": "model", "parts": ["Understood, I'll continue from there."]})
+        for msg in conversation["history"]:
+            role = "user" if msg["role"] == "user" else "model"
+            history.append({"role": role, "parts": [msg["content"]]})
+        return history
+
+    def record_turn(self, conversation_id: str, conversation: Dict, message: str, response: str,
+                    progress: int, exchange_count: int) -> bool:
+        """Append an exchange, fold old turns into the summary and save"""
+        conversation["history"].append({"role": "user", "content": message})
+        conversation["history"].append({"role": "assistant", "content": response})
+        conversation["progress"] = progress
+        conversation["exchange_count"] = exchange_count
+        self._compact(conversation)
+        return self.store.update(conversation_id, conversation)
+
+    def _compact(self, conversation: Dict) -> None:
+        """Move the oldest messages into the summary until the history fits the token budget"""
+        history = conversation["history"]
+        summary = conversation["summary"]
+        tokens = sum(estimate_tokens(msg["content"]) for msg in history)
+        tokens += sum(estimate_tokens(line) for line in summary)
+
+        while tokens > self.token_budget and len(history) > self.keep_recent:
+            message = history.pop(0)
+            line = _summary_line(message)
+            summary.append(line)
+            tokens += estimate_tokens(line) - estimate_tokens(message["content"])
+            self.summarized_messages += 1
+
+        # The summary itself gets a quarter of the budget; drop its oldest lines beyond that
+        summary_budget = self.token_budget // 4
+        summary_tokens = sum(estimate_tokens(line) for line in summary)
+        while summary and summary_tokens > summary_budget:
+            summary_tokens -= estimate_tokens(summary.pop(0))
+
+    def get_metrics(self) -> Dict:
+        """Return the conversation count and compaction counters"""
+        return {
+            "store": type(self.store).__name__,
+            "conversations": len(self.store),
+            "memory_usage_bytes": self.store.memory_usage(),
+            "summarized_messages": self.summarized_messages,
+            "token_budget": self.token_budget
+        }
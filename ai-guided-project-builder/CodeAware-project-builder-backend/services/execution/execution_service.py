@@ -1,28 +1,199 @@
-import subprocess
+import asyncio
 import tempfile
 import os
 import uuid
 import signal
 import logging
 import psutil
-from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from services.execution.interpreter_pool import InterpreterPool, PoolUnavailable
+from services.execution.process_registry import create_process_registry, kill_process_group
+from services.execution.result_cache import EXECUTION_CACHE_ENABLED, ExecutionResultCache, is_cacheable
+from services.execution.sandbox import SandboxLimits, finish_result, run_sandboxed
+from services.execution.streamlit_supervisor import StreamlitSupervisor
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Maximum number of learner programs running at the same time; further
+# executions wait in a queue until a slot frees up
+MAX_CONCURRENT_EXECUTIONS = int(os.getenv("MAX_CONCURRENT_EXECUTIONS", "8"))
+
+# Wall-clock limit for a single execution in seconds
+EXECUTION_TIMEOUT = int(os.getenv("EXECUTION_TIMEOUT", "10"))
+
+# Maximum number of streamed executions running at the same time. They have
+# their own slots, so learners sitting at an input() prompt can't hold up /execute
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "8"))
+
+# Wall-clock limit for streamed executions, which may sit waiting for the
+# learner's input; the sandbox's CPU limit still applies
+STREAM_EXECUTION_TIMEOUT = int(os.getenv("STREAM_EXECUTION_TIMEOUT", "120"))
+
+# Input a learner may send to a streamed program, in bytes
+STREAM_STDIN_MAX_BYTES = int(os.getenv("STREAM_STDIN_MAX_BYTES", str(64 * 1024)))
+
+# How streamed programs are run, by language; Python is unbuffered so prints show up as they happen
+STREAM_COMMANDS = {
+    "python": (".py", ["python3", "-u"]),
+    "javascript": (".js", ["node"])
+}
+
+# Pre-warmed Python interpreter pool; set PYTHON_POOL_SIZE=0 to spawn a fresh
+# python3 process per run instead
+PYTHON_POOL_SIZE = int(os.getenv("PYTHON_POOL_SIZE", "4"))
+PYTHON_POOL_MAX_JOBS = int(os.getenv("PYTHON_POOL_MAX_JOBS", "100"))
+PYTHON_POOL_MAX_RSS_MB = int(os.getenv("PYTHON_POOL_MAX_RSS_MB", "256"))
+PYTHON_POOL_PRELOAD = [name for name in os.getenv("PYTHON_POOL_PRELOAD", "json,math,random,re,datetime").split(",") if name]
+
 class ExecutionService:
-    def __init__(self):
-        # Store running Streamlit processes keyed by execution_id
-        self.streamlit_processes = {}
+    def __init__(self, max_concurrent_executions: int = MAX_CONCURRENT_EXECUTIONS,
+                 max_concurrent_streams: int = MAX_CONCURRENT_STREAMS):
+        # Running processes of every worker, so any worker can cancel or stop them
+        self.registry = create_process_registry()
+        
+        # Runs Streamlit apps on ports from a range and reuses them per session
+        self.streamlit_supervisor = StreamlitSupervisor(registry=self.registry)
+        
+        # CPU, memory, process, file and output limits for every learner program
+        self.sandbox_limits = SandboxLimits()
+        
+        # Bound the number of concurrently running learner programs
+        self.max_concurrent_executions = max_concurrent_executions
+        self._execution_slots = asyncio.Semaphore(max_concurrent_executions)
+        self.execution_slot_counts = {"queued": 0, "active": 0}
         
-    def execute_code(self, code: str, language: str) -> Dict:
-        """Execute code in the specified language"""
-        execution_id = str(uuid.uuid4())
+        # Streamed executions may wait on the learner for minutes, so they get slots of their own
+        self.max_concurrent_streams = max_concurrent_streams
+        self._stream_slots = asyncio.Semaphore(max_concurrent_streams)
+        self.stream_slot_counts = {"queued": 0, "active": 0}
         
+        # In-flight execution tasks and their processes, keyed by execution_id
+        self.execution_tasks = {}
+        self.execution_processes = {}
+        self._cancelled_executions = set()
+        
+        # Warm interpreters for plain Python runs, started in start()
+        self.python_pool = None
+        if PYTHON_POOL_SIZE > 0:
+            self.python_pool = InterpreterPool(
+                size=PYTHON_POOL_SIZE,
+                max_jobs_per_worker=PYTHON_POOL_MAX_JOBS,
+                max_worker_rss_mb=PYTHON_POOL_MAX_RSS_MB,
+                preload_modules=PYTHON_POOL_PRELOAD
+            )
+        
+        # Results of deterministic runs, reused when the same code runs again
+        self.result_cache = ExecutionResultCache() if EXECUTION_CACHE_ENABLED else None
+        
+        # Counters exposed through get_metrics()
+        self.completed_executions = 0
+        self.cancelled_executions = 0
+        self.timed_out_executions = 0
+        
+    async def start(self) -> None:
+        """Start background resources such as the Python interpreter pool"""
+        await self.streamlit_supervisor.start()
+        if self.python_pool is not None:
+            try:
+                await self.python_pool.start()
+            except Exception as e:
+                # Fall back to one python3 process per run
+                logger.error(f"Failed to start Python interpreter pool: {str(e)}")
+    
+    async def shutdown(self) -> None:
+        """Stop running executions, the interpreter pool and any Streamlit apps still running"""
+        for execution_id, process in list(self.execution_processes.items()):
+            self._kill_process_group(process)
+            self.registry.remove(execution_id)
+        for task in list(self.execution_tasks.values()):
+            task.cancel()
+        if self.python_pool is not None:
+            await self.python_pool.shutdown()
+        await self.streamlit_supervisor.shutdown()
+    
+    async def execute_code(self, code: str, language: str, execution_id: Optional[str] = None,
+                           session_id: Optional[str] = None, use_cache: bool = True) -> Dict:
+        """Execute code in the specified language without blocking the event loop"""
+        execution_id = execution_id or str(uuid.uuid4())
+        
+        cache_key = None
+        if self.result_cache is not None:
+            if use_cache and is_cacheable(code, language):
+                cache_key = ExecutionResultCache.make_key(code, language)
+                cached = self.result_cache.get(cache_key)
+                if cached is not None:
+                    return {**cached, "execution_id": execution_id, "cached": True}
+            else:
+                self.result_cache.bypass()
+        
+        result = await self._run_task(execution_id, self._dispatch(code, language, execution_id, session_id))
+        if cache_key is not None and not result.get("cancelled"):
+            self.result_cache.set(cache_key, result)
+        return result
+    
+    async def execute_stream(self, code: str, language: str, on_output: Callable[[str, bytes], Awaitable[None]],
+                             stdin: asyncio.Queue, execution_id: Optional[str] = None) -> Dict:
+        """
+        Run a Python or JavaScript program, passing its output to
+        on_output("stdout" | "stderr", chunk) as it is written and feeding it
+        the bytes put on stdin (None closes it). Returns the result without
+        stdout/stderr, which have already been streamed.
+        """
+        execution_id = execution_id or str(uuid.uuid4())
+        if language not in STREAM_COMMANDS:
+            raise ValueError(f"Streaming is not supported for language: {language}")
+        if language == "python" and ('import streamlit' in code or 'from streamlit' in code):
+            raise ValueError("Streamlit apps can't be streamed; run them through /execute")
+        
+        result = await self._run_task(execution_id, self._stream(code, language, execution_id, on_output, stdin))
+        result.pop("stdout", None)
+        result.pop("stderr", None)
+        return result
+    
+    async def _stream(self, code: str, language: str, execution_id: str,
+                      on_output: Callable[[str, bytes], Awaitable[None]], stdin: asyncio.Queue) -> Dict:
+        suffix, command = STREAM_COMMANDS[language]
+        with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+            temp_file.write(code.encode())
+            temp_file_path = temp_file.name
+        
+        try:
+            return await self._run_process(command + [temp_file_path], execution_id, language,
+                                           timeout=STREAM_EXECUTION_TIMEOUT, on_output=on_output, stdin=stdin,
+                                           slot=self._stream_slot())
+        finally:
+            os.unlink(temp_file_path)
+    
+    async def _run_task(self, execution_id: str, job) -> Dict:
+        """Run the job as its own task so it can be cancelled by execution_id"""
+        task = asyncio.ensure_future(job)
+        self.execution_tasks[execution_id] = task
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if execution_id not in self._cancelled_executions:
+                # The caller itself was cancelled (e.g. client disconnected)
+                raise
+            return {
+                "stdout": "",
+                "stderr": "Execution cancelled",
+                "exit_code": -1,
+                "execution_id": execution_id,
+                "cancelled": True
+            }
+        finally:
+            self.execution_tasks.pop(execution_id, None)
+            self._cancelled_executions.discard(execution_id)
+    
+    async def _dispatch(self, code: str, language: str, execution_id: str, session_id: Optional[str] = None) -> Dict:
+        """Route an execution to the handler for its language"""
         if language == "python":
-            return self.execute_python(code, execution_id)
+            return await self.execute_python(code, execution_id, session_id)
         elif language == "javascript":
-            return self.execute_javascript(code, execution_id)
+            return await self.execute_javascript(code, execution_id)
         elif language == "html":
             return self.render_html(code, execution_id)
         elif language == "css":
@@ -30,163 +201,164 @@ class ExecutionService:
         else:
             raise ValueError(f"Unsupported language: {language}")
     
-    def execute_python(self, code: str, execution_id: str) -> Dict:
-        """Execute Python code and return the result"""
-        with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as temp_file:
-            temp_file.write(code.encode())
-            temp_file_path = temp_file.name
+    @asynccontextmanager
+    async def _slot(self, slots: asyncio.Semaphore, counts: Dict[str, int]):
+        """Wait for a free slot and keep its queued/active counts current"""
+        counts["queued"] += 1
+        try:
+            await slots.acquire()
+        except asyncio.CancelledError:
+            self.cancelled_executions += 1
+            raise
+        finally:
+            counts["queued"] -= 1
         
+        counts["active"] += 1
         try:
-            # Check if this is a Streamlit app
-            is_streamlit = 'import streamlit' in code or 'from streamlit' in code
+            yield
+        except asyncio.CancelledError:
+            self.cancelled_executions += 1
+            raise
+        finally:
+            counts["active"] -= 1
+            slots.release()
+    
+    def _execution_slot(self):
+        return self._slot(self._execution_slots, self.execution_slot_counts)
+    
+    def _stream_slot(self):
+        return self._slot(self._stream_slots, self.stream_slot_counts)
+    
+    async def _run_process(self, command: List[str], execution_id: str, language: str,
+                           timeout: int = EXECUTION_TIMEOUT,
+                           on_output: Optional[Callable[[str, bytes], Awaitable[None]]] = None,
+                           stdin: Optional[asyncio.Queue] = None, slot=None) -> Dict:
+        """Run a command in the resource-limited sandbox within the concurrency limit (an execution slot by default)"""
+        async with slot or self._execution_slot():
+            def on_start(process) -> None:
+                self.execution_processes[execution_id] = process
+                self.registry.add(execution_id, "execution", pid=process.pid)
             
-            if is_streamlit:
-                # Terminate any existing process with the same execution_id
-                self.terminate_streamlit_process(execution_id)
-                
-                # Execute Streamlit with a timeout
-                # We can't capture the web output, but we can report if it started successfully
-                try:
-                    # Start Streamlit process on a random port
-                    port = 8501 # Random port between 8501-8600
-                    
-                    # Build the command with appropriate flags to run headless
-                    streamlit_cmd = [
-                        "streamlit", "run", 
-                        temp_file_path,
-                        "--server.address", "0.0.0.0",
-                        "--server.port", str(port),
-                        "--server.headless", "true",
-                        "--server.runOnSave", "true",
-                        "--browser.serverAddress", "0.0.0.0",
-                        "--browser.gatherUsageStats", "false"
-                        
-                    ]
-                    
-                    # Use Popen instead of run so we don't block waiting for the process
-                    process = subprocess.Popen(
-                        streamlit_cmd,
-                        stdout=subprocess.PIPE,
-                        stderr=subprocess.PIPE,
-                        text=True,
-                        start_new_session=True  # This detaches the process
-                    )
-                    
-                    # Store the process for later cleanup
-                    self.streamlit_processes[execution_id] = process
-                    
-                    # Wait a short time to see if the process starts up without errors
-                    subprocess.run(["sleep", "2"])
-                    
-                    # Check if the process is still running
-                    if process.poll() is None:
-                        # Still running, assume success
-                        return {
-                            "stdout": "Streamlit app is running successfully at http://localhost:" + str(port),
-                            "stderr": "",
-                            "exit_code": 0,
-                            "execution_id": execution_id,
-                            "is_streamlit": True,
-                            "streamlit_url": f"http://localhost:{port}",
-                            "streamlit_port": port
-                        }
-                    else:
-                        # Process ended quickly, likely an error
-                        stdout, stderr = process.communicate(timeout=1)
-                        # Remove from tracked processes
-                        if execution_id in self.streamlit_processes:
-                            del self.streamlit_processes[execution_id]
-                        return {
-                            "stdout": stdout,
-                            "stderr": stderr,
-                            "exit_code": process.returncode,
-                            "execution_id": execution_id,
-                            "is_streamlit": True,
-                            "streamlit_error": True
-                        }
-                
-                except subprocess.TimeoutExpired:
-                    # Cleanup if process tracking was started
-                    if execution_id in self.streamlit_processes:
-                        self.terminate_streamlit_process(execution_id)
-                    return {
-                        "stdout": "",
-                        "stderr": "Timeout while starting Streamlit app",
-                        "exit_code": -1,
-                        "execution_id": execution_id,
-                        "is_streamlit": True,
-                        "streamlit_error": True
-                    }
-                except Exception as e:
-                    # Cleanup if process tracking was started
-                    if execution_id in self.streamlit_processes:
-                        self.terminate_streamlit_process(execution_id)
-                    return {
-                        "stdout": "",
-                        "stderr": f"Error running Streamlit app: {str(e)}",
-                        "exit_code": -1,
-                        "execution_id": execution_id,
-                        "is_streamlit": True,
-                        "streamlit_error": True
-                    }
-            else:
-                # For regular Python, run normally
-                result = subprocess.run(
-                    ["python3", temp_file_path],
-                    capture_output=True,
-                    text=True,
-                    timeout=10  # Set a timeout to prevent infinite loops
+            try:
+                result = await run_sandboxed(command, timeout, self.sandbox_limits, on_start=on_start,
+                                             on_output=on_output, stdin=stdin)
+            finally:
+                self.execution_processes.pop(execution_id, None)
+                self.registry.remove(execution_id)
+            return self._finish(result, execution_id, language)
+    
+    async def _run_pooled_python(self, code: str, execution_id: str, timeout: int = EXECUTION_TIMEOUT) -> Dict:
+        """Run a Python snippet on a warm interpreter from the pool"""
+        async with self._execution_slot():
+            try:
+                result = await self.python_pool.run(
+                    code, timeout, self.sandbox_limits.to_dict(),
+                    on_start=lambda pid: self.registry.add(execution_id, "execution", pid=pid)
                 )
-                return {
-                    "stdout": result.stdout,
-                    "stderr": result.stderr,
-                    "exit_code": result.returncode,
-                    "execution_id": execution_id,
-                    "is_streamlit": False
-                }
-        except subprocess.TimeoutExpired:
-            # Cleanup if process tracking was started for Streamlit
-            if 'is_streamlit' in locals() and is_streamlit and execution_id in self.streamlit_processes:
-                self.terminate_streamlit_process(execution_id)
+            finally:
+                self.registry.remove(execution_id)
+            return self._finish(result, execution_id, "python")
+    
+    def _finish(self, result: Dict, execution_id: str, language: str) -> Dict:
+        """Count the run and shape its result, keeping the resource usage it reported"""
+        result["execution_id"] = execution_id
+        if result.pop("timed_out", False):
+            self.timed_out_executions += 1
             return {
                 "stdout": "",
                 "stderr": "Execution timed out",
                 "exit_code": -1,
                 "execution_id": execution_id,
-                "is_streamlit": is_streamlit if 'is_streamlit' in locals() else False
+                "timed_out": True,
+                "peak_rss_kb": result.get("peak_rss_kb"),
+                "cpu_seconds": result.get("cpu_seconds"),
+                "limit_exceeded": None
             }
+        
+        self.completed_executions += 1
+        return finish_result(result, self.sandbox_limits, language)
+    
+    def _kill_process_group(self, process) -> None:
+        """Kill a process and everything it spawned"""
+        try:
+            os.killpg(os.getpgid(process.pid), signal.SIGKILL)
+        except (ProcessLookupError, PermissionError):
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+    
+    def cancel_execution(self, execution_id: str) -> bool:
+        """Cancel a queued or running execution by execution_id"""
+        task = self.execution_tasks.get(execution_id)
+        if task is None or task.done():
+            # It may be running under another worker; killing its process ends the run there
+            entry = self.registry.get(execution_id)
+            if entry is None or entry["kind"] != "execution" or not entry["pid"]:
+                return False
+            kill_process_group(entry["pid"])
+            self.cancelled_executions += 1
+            return True
+        
+        self._cancelled_executions.add(execution_id)
+        task.cancel()
+        return True
+    
+    def get_metrics(self) -> Dict:
+        """Return queue depth and execution counters"""
+        return {
+            "max_concurrent_executions": self.max_concurrent_executions,
+            "queued_executions": self.execution_slot_counts["queued"],
+            "active_executions": self.execution_slot_counts["active"],
+            "max_concurrent_streams": self.max_concurrent_streams,
+            "queued_streams": self.stream_slot_counts["queued"],
+            "active_streams": self.stream_slot_counts["active"],
+            "completed_executions": self.completed_executions,
+            "cancelled_executions": self.cancelled_executions,
+            "timed_out_executions": self.timed_out_executions,
+            "streamlit": self.streamlit_supervisor.get_metrics(),
+            "python_pool": self.python_pool.get_metrics() if self.python_pool else None,
+            "result_cache": self.result_cache.get_metrics() if self.result_cache else None
+        }
+    
+    async def execute_python(self, code: str, execution_id: str, session_id: Optional[str] = None) -> Dict:
+        """Execute Python code and return the result"""
+        is_streamlit = 'import streamlit' in code or 'from streamlit' in code
+        
+        if is_streamlit:
+            # We can't capture the web output, but the supervisor reports whether the app came up
+            return await self.streamlit_supervisor.run(code, execution_id, session_id)
+        
+        # Plain scripts go to a warm interpreter when the pool has live workers
+        if self.python_pool is not None and self.python_pool.available:
+            try:
+                result = await self._run_pooled_python(code, execution_id)
+            except PoolUnavailable as e:
+                logger.warning(f"Running Python in a fresh interpreter: {str(e)}")
+            else:
+                result["is_streamlit"] = False
+                return result
+        
+        with tempfile.NamedTemporaryFile(suffix=".py", delete=False) as temp_file:
+            temp_file.write(code.encode())
+            temp_file_path = temp_file.name
+        
+        try:
+            # For regular Python, run in a subprocess without blocking the event loop
+            result = await self._run_process(["python3", temp_file_path], execution_id, "python")
+            result["is_streamlit"] = False
+            return result
         finally:
-            # Don't delete the file immediately as the Streamlit process might still be using it
-            # We could implement a cleanup mechanism later
-            if not 'is_streamlit' in locals() or not is_streamlit:
-                os.unlink(temp_file_path)
+            os.unlink(temp_file_path)
     
-    def execute_javascript(self, code: str, execution_id: str) -> Dict:
+    async def execute_javascript(self, code: str, execution_id: str) -> Dict:
         """Execute JavaScript code using Node.js"""
         with tempfile.NamedTemporaryFile(suffix=".js", delete=False) as temp_file:
             temp_file.write(code.encode())
             temp_file_path = temp_file.name
         
         try:
-            result = subprocess.run(
-                ["node", temp_file_path],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            return {
-                "stdout": result.stdout,
-                "stderr": result.stderr,
-                "exit_code": result.returncode,
-                "execution_id": execution_id
-            }
-        except subprocess.TimeoutExpired:
-            return {
-                "stdout": "",
-                "stderr": "Execution timed out",
-                "exit_code": -1,
-                "execution_id": execution_id
-            }
+            return await self._run_process(["node", temp_file_path], execution_id, "javascript")
         finally:
             os.unlink(temp_file_path)
     
@@ -240,29 +412,6 @@ class ExecutionService:
             "status": "success"
         }
     
-    def terminate_streamlit_process(self, execution_id: str) -> bool:
-        """Terminate a Streamlit process by execution_id"""
-        if execution_id in self.streamlit_processes:
-            process = self.streamlit_processes[execution_id]
-            if process.poll() is None:  # Process is still running
-                try:
-                    # Try to terminate process group to ensure all child processes are killed
-                    os.killpg(os.getpgid(process.pid), signal.SIGTERM)
-                except (ProcessLookupError, PermissionError):
-                    # Fallback to just terminating the process
-                    process.terminate()
-                    
-                # Wait a bit for process to terminate
-                try:
-                    process.wait(timeout=3)
-                except subprocess.TimeoutExpired:
-                    # Force kill if it doesn't terminate
-                    try:
-                        os.killpg(os.getpgid(process.pid), signal.SIGKILL)
-                    except (ProcessLookupError, PermissionError):
-                        process.kill()
-            
-            # Remove from tracked processes
-            del self.streamlit_processes[execution_id]
-            return True
-        return False 
\ No newline at end of file
+    async def terminate_streamlit_process(self, execution_id: str) -> bool:
+        """Terminate a Streamlit app by execution_id and remove its files"""
+        return await self.streamlit_supervisor.terminate(execution_id)
@@ -0,0 +1,219 @@
+import asyncio
+import json
+import logging
+import os
+import signal
+from typing import Callable, Dict, List, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Path of the fork-server script each pool worker runs
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "python_worker.py")
+
+# Extra seconds to wait for a worker beyond the job timeout before giving up on it
+WORKER_GRACE_SECONDS = 5
+
+# Seconds a new worker gets to preload its modules and report ready
+WORKER_START_TIMEOUT = 15
+
+# Attempts to replace a retired worker, waiting twice as long after each failure
+WORKER_RESPAWN_ATTEMPTS = 5
+WORKER_RESPAWN_BACKOFF_SECONDS = 0.5
+
+class PoolUnavailable(RuntimeError):
+    """The pool has no worker to run a job on; run it some other way"""
+
+class PoolWorker:
+    """A warm Python fork-server process owned by the pool"""
+
+    def __init__(self, process):
+        self.process = process
+        self.jobs_completed = 0
+        self.rss_kb = 0
+        self.child_pid = None
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def read_message(self) -> Dict:
+        """Read one JSON line from the worker"""
+        line = await self.process.stdout.readline()
+        if not line:
+            raise RuntimeError("Python worker exited unexpectedly")
+        return json.loads(line)
+
+    def kill(self) -> None:
+        """Kill the worker together with any child it is running"""
+        for pgid in (self.child_pid, self.process.pid):
+            if pgid is None:
+                continue
+            try:
+                os.killpg(pgid, signal.SIGKILL)
+            except (ProcessLookupError, PermissionError):
+                pass
+
+class InterpreterPool:
+    """Pool of pre-forked Python workers that run snippets without interpreter start-up cost"""
+
+    def __init__(self, size: int = 4, max_jobs_per_worker: int = 100,
+                 max_worker_rss_mb: int = 256, preload_modules: Optional[List[str]] = None):
+        self.size = size
+        self.max_jobs_per_worker = max_jobs_per_worker
+        self.max_worker_rss_kb = max_worker_rss_mb * 1024
+        self.preload_modules = preload_modules or []
+
+        self.workers = []
+        self._idle_workers = None
+        self.running = False
+
+        # Counters exposed through get_metrics()
+        self.jobs_completed = 0
+        self.workers_recycled = 0
+
+    @property
+    def available(self) -> bool:
+        """Whether the pool is running and has at least one live worker"""
+        return self.running and any(worker.alive for worker in self.workers)
+
+    async def start(self) -> None:
+        """Spawn and warm up all workers; starts with as many as come up, fails if none do"""
+        if self.running:
+            return
+        self._idle_workers = asyncio.Queue()
+        workers = await asyncio.gather(*[self._spawn_worker() for _ in range(self.size)], return_exceptions=True)
+        failures = [worker for worker in workers if isinstance(worker, BaseException)]
+        if len(failures) == len(workers):
+            raise RuntimeError(f"No Python worker started: {failures[0]!r}")
+        for worker in workers:
+            if isinstance(worker, PoolWorker):
+                self._idle_workers.put_nowait(worker)
+        self.running = True
+        logger.info(f"Python interpreter pool started with {len(workers) - len(failures)} of {self.size} workers")
+
+    async def shutdown(self) -> None:
+        """Stop all workers"""
+        self.running = False
+        for worker in list(self.workers):
+            worker.kill()
+            await worker.process.wait()
+        self.workers = []
+        logger.info("Python interpreter pool stopped")
+
+    async def _spawn_worker(self) -> PoolWorker:
+        """Start a worker process and add it to the pool once its modules are preloaded"""
+        command = ["python3", WORKER_SCRIPT]
+        if self.preload_modules:
+            command += ["--preload", ",".join(self.preload_modules)]
+
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            start_new_session=True
+        )
+        worker = PoolWorker(process)
+        try:
+            message = await asyncio.wait_for(worker.read_message(), timeout=WORKER_START_TIMEOUT)
+            if not message.get("ready"):
+                raise RuntimeError(f"Python worker failed to start: {message}")
+        except BaseException:
+            # Hung, crashed or cancelled before it was ready; it never joins the pool
+            worker.kill()
+            await worker.process.wait()
+            raise
+        self.workers.append(worker)
+        return worker
+
+    async def _retire_worker(self, worker: PoolWorker) -> None:
+        """Kill a worker and put a fresh one in its place"""
+        worker.kill()
+        await worker.process.wait()
+        if worker in self.workers:
+            self.workers.remove(worker)
+        self.workers_recycled += 1
+
+        delay = WORKER_RESPAWN_BACKOFF_SECONDS
+        for attempt in range(1, WORKER_RESPAWN_ATTEMPTS + 1):
+            if not self.running:
+                return
+            try:
+                worker = await self._spawn_worker()
+            except Exception as e:
+                logger.warning(f"Failed to replace Python worker (attempt {attempt}): {str(e)}")
+                await asyncio.sleep(delay)
+                delay *= 2
+                continue
+            if not self.running:
+                # The pool shut down while the worker was starting
+                self.workers.remove(worker)
+                worker.kill()
+                await worker.process.wait()
+                return
+            self._idle_workers.put_nowait(worker)
+            return
+        logger.error(f"Gave up replacing a Python worker; {len(self.workers)} of {self.size} left")
+
+    async def run(self, code: str, timeout: float, limits: Optional[Dict] = None,
+                  on_start: Optional[Callable[[int], None]] = None) -> Dict:
+        """Run a snippet on an idle worker and return stdout, stderr, exit_code and its resource usage
+
+        limits are the sandbox limits (SandboxLimits.to_dict()) for the child.
+        on_start is called with the pid of the forked child running the snippet.
+        Raises PoolUnavailable when no worker frees up within the time a job may take.
+        """
+        worker = await self._acquire_worker(timeout + WORKER_GRACE_SECONDS)
+        healthy = False
+        try:
+            job = json.dumps({"code": code, "timeout": timeout, "limits": limits or {}}).encode() + b"\n"
+            worker.process.stdin.write(job)
+            await worker.process.stdin.drain()
+
+            started = await asyncio.wait_for(worker.read_message(), timeout=WORKER_GRACE_SECONDS)
+            worker.child_pid = started.get("pid")
+            if on_start is not None and worker.child_pid:
+                on_start(worker.child_pid)
+
+            result = await asyncio.wait_for(worker.read_message(), timeout=timeout + WORKER_GRACE_SECONDS)
+            worker.child_pid = None
+            worker.jobs_completed += 1
+            worker.rss_kb = result.pop("worker_rss_kb", 0)
+            self.jobs_completed += 1
+            healthy = True
+            return result
+        finally:
+            # A worker that was cancelled, hung or crashed mid-job is out of sync
+            # with the protocol, as is one that has done its share of jobs
+            if (not healthy or not worker.alive
+                    or worker.jobs_completed >= self.max_jobs_per_worker
+                    or worker.rss_kb > self.max_worker_rss_kb):
+                asyncio.ensure_future(self._retire_worker(worker))
+            else:
+                self._idle_workers.put_nowait(worker)
+
+    async def _acquire_worker(self, timeout: float) -> PoolWorker:
+        """Take a live idle worker, retiring any that died while idle"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while True:
+            if not self.available:
+                raise PoolUnavailable("Python interpreter pool has no live workers")
+            try:
+                worker = await asyncio.wait_for(self._idle_workers.get(), timeout=max(0, deadline - loop.time()))
+            except asyncio.TimeoutError:
+                raise PoolUnavailable("No Python worker became idle in time") from None
+            if worker.alive:
+                return worker
+            asyncio.ensure_future(self._retire_worker(worker))
+
+    def get_metrics(self) -> Dict:
+        """Return pool size, idle workers and job counters"""
+        return {
+            "running": self.running,
+            "size": self.size,
+            "live_workers": sum(1 for worker in self.workers if worker.alive),
+            "idle_workers": self._idle_workers.qsize() if self._idle_workers else 0,
+            "jobs_completed": self.jobs_completed,
+            "workers_recycled": self.workers_recycled
+        }
@@ -0,0 +1,180 @@
+import logging
+import os
+import shutil
+import signal
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Set
+
+from utils import sqlite_db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "memory" for a single worker or "sqlite" so every worker sees the processes
+# the others started (Streamlit apps, running executions)
+PROCESS_REGISTRY = os.getenv("PROCESS_REGISTRY", "memory")
+PROCESS_REGISTRY_PATH = os.getenv("PROCESS_REGISTRY_PATH", "processes.db")
+
+FIELDS = ("execution_id", "kind", "session_key", "port", "pid", "owner_pid", "script_dir", "last_used")
+
+def pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def kill_process_group(pid: Optional[int], sig: int = signal.SIGKILL) -> None:
+    """Signal a process started with start_new_session, together with its children"""
+    if not pid:
+        return
+    try:
+        os.killpg(pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+def stop_entry(entry: Dict, grace: float = 3.0) -> None:
+    """Stop a process another worker started and remove its files; blocks for up to grace seconds"""
+    pid = entry.get("pid")
+    if pid_alive(pid):
+        kill_process_group(pid, signal.SIGTERM)
+        deadline = time.monotonic() + grace
+        while pid_alive(pid) and time.monotonic() < deadline:
+            time.sleep(0.1)
+        kill_process_group(pid, signal.SIGKILL)
+    if entry.get("script_dir"):
+        shutil.rmtree(entry["script_dir"], ignore_errors=True)
+
+class MemoryProcessRegistry:
+    """Process table for a single worker"""
+
+    def __init__(self):
+        self._entries = {}
+
+    def add(self, execution_id: str, kind: str, pid: Optional[int] = None, session_key: Optional[str] = None,
+            port: Optional[int] = None, script_dir: Optional[str] = None) -> bool:
+        """Register a process; False if its port is already held"""
+        if port is not None and port in self.ports_in_use():
+            return False
+        self._entries[execution_id] = {
+            "execution_id": execution_id, "kind": kind, "session_key": session_key, "port": port,
+            "pid": pid, "owner_pid": os.getpid(), "script_dir": script_dir, "last_used": time.time()
+        }
+        return True
+
+    def set_pid(self, execution_id: str, pid: int) -> None:
+        if execution_id in self._entries:
+            self._entries[execution_id]["pid"] = pid
+
+    def touch(self, execution_id: str) -> None:
+        if execution_id in self._entries:
+            self._entries[execution_id]["last_used"] = time.time()
+
+    def get(self, execution_id: str) -> Optional[Dict]:
+        entry = self._entries.get(execution_id)
+        return dict(entry) if entry else None
+
+    def find_session(self, session_key: str) -> Optional[Dict]:
+        for entry in self._entries.values():
+            if entry["kind"] == "streamlit" and entry["session_key"] == session_key:
+                return dict(entry)
+        return None
+
+    def ports_in_use(self) -> Set[int]:
+        return {entry["port"] for entry in self._entries.values() if entry["port"] is not None}
+
+    def entries(self, kind: Optional[str] = None) -> List[Dict]:
+        return [dict(entry) for entry in self._entries.values() if kind is None or entry["kind"] == kind]
+
+    def owned_by(self, owner_pid: int) -> List[Dict]:
+        return [dict(entry) for entry in self._entries.values() if entry["owner_pid"] == owner_pid]
+
+    def remove(self, execution_id: str) -> None:
+        self._entries.pop(execution_id, None)
+
+class SQLiteProcessRegistry:
+    """Process table shared by every worker on the host through SQLite"""
+
+    def __init__(self, path: str = PROCESS_REGISTRY_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite_db.connect(path)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS processes ("
+                "execution_id TEXT PRIMARY KEY, kind TEXT NOT NULL, session_key TEXT, "
+                "port INTEGER UNIQUE, pid INTEGER, owner_pid INTEGER NOT NULL, "
+                "script_dir TEXT, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS processes_session ON processes (session_key)")
+
+    def _rows(self, query: str, params=()) -> List[Dict]:
+        with self._lock:
+            rows = self._conn.execute(f"SELECT {', '.join(FIELDS)} FROM processes {query}", params).fetchall()
+        return [dict(zip(FIELDS, row)) for row in rows]
+
+    def add(self, execution_id: str, kind: str, pid: Optional[int] = None, session_key: Optional[str] = None,
+            port: Optional[int] = None, script_dir: Optional[str] = None) -> bool:
+        """Register a process; False if its port is already held (the UNIQUE constraint makes this atomic)"""
+        # Re-registering an execution_id updates it in place; a port clash with
+        # another execution must raise, which INSERT OR REPLACE would not do
+        updates = ", ".join(f"{field} = excluded.{field}" for field in FIELDS[1:])
+        try:
+            with self._lock, self._conn:
+                self._conn.execute(
+                    f"INSERT INTO processes ({', '.join(FIELDS)}) VALUES (?, ?, ?, ?, ?, ?, ?, ?) "
+                    f"ON CONFLICT(execution_id) DO UPDATE SET {updates}",
+                    (execution_id, kind, session_key, port, pid, os.getpid(), script_dir, time.time())
+                )
+            return True
+        except sqlite3.IntegrityError:
+            return False
+
+    def set_pid(self, execution_id: str, pid: int) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE processes SET pid = ? WHERE execution_id = ?", (pid, execution_id))
+
+    def touch(self, execution_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE processes SET last_used = ? WHERE execution_id = ?", (time.time(), execution_id)
+            )
+
+    def get(self, execution_id: str) -> Optional[Dict]:
+        rows = self._rows("WHERE execution_id = ?", (execution_id,))
+        return rows[0] if rows else None
+
+    def find_session(self, session_key: str) -> Optional[Dict]:
+        rows = self._rows("WHERE kind = 'streamlit' AND session_key = ? ORDER BY last_used DESC LIMIT 1",
+                          (session_key,))
+        return rows[0] if rows else None
+
+    def ports_in_use(self) -> Set[int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT port FROM processes WHERE port IS NOT NULL").fetchall()
+        return {row[0] for row in rows}
+
+    def entries(self, kind: Optional[str] = None) -> List[Dict]:
+        if kind is None:
+            return self._rows("")
+        return self._rows("WHERE kind = ?", (kind,))
+
+    def owned_by(self, owner_pid: int) -> List[Dict]:
+        return self._rows("WHERE owner_pid = ?", (owner_pid,))
+
+    def remove(self, execution_id: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM processes WHERE execution_id = ?", (execution_id,))
+
+def create_process_registry():
+    """Build the process registry configured through the environment"""
+    if PROCESS_REGISTRY == "sqlite":
+        return SQLiteProcessRegistry()
+    return MemoryProcessRegistry()
@@ -0,0 +1,228 @@
+"""
+Fork-server worker for the Python interpreter pool.
+
+The worker is started once with a set of preloaded modules and then reads
+jobs as JSON lines on stdin. Every job is run in a freshly forked child with
+its own namespace, process group and scratch directory, so learner code can
+never pollute the warm interpreter. For each job the worker writes two JSON
+lines to stdout: {"pid": ...} when the child has started and the result dict
+once it has finished.
+
+This file is executed as a script by InterpreterPool and must only depend on
+the standard library.
+"""
+import argparse
+import importlib
+import json
+import linecache
+import os
+import resource
+import selectors
+import shutil
+import signal
+import sys
+import tempfile
+import time
+import traceback
+
+# Read size for draining the child's output pipes
+CHUNK_SIZE = 65536
+
+
+def preload_modules(module_names):
+    """Import modules up front so forked children get them for free"""
+    for name in module_names:
+        try:
+            importlib.import_module(name)
+        except Exception as e:
+            sys.stderr.write(f"python_worker: could not preload {name}: {e}\n")
+
+
+def apply_limits(limits):
+    """Set the sandbox rlimits (see services/execution/sandbox.py); 0 or missing means no limit"""
+    cpu_seconds = limits.get("cpu_seconds")
+    if cpu_seconds:
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 1))
+    for name, key in ((resource.RLIMIT_DATA, "memory_mb"), (resource.RLIMIT_FSIZE, "file_size_mb")):
+        if limits.get(key):
+            resource.setrlimit(name, (limits[key] << 20, limits[key] << 20))
+    if limits.get("max_processes"):
+        resource.setrlimit(resource.RLIMIT_NPROC, (limits["max_processes"], limits["max_processes"]))
+    resource.setrlimit(resource.RLIMIT_CORE, (0, 0))
+
+
+def run_child(code, stdout_fd, stderr_fd, scratch_dir, limits):
+    """Execute learner code in the forked child; never returns"""
+    os.setpgid(0, 0)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+
+    # Wire the output pipes onto stdout/stderr and detach stdin
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+
+    # Drop every inherited descriptor, including the pool's job channel
+    os.closerange(3, resource.getrlimit(resource.RLIMIT_NOFILE)[0])
+    os.chdir(scratch_dir)
+
+    # Register the source so tracebacks can show the offending lines
+    linecache.cache["main.py"] = (len(code), None, code.splitlines(True), "main.py")
+
+    # Limits last, so the worker's own set-up isn't counted against them
+    apply_limits(limits)
+
+    exit_code = 0
+    namespace = {"__name__": "__main__", "__builtins__": __builtins__}
+    try:
+        exec(compile(code, "main.py", "exec"), namespace)
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException:
+        # Skip this function's frame so the traceback starts at the learner's code
+        etype, value, tb = sys.exc_info()
+        traceback.print_exception(etype, value, tb.tb_next)
+        exit_code = 1
+    finally:
+        try:
+            sys.stdout.flush()
+            sys.stderr.flush()
+        except Exception:
+            pass
+    os._exit(exit_code & 0xFF)
+
+
+def collect_output(pid, stdout_r, stderr_r, timeout, max_output_bytes):
+    """
+    Drain the child's pipes until EOF or the deadline, keeping at most
+    max_output_bytes per pipe; a child that writes more is killed.
+    Return (stdout, stderr, timed_out, truncated).
+    """
+    buffers = {stdout_r: bytearray(), stderr_r: bytearray()}
+    truncated = False
+    selector = selectors.DefaultSelector()
+    for fd in buffers:
+        selector.register(fd, selectors.EVENT_READ)
+
+    deadline = time.monotonic() + timeout
+    timed_out = False
+    try:
+        while selector.get_map():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                timed_out = True
+                break
+            for key, _ in selector.select(remaining):
+                data = os.read(key.fd, CHUNK_SIZE)
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                buffer = buffers[key.fd]
+                room = max_output_bytes - len(buffer) if max_output_bytes else len(data)
+                buffer.extend(data[:room])
+                if len(data) > room and not truncated:
+                    truncated = True
+                    kill_group(pid)
+    finally:
+        selector.close()
+
+    if timed_out:
+        kill_group(pid)
+    return bytes(buffers[stdout_r]), bytes(buffers[stderr_r]), timed_out, truncated
+
+
+def kill_group(pid):
+    try:
+        os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def run_job(job, channel):
+    """Fork a child for one job and report its result over the channel"""
+    timeout = float(job.get("timeout", 10))
+    limits = job.get("limits") or {}
+    scratch_dir = tempfile.mkdtemp(prefix="pyworker-")
+    stdout_r, stdout_w = os.pipe()
+    stderr_r, stderr_w = os.pipe()
+
+    pid = os.fork()
+    if pid == 0:
+        os.close(stdout_r)
+        os.close(stderr_r)
+        run_child(job.get("code", ""), stdout_w, stderr_w, scratch_dir, limits)
+
+    os.close(stdout_w)
+    os.close(stderr_w)
+    write_message(channel, {"pid": pid})
+
+    try:
+        stdout, stderr, timed_out, truncated = collect_output(
+            pid, stdout_r, stderr_r, timeout, limits.get("max_output_bytes", 0)
+        )
+    finally:
+        os.close(stdout_r)
+        os.close(stderr_r)
+
+    # wait4 rather than waitpid, for the child's peak memory and CPU time
+    _, status, usage = os.wait4(pid, 0)
+    shutil.rmtree(scratch_dir, ignore_errors=True)
+
+    if timed_out:
+        exit_code = -1
+    elif os.WIFSIGNALED(status):
+        exit_code = -os.WTERMSIG(status)
+    else:
+        exit_code = os.WEXITSTATUS(status)
+
+    write_message(channel, {
+        "stdout": stdout.decode(errors="replace"),
+        "stderr": stderr.decode(errors="replace"),
+        "exit_code": exit_code,
+        "timed_out": timed_out,
+        "output_truncated": truncated,
+        "peak_rss_kb": usage.ru_maxrss,
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 4),
+        "worker_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    })
+
+
+def write_message(channel, message):
+    """Write one JSON line to the pool"""
+    channel.write(json.dumps(message).encode() + b"\n")
+    channel.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Python interpreter pool worker")
+    parser.add_argument("--preload", default="", help="Comma-separated modules to import at start-up")
+    args = parser.parse_args()
+
+    # Keep private handles on the job channel and point fds 0/1 elsewhere so
+    # stray output from preloaded modules can't corrupt the protocol
+    jobs = os.fdopen(os.dup(0), "rb")
+    channel = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+
+    preload_modules([name.strip() for name in args.preload.split(",") if name.strip()])
+
+    # Tell the pool we're warm
+    write_message(channel, {"ready": True})
+
+    for line in jobs:
+        if not line.strip():
+            continue
+        run_job(json.loads(line), channel)
+
+
+if __name__ == "__main__":
+    main()
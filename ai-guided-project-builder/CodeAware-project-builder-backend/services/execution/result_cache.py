@@ -0,0 +1,85 @@
+import hashlib
+import json
+import logging
+import os
+import re
+from typing import Dict, Optional
+
+from services.llm.response_cache import MemoryCacheBackend
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Set EXECUTION_CACHE_ENABLED=false to always execute
+EXECUTION_CACHE_ENABLED = os.getenv("EXECUTION_CACHE_ENABLED", "true").lower() == "true"
+EXECUTION_CACHE_TTL = int(os.getenv("EXECUTION_CACHE_TTL", "600"))
+EXECUTION_CACHE_MAX_ENTRIES = int(os.getenv("EXECUTION_CACHE_MAX_ENTRIES", "500"))
+
+# Results with more output than this aren't worth keeping in memory
+EXECUTION_CACHE_MAX_OUTPUT = int(os.getenv("EXECUTION_CACHE_MAX_OUTPUT", "65536"))
+
+# Languages whose runs are worth caching; HTML/CSS are just echoed back and
+# Streamlit apps are long-running servers
+CACHEABLE_LANGUAGES = {"python", "javascript"}
+
+# Code that reads the clock, randomness, the environment or the network can
+# print something different on every run, so its results are never cached
+NONDETERMINISTIC_PATTERN = re.compile(
+    r"\brandom\b|\buuid\b|\bsecrets\b|urandom|\btime\b|\bdatetime\b|\bDate\b|\bhrtime\b|performance\.now"
+    r"|\bgetenv\b|\benviron\b|process\.env|\bsocket\b|\burllib\b|\brequests\b|\bhttps?\b|\bfetch\b"
+    r"|\bthreading\b|\bmultiprocessing\b|\bsubprocess\b|\bstreamlit\b"
+)
+
+def is_cacheable(code: str, language: str) -> bool:
+    """Heuristic: only deterministic-looking Python and JavaScript runs are cached"""
+    return language in CACHEABLE_LANGUAGES and NONDETERMINISTIC_PATTERN.search(code) is None
+
+class ExecutionResultCache:
+    """Caches execution results keyed by a hash of language, code and stdin"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryCacheBackend(EXECUTION_CACHE_MAX_ENTRIES, EXECUTION_CACHE_TTL)
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    @staticmethod
+    def make_key(code: str, language: str, stdin: str = "") -> str:
+        digest = hashlib.sha256()
+        for part in (language, code, stdin):
+            digest.update(part.encode())
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Return a copy of the cached result, or None"""
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key: str, result: Dict) -> None:
+        """Keep a completed result; timeouts, cancellations and very large outputs are skipped"""
+        if result.get("exit_code") == -1 or result.get("cancelled"):
+            return
+        if len(result.get("stdout", "")) + len(result.get("stderr", "")) > EXECUTION_CACHE_MAX_OUTPUT:
+            return
+        stored = {name: value for name, value in result.items() if name != "execution_id"}
+        self.backend.set(key, json.dumps(stored))
+
+    def bypass(self) -> None:
+        """Count an execution that skipped the cache"""
+        self.bypassed += 1
+
+    def get_metrics(self) -> Dict:
+        """Return hit/miss counters and the current size"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.backend),
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
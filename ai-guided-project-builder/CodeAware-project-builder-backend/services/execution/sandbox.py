@@ -0,0 +1,288 @@
+import asyncio
+import logging
+import os
+import resource
+import signal
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from utils.metrics import REGISTRY
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# CPU seconds a learner program may use (the wall-clock EXECUTION_TIMEOUT still applies)
+SANDBOX_CPU_SECONDS = int(os.getenv("SANDBOX_CPU_SECONDS", "5"))
+
+# Memory a program may allocate, in MB. Enforced on the data segment rather than
+# the address space, since V8 reserves gigabytes of address space up front
+SANDBOX_MEMORY_MB = int(os.getenv("SANDBOX_MEMORY_MB", "512"))
+
+# Processes and threads. Linux counts this per user, so it must leave room for
+# everything else running as the server's user; it isn't enforced for root
+SANDBOX_MAX_PROCESSES = int(os.getenv("SANDBOX_MAX_PROCESSES", "512"))
+
+# Largest file a program may write, in MB
+SANDBOX_FILE_SIZE_MB = int(os.getenv("SANDBOX_FILE_SIZE_MB", "10"))
+
+# Output kept per stream; a program that writes more is stopped
+SANDBOX_MAX_OUTPUT_BYTES = int(os.getenv("SANDBOX_MAX_OUTPUT_BYTES", str(1024 * 1024)))
+
+# Threads that wait on programs where pidfd_open isn't available (Linux < 5.3);
+# each running program holds one for its whole run
+SANDBOX_REAPER_THREADS = int(os.getenv("SANDBOX_REAPER_THREADS", "32"))
+
+# Read size for draining output pipes
+CHUNK_SIZE = 65536
+
+# Output kept per stream when it is streamed to the caller instead, enough to
+# tell how the program stopped
+STREAM_TAIL_BYTES = 4096
+
+EXECUTION_PEAK_RSS = REGISTRY.histogram(
+    "execution_peak_rss_megabytes", "Peak resident memory of learner programs", ("language",),
+    (8, 16, 32, 64, 128, 256, 512, 1024))
+EXECUTION_CPU = REGISTRY.histogram(
+    "execution_cpu_seconds", "CPU time (user + system) used by learner programs", ("language",),
+    (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0))
+EXECUTION_LIMITS = REGISTRY.counter(
+    "execution_limits_exceeded_total", "Learner programs stopped by a sandbox limit", ("language", "limit"))
+
+LIMIT_MESSAGES = {
+    "cpu": "CPU time limit of {cpu_seconds}s exceeded",
+    "memory": "Memory limit of {memory_mb} MB exceeded",
+    "file_size": "File size limit of {file_size_mb} MB exceeded",
+    "output": "Output limit of {max_output_bytes} bytes exceeded"
+}
+
+# How a program that ran out of memory reports it
+MEMORY_ERRORS = ("MemoryError", "JavaScript heap out of memory", "Cannot allocate memory")
+
+class SandboxLimits:
+    """Resource limits applied to every learner program"""
+
+    def __init__(self, cpu_seconds: int = SANDBOX_CPU_SECONDS, memory_mb: int = SANDBOX_MEMORY_MB,
+                 max_processes: int = SANDBOX_MAX_PROCESSES, file_size_mb: int = SANDBOX_FILE_SIZE_MB,
+                 max_output_bytes: int = SANDBOX_MAX_OUTPUT_BYTES):
+        self.cpu_seconds = cpu_seconds
+        self.memory_mb = memory_mb
+        self.max_processes = max_processes
+        self.file_size_mb = file_size_mb
+        self.max_output_bytes = max_output_bytes
+
+    def to_dict(self) -> Dict:
+        return {
+            "cpu_seconds": self.cpu_seconds,
+            "memory_mb": self.memory_mb,
+            "max_processes": self.max_processes,
+            "file_size_mb": self.file_size_mb,
+            "max_output_bytes": self.max_output_bytes
+        }
+
+    def apply(self, pid: int) -> None:
+        """Set the rlimits on a running process. 0 means no limit"""
+        if self.cpu_seconds:
+            # SIGXCPU at the soft limit, SIGKILL a second later if it's ignored
+            resource.prlimit(pid, resource.RLIMIT_CPU, (self.cpu_seconds, self.cpu_seconds + 1))
+        if self.memory_mb:
+            resource.prlimit(pid, resource.RLIMIT_DATA, (self.memory_mb << 20, self.memory_mb << 20))
+        if self.max_processes:
+            resource.prlimit(pid, resource.RLIMIT_NPROC, (self.max_processes, self.max_processes))
+        if self.file_size_mb:
+            resource.prlimit(pid, resource.RLIMIT_FSIZE, (self.file_size_mb << 20, self.file_size_mb << 20))
+        resource.prlimit(pid, resource.RLIMIT_CORE, (0, 0))
+
+    def describe(self, limit: str) -> str:
+        return LIMIT_MESSAGES[limit].format(**self.to_dict())
+
+def limit_exceeded(exit_code: int, stderr: str, cpu_seconds: float, limits: SandboxLimits) -> Optional[str]:
+    """Which limit stopped a program, judged from how it exited"""
+    if exit_code == -signal.SIGXCPU or (exit_code == -signal.SIGKILL and limits.cpu_seconds
+                                         and cpu_seconds >= limits.cpu_seconds):
+        return "cpu"
+    if exit_code == -signal.SIGXFSZ:
+        return "file_size"
+    if exit_code != 0 and any(marker in stderr[-2000:] for marker in MEMORY_ERRORS):
+        return "memory"
+    return None
+
+def finish_result(result: Dict, limits: SandboxLimits, language: str) -> Dict:
+    """Name the limit a run hit, tell the learner in stderr, and record its resource use"""
+    limit = "output" if result.get("output_truncated") else None
+    limit = limit or limit_exceeded(result["exit_code"], result["stderr"], result.get("cpu_seconds", 0.0), limits)
+    result["limit_exceeded"] = limit
+    if limit is not None:
+        result["stderr"] = f"{result['stderr'].rstrip()}\nExecution stopped: {limits.describe(limit)}".lstrip()
+        EXECUTION_LIMITS.inc(language=language, limit=limit)
+    if "peak_rss_kb" in result:
+        EXECUTION_PEAK_RSS.observe(result["peak_rss_kb"] / 1024, language=language)
+        EXECUTION_CPU.observe(result["cpu_seconds"], language=language)
+    return result
+
+async def _capture(reader: asyncio.StreamReader, buffer: bytearray, limit: int, on_overflow: Callable[[], None],
+                   on_chunk: Optional[Callable[[bytes], Awaitable[None]]] = None) -> None:
+    """
+    Read a pipe to EOF, keeping at most limit bytes. With on_chunk, each chunk
+    is handed over as it arrives and only the tail is kept; the pipe isn't read
+    again until on_chunk returns, so a slow consumer stalls the writer.
+    """
+    received = 0
+    while True:
+        chunk = await reader.read(CHUNK_SIZE)
+        if not chunk:
+            return
+        room = limit - received
+        overflow = len(chunk) > room
+        if overflow:
+            chunk = chunk[:max(room, 0)]
+        received += len(chunk)
+        buffer.extend(chunk)
+        if on_chunk is not None:
+            del buffer[:-STREAM_TAIL_BYTES]
+            if chunk:
+                await on_chunk(chunk)
+        if overflow:
+            on_overflow()
+
+async def _pipe_reader(pipe) -> Tuple[asyncio.ReadTransport, asyncio.StreamReader]:
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader(limit=CHUNK_SIZE)
+    transport, _ = await loop.connect_read_pipe(lambda: asyncio.StreamReaderProtocol(reader), pipe)
+    return transport, reader
+
+async def _feed_stdin(process: subprocess.Popen, stdin: asyncio.Queue) -> None:
+    """Write queued bytes to the program's stdin until None is queued, then close it"""
+    loop = asyncio.get_running_loop()
+    transport, _ = await loop.connect_write_pipe(asyncio.Protocol, process.stdin)
+    try:
+        while True:
+            data = await stdin.get()
+            if data is None or transport.is_closing():
+                return
+            transport.write(data)
+    finally:
+        transport.close()
+
+_reaper = ThreadPoolExecutor(max_workers=SANDBOX_REAPER_THREADS, thread_name_prefix="sandbox-reaper")
+
+async def _wait4(pid: int) -> Tuple[int, int, resource.struct_rusage]:
+    """Reap a child with wait4, waiting for it to exit on a pidfd rather than in a thread"""
+    try:
+        pidfd = os.pidfd_open(pid)
+    except (AttributeError, OSError):
+        return await asyncio.get_running_loop().run_in_executor(_reaper, os.wait4, pid, 0)
+
+    loop = asyncio.get_running_loop()
+    exited = loop.create_future()
+    loop.add_reader(pidfd, lambda: exited.done() or exited.set_result(None))
+    try:
+        await exited
+    finally:
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+    return os.wait4(pid, 0)
+
+def kill_group(process: subprocess.Popen) -> None:
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+async def run_sandboxed(command: List[str], timeout: float, limits: SandboxLimits,
+                        on_start: Optional[Callable[[subprocess.Popen], None]] = None,
+                        on_output: Optional[Callable[[str, bytes], Awaitable[None]]] = None,
+                        stdin: Optional[asyncio.Queue] = None) -> Dict:
+    """
+    Run a command under the sandbox limits in its own process group, streaming
+    its output into capped buffers. Returns stdout, stderr, exit_code,
+    timed_out, output_truncated, peak_rss_kb and cpu_seconds.
+
+    With on_output, output is passed on as on_output("stdout" | "stderr", chunk)
+    while the program runs and stdout/stderr in the result only hold the last
+    STREAM_TAIL_BYTES. With stdin, bytes put on the queue are written to the
+    program's stdin and None closes it; otherwise stdin is /dev/null.
+
+    The process is reaped with wait4 for its resource usage, so it is started
+    with Popen rather than asyncio's subprocess support, whose child watcher
+    would reap it first. Limits are set with prlimit right after the spawn
+    rather than in a preexec_fn, which isn't safe in a process with threads;
+    the runtime's own start-up is far longer than that gap.
+    """
+    loop = asyncio.get_running_loop()
+    process = subprocess.Popen(
+        command,
+        stdin=subprocess.DEVNULL if stdin is None else subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True  # Own process group so children die with it
+    )
+    reaped = asyncio.ensure_future(_wait4(process.pid))
+    try:
+        limits.apply(process.pid)
+    except ProcessLookupError:
+        # Already exited; it's reaped below
+        pass
+    if on_start is not None:
+        on_start(process)
+
+    overflowed = []
+    def on_overflow() -> None:
+        if not overflowed:
+            overflowed.append(True)
+            kill_group(process)
+
+    def forward(stream: str) -> Optional[Callable[[bytes], Awaitable[None]]]:
+        if on_output is None:
+            return None
+        return lambda chunk: on_output(stream, chunk)
+
+    stdout, stderr = bytearray(), bytearray()
+    timed_out = False
+    deadline = loop.time() + timeout
+    pipes = []
+    captures = None
+    feeder = asyncio.ensure_future(_feed_stdin(process, stdin)) if stdin is not None else None
+    try:
+        pipes = [await _pipe_reader(process.stdout), await _pipe_reader(process.stderr)]
+        captures = asyncio.gather(
+            _capture(pipes[0][1], stdout, limits.max_output_bytes, on_overflow, forward("stdout")),
+            _capture(pipes[1][1], stderr, limits.max_output_bytes, on_overflow, forward("stderr"))
+        )
+        await asyncio.wait_for(captures, timeout=timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_group(process)
+    except BaseException:
+        # Cancelled, or the output consumer failed
+        kill_group(process)
+        if captures is not None:
+            captures.cancel()
+            # Mark the outcome as seen so asyncio doesn't log it
+            captures.add_done_callback(lambda future: future.cancelled() or future.exception())
+        raise
+    finally:
+        if feeder is not None:
+            feeder.cancel()
+        for transport, _ in pipes:
+            transport.close()
+
+    # A program can close its output and keep running
+    try:
+        _, status, usage = await asyncio.wait_for(asyncio.shield(reaped), timeout=max(deadline - loop.time(), 0.1))
+    except asyncio.TimeoutError:
+        timed_out = True
+        kill_group(process)
+        _, status, usage = await reaped
+    # Popen must not try to reap the process again
+    process.returncode = os.waitstatus_to_exitcode(status)
+
+    return {
+        "stdout": stdout.decode(errors="replace"),
+        "stderr": stderr.decode(errors="replace"),
+        "exit_code": process.returncode,
+        "timed_out": timed_out,
+        "output_truncated": bool(overflowed),
+        "peak_rss_kb": usage.ru_maxrss,
+        "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 4)
+    }
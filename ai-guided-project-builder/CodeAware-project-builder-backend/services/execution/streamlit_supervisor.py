@@ -0,0 +1,373 @@
+import asyncio
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+import httpx
+
+from services.execution.process_registry import MemoryProcessRegistry, pid_alive, stop_entry
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def _parse_port_range(value: str) -> Tuple[int, int]:
+    """Parse a "first-last" port range"""
+    first, _, last = value.partition("-")
+    return int(first), int(last or first)
+
+# Ports handed out to Streamlit apps (inclusive); must match the published ports
+STREAMLIT_PORT_RANGE = _parse_port_range(os.getenv("STREAMLIT_PORT_RANGE", "8501-8520"))
+
+# Apps nobody has re-run for this many seconds are shut down
+STREAMLIT_IDLE_TTL = int(os.getenv("STREAMLIT_IDLE_TTL", "900"))
+
+# Upper bound on live apps; the least recently used app is evicted beyond it
+STREAMLIT_MAX_APPS = int(os.getenv("STREAMLIT_MAX_APPS", "10"))
+
+# How long to wait for a new app to answer its health check
+STREAMLIT_STARTUP_TIMEOUT = int(os.getenv("STREAMLIT_STARTUP_TIMEOUT", "20"))
+
+# Seconds between idle sweeps
+STREAMLIT_REAP_INTERVAL = 30
+
+class StreamlitApp:
+    """A running `streamlit run` process serving one learner's script"""
+
+    def __init__(self, execution_id: str, session_key: str, port: int, script_dir: str):
+        self.execution_id = execution_id
+        self.session_key = session_key
+        self.port = port
+        self.script_dir = script_dir
+        self.script_path = os.path.join(script_dir, "app.py")
+        self.log_path = os.path.join(script_dir, "streamlit.log")
+        self.process = None
+
+        # Resolves to whether the app came up healthy; runs reusing a starting app wait on it
+        self.ready = asyncio.get_running_loop().create_future()
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.returncode is None
+
+    @property
+    def starting(self) -> bool:
+        return not self.ready.done()
+
+    def write_script(self, code: str) -> None:
+        """Write the learner's code; with runOnSave a live app reruns it"""
+        with open(self.script_path, "w") as script_file:
+            script_file.write(code)
+
+    def read_log(self) -> str:
+        """Return whatever the process has logged so far"""
+        try:
+            with open(self.log_path, "r", errors="replace") as log_file:
+                return log_file.read()
+        except OSError:
+            return ""
+
+class StreamlitSupervisor:
+    """Allocates ports to Streamlit apps, reuses them per session and reaps idle ones"""
+
+    def __init__(self, port_range: Tuple[int, int] = STREAMLIT_PORT_RANGE,
+                 idle_ttl: int = STREAMLIT_IDLE_TTL, max_apps: int = STREAMLIT_MAX_APPS,
+                 startup_timeout: int = STREAMLIT_STARTUP_TIMEOUT, registry=None):
+        self.port_range = port_range
+        self.idle_ttl = idle_ttl
+        self.max_apps = max_apps
+        self.startup_timeout = startup_timeout
+
+        # Apps this worker started, keyed by execution_id, plus an index by session
+        self.apps = {}
+        self.apps_by_session = {}
+
+        # Ports, sessions and last use of every worker's apps
+        self.registry = registry or MemoryProcessRegistry()
+
+        self._lock = asyncio.Lock()
+        self._reaper_task = None
+
+        # Counters exposed through get_metrics()
+        self.apps_started = 0
+        self.apps_reused = 0
+        self.apps_reaped = 0
+
+    async def start(self) -> None:
+        """Start the background idle reaper"""
+        if self._reaper_task is None:
+            self._reaper_task = asyncio.ensure_future(self._reap_forever())
+
+    async def shutdown(self) -> None:
+        """Stop the reaper and every live app"""
+        if self._reaper_task is not None:
+            self._reaper_task.cancel()
+            self._reaper_task = None
+        for execution_id in list(self.apps):
+            await self.terminate(execution_id)
+
+    async def run(self, code: str, execution_id: str, session_id: Optional[str] = None) -> Dict:
+        """Serve the code as a Streamlit app, hot-swapping the script of a live app when possible"""
+        session_key = session_id or execution_id
+
+        reused = None
+        async with self._lock:
+            app = self._live_app_for_session(session_key)
+            if app is not None:
+                app.write_script(code)
+                self.registry.touch(app.execution_id)
+                logger.debug(f"Reusing Streamlit app {app.execution_id} on port {app.port}")
+                reused = (app.execution_id, app.port, asyncio.shield(app.ready))
+            else:
+                # The session's app may be running, or still starting, under another worker
+                entry = self.registry.find_session(session_key)
+                if entry is not None and entry["execution_id"] not in self.apps and self._entry_alive(entry):
+                    with open(os.path.join(entry["script_dir"], "app.py"), "w") as script_file:
+                        script_file.write(code)
+                    self.registry.touch(entry["execution_id"])
+                    logger.debug(f"Reusing Streamlit app {entry['execution_id']} of worker {entry['owner_pid']}")
+                    other_id = entry["execution_id"]
+                    reused = (other_id, entry["port"], self._wait_until_ready(
+                        entry["port"], lambda: self._entry_alive(self.registry.get(other_id))))
+                else:
+                    await self._make_room()
+                    app = StreamlitApp(execution_id, session_key, 0, tempfile.mkdtemp(prefix="streamlit-"))
+                    app.port = self._claim_port(app)
+                    if app.port is None:
+                        shutil.rmtree(app.script_dir, ignore_errors=True)
+                        return self._error_result(execution_id, "No free port available for the Streamlit app")
+
+                    # Registered before it starts, so further runs of the session wait for it
+                    app.write_script(code)
+                    self.apps[execution_id] = app
+                    self.apps_by_session[session_key] = execution_id
+
+        # A reused app may still be starting; wait for it outside the lock
+        if reused is not None:
+            return await self._reused_result(*reused)
+
+        ready = False
+        try:
+            await self._spawn(app)
+            if self.apps.get(execution_id) is not app:
+                # Evicted or terminated while it was being spawned
+                await self._stop_app(app)
+                return self._error_result(execution_id, "Streamlit app was stopped while starting")
+            self.registry.set_pid(execution_id, app.process.pid)
+            ready = await self._wait_until_ready(app.port, lambda: app.alive)
+        except Exception as e:
+            await self.terminate(execution_id)
+            return self._error_result(execution_id, f"Error running Streamlit app: {str(e)}")
+        finally:
+            if not app.ready.done():
+                app.ready.set_result(ready)
+
+        if ready:
+            self.apps_started += 1
+            return self._success_result(app.execution_id, app.port)
+
+        # Either the process died on start-up or it never became healthy
+        exit_code = app.process.returncode if not app.alive else -1
+        stderr = app.read_log() if not app.alive else "Timeout while starting Streamlit app"
+        await self.terminate(execution_id)
+        return self._error_result(execution_id, stderr, exit_code)
+
+    async def _reused_result(self, execution_id: str, port: int, ready: Awaitable[bool]) -> Dict:
+        """Report a reused app as running once it is healthy"""
+        if not await ready:
+            return self._error_result(execution_id, "The session's Streamlit app failed to start")
+        self.apps_reused += 1
+        return self._success_result(execution_id, port)
+
+    def _live_app_for_session(self, session_key: str) -> Optional[StreamlitApp]:
+        """Return the session's app if it is starting or its process is still running"""
+        execution_id = self.apps_by_session.get(session_key)
+        app = self.apps.get(execution_id) if execution_id else None
+        if app is not None and (app.starting or app.alive):
+            return app
+        return None
+
+    def _entry_alive(self, entry: Optional[Dict]) -> bool:
+        """Whether another worker's app is running, or starting while that worker is"""
+        if entry is None:
+            return False
+        return pid_alive(entry["pid"]) if entry["pid"] else pid_alive(entry["owner_pid"])
+
+    async def _make_room(self) -> None:
+        """Evict least recently used apps, across all workers, until a new one fits"""
+        entries = self.registry.entries("streamlit")
+        while len(entries) >= self.max_apps:
+            oldest = min(entries, key=lambda entry: entry["last_used"])
+            logger.info(f"Evicting Streamlit app {oldest['execution_id']} to stay under {self.max_apps} apps")
+            await self.terminate(oldest["execution_id"])
+            entries.remove(oldest)
+
+    def _claim_port(self, app: StreamlitApp) -> Optional[int]:
+        """Register the app on a port in the range that no app holds and nothing else is bound to"""
+        first, last = self.port_range
+        for port in range(first, last + 1):
+            if port in self.registry.ports_in_use():
+                continue
+            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+                try:
+                    probe.bind(("0.0.0.0", port))
+                except OSError:
+                    continue
+            # Another worker may have claimed the port since we looked
+            if self.registry.add(app.execution_id, "streamlit", session_key=app.session_key,
+                                 port=port, script_dir=app.script_dir):
+                return port
+        return None
+
+    async def _spawn(self, app: StreamlitApp) -> None:
+        """Start the streamlit process for an app"""
+        streamlit_cmd = [
+            "streamlit", "run",
+            app.script_path,
+            "--server.address", "0.0.0.0",
+            "--server.port", str(app.port),
+            "--server.headless", "true",
+            "--server.runOnSave", "true",
+            "--browser.serverAddress", "0.0.0.0",
+            "--browser.gatherUsageStats", "false"
+        ]
+        with open(app.log_path, "wb") as log_file:
+            app.process = await asyncio.create_subprocess_exec(
+                *streamlit_cmd,
+                stdout=log_file,
+                stderr=asyncio.subprocess.STDOUT,
+                start_new_session=True  # Own process group so children die with it
+            )
+
+    async def _wait_until_ready(self, port: int, alive: Callable[[], bool]) -> bool:
+        """Poll an app's health endpoint until it answers, dies or the start-up timeout passes"""
+        deadline = time.monotonic() + self.startup_timeout
+        health_urls = [
+            f"http://127.0.0.1:{port}/_stcore/health",
+            f"http://127.0.0.1:{port}/healthz"  # Streamlit < 1.18
+        ]
+        async with httpx.AsyncClient(timeout=1.0) as client:
+            while time.monotonic() < deadline:
+                if not alive():
+                    return False
+                for url in health_urls:
+                    try:
+                        response = await client.get(url)
+                        if response.status_code == 200:
+                            return True
+                    except httpx.HTTPError:
+                        pass
+                await asyncio.sleep(0.25)
+        return False
+
+    async def terminate(self, execution_id: str) -> bool:
+        """Stop an app and remove its files, whichever worker started it"""
+        app = self.apps.get(execution_id)
+        if app is not None:
+            await self._stop_app(app)
+            return True
+
+        entry = self.registry.get(execution_id)
+        if entry is None or entry["kind"] != "streamlit":
+            return False
+        await asyncio.to_thread(stop_entry, entry)
+        self.registry.remove(execution_id)
+        return True
+
+    async def _stop_app(self, app: StreamlitApp) -> None:
+        """Terminate the app's process group and clean up its directory"""
+        self.apps.pop(app.execution_id, None)
+        self.registry.remove(app.execution_id)
+        if self.apps_by_session.get(app.session_key) == app.execution_id:
+            del self.apps_by_session[app.session_key]
+        if app.starting:
+            app.ready.set_result(False)
+
+        if app.alive:
+            try:
+                os.killpg(os.getpgid(app.process.pid), signal.SIGTERM)
+            except (ProcessLookupError, PermissionError):
+                app.process.terminate()
+            try:
+                await asyncio.wait_for(app.process.wait(), timeout=3)
+            except asyncio.TimeoutError:
+                # Force kill if it doesn't terminate
+                try:
+                    os.killpg(os.getpgid(app.process.pid), signal.SIGKILL)
+                except (ProcessLookupError, PermissionError):
+                    app.process.kill()
+                await app.process.wait()
+
+        shutil.rmtree(app.script_dir, ignore_errors=True)
+
+    async def reap_idle(self) -> int:
+        """Stop apps idle longer than the TTL or whose process has exited, and apps left by dead workers"""
+        cutoff = time.time() - self.idle_ttl
+        reaped = 0
+        for entry in self.registry.entries("streamlit"):
+            app = self.apps.get(entry["execution_id"])
+            if app is not None:
+                # Another worker may have used the app since, so go by the registry's last use
+                if app.starting or (app.alive and entry["last_used"] >= cutoff):
+                    continue
+                logger.info(f"Reaping Streamlit app {app.execution_id} on port {app.port}")
+                await self._stop_app(app)
+            elif not pid_alive(entry["owner_pid"]):
+                logger.info(f"Reaping Streamlit app {entry['execution_id']} left by worker {entry['owner_pid']}")
+                await asyncio.to_thread(stop_entry, entry)
+                self.registry.remove(entry["execution_id"])
+            else:
+                continue
+            reaped += 1
+
+        # Apps whose registry entry was removed by another worker
+        for app in [app for app in self.apps.values() if not app.starting and not app.alive]:
+            await self._stop_app(app)
+            reaped += 1
+
+        self.apps_reaped += reaped
+        return reaped
+
+    async def _reap_forever(self) -> None:
+        while True:
+            await asyncio.sleep(STREAMLIT_REAP_INTERVAL)
+            try:
+                await self.reap_idle()
+            except Exception as e:
+                logger.error(f"Error reaping Streamlit apps: {str(e)}")
+
+    def _success_result(self, execution_id: str, port: int) -> Dict:
+        return {
+            "stdout": f"Streamlit app is running successfully at http://localhost:{port}",
+            "stderr": "",
+            "exit_code": 0,
+            "execution_id": execution_id,
+            "is_streamlit": True,
+            "streamlit_url": f"http://localhost:{port}",
+            "streamlit_port": port
+        }
+
+    def _error_result(self, execution_id: str, stderr: str, exit_code: int = -1) -> Dict:
+        return {
+            "stdout": "",
+            "stderr": stderr,
+            "exit_code": exit_code,
+            "execution_id": execution_id,
+            "is_streamlit": True,
+            "streamlit_error": True
+        }
+
+    def get_metrics(self) -> Dict:
+        """Return live app and lifecycle counters"""
+        return {
+            "live_apps": len(self.apps),
+            "all_workers_apps": len(self.registry.entries("streamlit")),
+            "max_apps": self.max_apps,
+            "apps_started": self.apps_started,
+            "apps_reused": self.apps_reused,
+            "apps_reaped": self.apps_reaped
+        }
@@ -0,0 +1 @@
+# LLM services package initialization 
\ No newline at end of file
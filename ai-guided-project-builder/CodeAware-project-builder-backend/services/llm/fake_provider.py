@@ -0,0 +1,249 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import re
+from typing import Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from services.llm.providers import current_template, prompt_key
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# JSONL file of {template, prompt_key, response} lines (as written with
+# LLM_RECORD_PATH) to replay; prompts without a recording get a synthesized response
+LLM_FAKE_RECORDINGS = os.getenv("LLM_FAKE_RECORDINGS", "")
+
+# Time to first token is lognormal with this median in seconds and this shape
+LLM_FAKE_LATENCY = float(os.getenv("LLM_FAKE_LATENCY", "0.8"))
+LLM_FAKE_LATENCY_SIGMA = float(os.getenv("LLM_FAKE_LATENCY_SIGMA", "0.5"))
+
+# Output speed in tokens per second, normally distributed with a 20% spread
+LLM_FAKE_TOKENS_PER_SECOND = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "80"))
+
+# Fraction of calls that fail with a retryable 503, to exercise the retry path
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", "0"))
+
+# Seeds the latencies and injected errors; responses depend only on the prompt
+LLM_FAKE_SEED = int(os.getenv("LLM_FAKE_SEED", "0"))
+
+# Rough characters per token, for usage counts and stream chunking
+CHARS_PER_TOKEN = 4
+STREAM_CHUNK_TOKENS = 20
+
+class FakeUsage:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+class FakeResponse:
+    """The parts of a Gemini response the clients read: text and usage"""
+
+    def __init__(self, text: str, usage: Optional[FakeUsage]):
+        self.text = text
+        self.usage_metadata = usage
+
+class FakeStream:
+    """A streamed response whose chunks arrive at the modelled token rate; the last carries the usage"""
+
+    def __init__(self, chunks: List[str], usage: FakeUsage, seconds_per_chunk: float):
+        self.chunks = chunks
+        self.usage = usage
+        self.seconds_per_chunk = seconds_per_chunk
+
+    async def __aiter__(self):
+        for index, text in enumerate(self.chunks):
+            if index:
+                await asyncio.sleep(self.seconds_per_chunk)
+            yield FakeResponse(text, self.usage if index == len(self.chunks) - 1 else None)
+
+class FakeChat:
+    def __init__(self, model: "FakeModel", history: Optional[List[Dict]]):
+        self.model = model
+        self.history = history or []
+
+    async def send_message_async(self, message: str, stream: bool = False):
+        context = sum(len(str(part)) for turn in self.history for part in turn.get("parts", []))
+        return await self.model.provider.respond(message, stream, context)
+
+class FakeModel:
+    """Stands in for genai.GenerativeModel"""
+
+    def __init__(self, provider: "FakeProvider", model_name: str, generation_config: Optional[Dict] = None,
+                 system_instruction: Optional[str] = None):
+        self.provider = provider
+        self.model_name = f"models/{model_name}"
+        self._generation_config = generation_config or {}
+        self._system_instruction = system_instruction or ""
+
+    async def generate_content_async(self, prompt: str, stream: bool = False):
+        return await self.provider.respond(prompt, stream)
+
+    def start_chat(self, history: Optional[List[Dict]] = None) -> FakeChat:
+        return FakeChat(self, history)
+
+class FakeProvider:
+    """
+    Offline stand-in for Gemini for load tests: replays recorded responses, or
+    synthesizes ones that parse like the real thing, after a modelled delay.
+    """
+
+    def __init__(self, recordings_path: str = LLM_FAKE_RECORDINGS, seed: int = LLM_FAKE_SEED,
+                 latency: float = LLM_FAKE_LATENCY, latency_sigma: float = LLM_FAKE_LATENCY_SIGMA,
+                 tokens_per_second: float = LLM_FAKE_TOKENS_PER_SECOND, error_rate: float = LLM_FAKE_ERROR_RATE):
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._by_key: Dict[str, str] = {}
+        self._by_template: Dict[str, List[str]] = {}
+        self.calls = 0
+        self.replayed = 0
+        if recordings_path:
+            self._load(recordings_path)
+
+    def _load(self, path: str) -> None:
+        with open(path, encoding="utf-8") as recordings:
+            for line in recordings:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry.get("prompt_key"):
+                    self._by_key[entry["prompt_key"]] = entry["response"]
+                self._by_template.setdefault(entry.get("template", "unknown"), []).append(entry["response"])
+        logger.info(f"Loaded {len(self._by_key)} recorded LLM responses from {path}")
+
+    def model(self, model_name: str, generation_config: Optional[Dict] = None,
+              system_instruction: Optional[str] = None) -> FakeModel:
+        return FakeModel(self, model_name, generation_config, system_instruction)
+
+    def response_text(self, template: str, prompt: str) -> str:
+        """The recorded response for this prompt, else one recorded for the template, else a synthesized one"""
+        key = prompt_key(prompt)
+        if key in self._by_key:
+            self.replayed += 1
+            return self._by_key[key]
+        rng = random.Random(key)
+        if self._by_template.get(template):
+            self.replayed += 1
+            return rng.choice(self._by_template[template])
+        synthesize = SYNTHESIZERS.get(template, synthesize_text)
+        return synthesize(prompt, rng)
+
+    async def respond(self, prompt: str, stream: bool = False, context_chars: int = 0):
+        self.calls += 1
+        template = current_template.get()
+        first_token = self._rng.lognormvariate(math.log(self.latency), self.latency_sigma) if self.latency > 0 else 0
+        rate = max(1.0, self._rng.gauss(self.tokens_per_second, self.tokens_per_second * 0.2))
+        if self._rng.random() < self.error_rate:
+            await asyncio.sleep(first_token)
+            raise google_exceptions.ServiceUnavailable("Injected failure from the fake LLM provider")
+
+        text = self.response_text(template, prompt)
+        output_tokens = max(1, len(text) // CHARS_PER_TOKEN)
+        usage = FakeUsage((len(prompt) + context_chars) // CHARS_PER_TOKEN, output_tokens)
+        if not stream:
+            await asyncio.sleep(first_token + output_tokens / rate)
+            return FakeResponse(text, usage)
+
+        await asyncio.sleep(first_token)
+        size = STREAM_CHUNK_TOKENS * CHARS_PER_TOKEN
+        chunks = [text[start:start + size] for start in range(0, len(text), size)] or [""]
+        return FakeStream(chunks, usage, STREAM_CHUNK_TOKENS / rate)
+
+# Synthesized responses: enough varied text to model output length, in the
+# shape each prompt template asks for
+
+SUBJECTS = ("The function", "Your code", "This step", "The layout", "The event listener", "The data",
+            "Each element", "The page", "The helper", "The state", "The input", "The loop")
+VERBS = ("updates", "renders", "validates", "stores", "reads", "returns", "handles", "displays", "checks", "builds")
+OBJECTS = ("the user's input", "the list of items", "the main container", "the form fields", "the chart",
+           "the current score", "each row", "the page title", "the saved settings", "the results")
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.choice(OBJECTS)}."
+
+def _text(rng: random.Random, low: int, high: int) -> str:
+    return " ".join(_sentence(rng) for _ in range(rng.randint(low, high)))
+
+def _number(pattern: str, prompt: str, default: int) -> int:
+    match = re.search(pattern, prompt)
+    return int(match.group(1)) if match else default
+
+def _language(prompt: str) -> str:
+    return "python" if re.search(r"python|streamlit", prompt, re.IGNORECASE) else "html"
+
+def _quiz_questions(rng: random.Random, count: int) -> List[Dict]:
+    questions = []
+    for index in range(1, count + 1):
+        options = [f"{letter}) {_sentence(rng)}" for letter in "ABCD"]
+        questions.append({
+            "question_id": f"q{index}",
+            "question_text": f"Which statement about this step is correct? {_sentence(rng)}",
+            "options": options,
+            "correct_answer": rng.choice(options)
+        })
+    return questions
+
+def _step(rng: random.Random, number: int, language: str) -> Dict:
+    if language == "python":
+        code = f'import streamlit as st\n\nst.title("Step {number}")\nvalue = st.text_input("Value")\nst.write(value)\n'
+    else:
+        code = f'<!DOCTYPE html>\n<html>\n<body>\n  <h1>Step {number}</h1>\n  <div id="app"></div>\n</body>\n</html>\n'
+    return {
+        "step_number": number,
+        "title": f"Step {number}: {rng.choice(VERBS).capitalize()} {rng.choice(OBJECTS)}",
+        "description": _text(rng, 6, 14),
+        "language": language,
+        "code": code,
+        "expected_outcome": _text(rng, 1, 2),
+        "quiz_questions": _quiz_questions(rng, 2)
+    }
+
+def synthesize_project_plan(prompt: str, rng: random.Random) -> str:
+    return json.dumps({
+        "project_title": f"{rng.choice(OBJECTS).capitalize()} tracker",
+        "project_description": _text(rng, 2, 4),
+        "total_steps": _number(r"around (\d+)", prompt, 5),
+        "steps": [_step(rng, 1, _language(prompt))]
+    })
+
+def synthesize_next_step(prompt: str, rng: random.Random) -> str:
+    step = _step(rng, _number(r"provide step (\d+)", prompt, 2), _language(prompt))
+    step["feedback"] = _text(rng, 3, 6)
+    return json.dumps(step)
+
+def synthesize_feedback(prompt: str, rng: random.Random) -> str:
+    return json.dumps({"feedback": _text(rng, 3, 6)})
+
+def synthesize_quiz_questions(prompt: str, rng: random.Random) -> str:
+    return json.dumps(_quiz_questions(rng, 3))
+
+def synthesize_conversation(prompt: str, rng: random.Random) -> str:
+    progress = _number(r"Target progress: (\d+)%", prompt, 10)
+    return (f"<progress>{progress}%</progress>\n<evaluation>{_sentence(rng)}</evaluation>\n\n"
+            f"{_text(rng, 1, 3)} What should happen to {rng.choice(OBJECTS)} when it is empty?")
+
+def synthesize_final_algorithm(prompt: str, rng: random.Random) -> str:
+    steps = "\n".join(f"{index}. {_sentence(rng)}" for index in range(1, rng.randint(6, 12)))
+    return f"## Algorithm\n\n{steps}\n\nWORKFLOW_COMPLETE"
+
+def synthesize_text(prompt: str, rng: random.Random) -> str:
+    return "\n\n".join(_text(rng, 3, 6) for _ in range(rng.randint(2, 4)))
+
+SYNTHESIZERS: Dict[str, Callable[[str, random.Random], str]] = {
+    "project_plan": synthesize_project_plan,
+    "next_step": synthesize_next_step,
+    "next_step_draft": synthesize_next_step,
+    "next_step_feedback": synthesize_feedback,
+    "quiz_questions": synthesize_quiz_questions,
+    "algorithm_conversation": synthesize_conversation,
+    "algorithm_final": synthesize_final_algorithm,
+    "ask_question": synthesize_text
+}
@@ -0,0 +1,242 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from google.api_core import exceptions as google_exceptions
+
+from services.llm.providers import create_llm_provider, create_response_recorder, current_template
+from utils.metrics import (LLM_COALESCED, LLM_FIRST_TOKEN, LLM_INPUT_TOKENS, LLM_LATENCY, LLM_OUTPUT_TOKENS,
+                           LLM_REQUESTS, LLM_RETRIES, llm_labels)
+from utils.single_flight import SingleFlight, request_key
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Model used when a caller doesn't ask for a specific one
+DEFAULT_MODEL = "gemini-2.0-flash"
+
+# Default per-call timeout in seconds
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+
+# Retries for rate limiting and transient server errors, with exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_RETRY_BACKOFF = float(os.getenv("LLM_RETRY_BACKOFF", "0.5"))
+
+RETRYABLE_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded
+)
+
+# Share one Gemini call among concurrent identical requests (e.g. a class
+# generating the same assignment at once); set LLM_SINGLE_FLIGHT=false to disable
+LLM_SINGLE_FLIGHT = os.getenv("LLM_SINGLE_FLIGHT", "true").lower() == "true"
+
+# Template label for calls that don't name their prompt
+UNKNOWN_TEMPLATE = "unknown"
+
+class LLMTimeoutError(Exception):
+    """Raised when a Gemini call doesn't finish within its timeout"""
+
+class LLMClient:
+    """Shared async Gemini client; create one per process at start-up"""
+
+    def __init__(self, api_key: str, default_timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES,
+                 provider=None):
+        # Gemini, or the offline fake selected with LLM_PROVIDER=fake
+        self.provider = provider or create_llm_provider(api_key)
+        self.recorder = create_response_recorder()
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+
+        # GenerativeModel instances keyed by (model name, generation config)
+        self._models = {}
+
+        # In-flight non-streaming calls, shared by identical concurrent requests
+        self.single_flight = SingleFlight() if LLM_SINGLE_FLIGHT else None
+
+    def get_model(self, model_name: str = DEFAULT_MODEL, generation_config: Optional[Dict] = None,
+                  system_instruction: Optional[str] = None):
+        """Return a cached model for this name, generation config and system instruction"""
+        key = (model_name, json.dumps(generation_config or {}, sort_keys=True), system_instruction)
+        model = self._models.get(key)
+        if model is None:
+            logger.debug(f"Creating Gemini model {model_name} with config {generation_config}")
+            model = self.provider.model(model_name, generation_config, system_instruction)
+            self._models[key] = model
+        return model
+
+    async def generate(self, prompt: str, model_name: str = DEFAULT_MODEL,
+                       generation_config: Optional[Dict] = None,
+                       timeout: Optional[float] = None,
+                       template: str = UNKNOWN_TEMPLATE) -> str:
+        """Generate a single response and return its text"""
+        model = self.get_model(model_name, generation_config)
+        labels = llm_labels(template, model_name)
+        text = await self._shared(
+            request_key("generate", model_name, generation_config, prompt),
+            lambda: self._instrumented(lambda: model.generate_content_async(prompt), labels, timeout),
+            labels
+        )
+        self._record(template, prompt, text)
+        return text
+
+    async def chat(self, history: List[Dict], message: str, model_name: str = DEFAULT_MODEL,
+                   generation_config: Optional[Dict] = None,
+                   timeout: Optional[float] = None,
+                   system_instruction: Optional[str] = None,
+                   template: str = UNKNOWN_TEMPLATE) -> str:
+        """Continue a conversation with the given history and return the reply text"""
+        model = self.get_model(model_name, generation_config, system_instruction)
+        labels = llm_labels(template, model_name)
+        # A fresh chat per attempt so a failed attempt leaves no trace in the history
+        text = await self._shared(
+            request_key("chat", model_name, generation_config, system_instruction, history, message),
+            lambda: self._instrumented(
+                lambda: model.start_chat(history=history).send_message_async(message), labels, timeout
+            ),
+            labels
+        )
+        self._record(template, message, text)
+        return text
+
+    async def _shared(self, key: str, make_call: Callable, labels: Dict) -> str:
+        """Run the call, or wait for an identical one already in flight, and return the response text"""
+        if self.single_flight is None:
+            response = await make_call()
+        else:
+            response = await self.single_flight.do(key, make_call, lambda: LLM_COALESCED.inc(**labels))
+        return response.text
+
+    async def generate_stream(self, prompt: str, model_name: str = DEFAULT_MODEL,
+                              generation_config: Optional[Dict] = None,
+                              timeout: Optional[float] = None,
+                              template: str = UNKNOWN_TEMPLATE) -> AsyncIterator[str]:
+        """Yield the response text chunk by chunk as Gemini produces it"""
+        model = self.get_model(model_name, generation_config)
+        chunks = []
+        async for text in self._instrumented_stream(
+            lambda: model.generate_content_async(prompt, stream=True),
+            llm_labels(template, model_name), timeout
+        ):
+            chunks.append(text)
+            yield text
+        self._record(template, prompt, "".join(chunks))
+
+    async def chat_stream(self, history: List[Dict], message: str, model_name: str = DEFAULT_MODEL,
+                          generation_config: Optional[Dict] = None,
+                          timeout: Optional[float] = None,
+                          system_instruction: Optional[str] = None,
+                          template: str = UNKNOWN_TEMPLATE) -> AsyncIterator[str]:
+        """Continue a conversation and yield the reply text chunk by chunk"""
+        model = self.get_model(model_name, generation_config, system_instruction)
+        chunks = []
+        async for text in self._instrumented_stream(
+            lambda: model.start_chat(history=history).send_message_async(message, stream=True),
+            llm_labels(template, model_name), timeout
+        ):
+            chunks.append(text)
+            yield text
+        self._record(template, message, "".join(chunks))
+
+    async def _call_with_retries(self, make_call: Callable, labels: Dict, timeout: Optional[float]):
+        """Await a Gemini call, retrying rate limits and transient server errors"""
+        attempt = 0
+        current_template.set(labels["template"])
+        while True:
+            try:
+                return await self._with_timeout(make_call(), timeout)
+            except RETRYABLE_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                LLM_RETRIES.inc(**labels)
+                delay = LLM_RETRY_BACKOFF * (2 ** (attempt - 1)) * (1 + random.random())
+                logger.warning(f"Retrying Gemini call ({labels['template']}) in {delay:.2f}s after: {str(e)}")
+                await asyncio.sleep(delay)
+
+    async def _instrumented(self, make_call: Callable, labels: Dict, timeout: Optional[float]):
+        """Run a call and record its latency, token counts and outcome"""
+        start = time.monotonic()
+        status = "error"
+        try:
+            response = await self._call_with_retries(make_call, labels, timeout)
+            status = "ok"
+            self._record_usage(response, labels)
+            return response
+        except LLMTimeoutError:
+            status = "timeout"
+            raise
+        finally:
+            LLM_LATENCY.observe(time.monotonic() - start, **labels)
+            LLM_REQUESTS.inc(status=status, **labels)
+
+    async def _instrumented_stream(self, make_call: Callable, labels: Dict,
+                                   timeout: Optional[float]) -> AsyncIterator[str]:
+        """Stream a call's text, recording time to first chunk, total latency, tokens and outcome"""
+        start = time.monotonic()
+        status = "error"
+        last_chunk = None
+        try:
+            response = await self._call_with_retries(make_call, labels, timeout)
+            async for chunk, text in self._stream_chunks(response, timeout):
+                if last_chunk is None:
+                    LLM_FIRST_TOKEN.observe(time.monotonic() - start, **labels)
+                last_chunk = chunk
+                if text:
+                    yield text
+            status = "ok"
+            # The final chunk carries the usage totals for the whole response
+            if last_chunk is not None:
+                self._record_usage(last_chunk, labels)
+        except LLMTimeoutError:
+            status = "timeout"
+            raise
+        except (asyncio.CancelledError, GeneratorExit):
+            # The client went away mid-stream
+            status = "cancelled"
+            raise
+        finally:
+            LLM_LATENCY.observe(time.monotonic() - start, **labels)
+            LLM_REQUESTS.inc(status=status, **labels)
+
+    async def _stream_chunks(self, response, timeout: Optional[float]):
+        """Iterate a streamed response; the timeout bounds the wait for each chunk"""
+        chunks = response.__aiter__()
+        while True:
+            try:
+                chunk = await self._with_timeout(chunks.__anext__(), timeout)
+            except StopAsyncIteration:
+                return
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. only safety metadata)
+                text = ""
+            yield chunk, text
+
+    def _record(self, template: str, prompt: str, text: str) -> None:
+        """Save the response for the fake provider to replay, when LLM_RECORD_PATH is set"""
+        if self.recorder is not None:
+            self.recorder.record(template, prompt, text)
+
+    def _record_usage(self, response, labels: Dict) -> None:
+        """Record prompt and response token counts reported by Gemini"""
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        LLM_INPUT_TOKENS.observe(getattr(usage, "prompt_token_count", 0) or 0, **labels)
+        LLM_OUTPUT_TOKENS.observe(getattr(usage, "candidates_token_count", 0) or 0, **labels)
+
+    async def _with_timeout(self, call, timeout: Optional[float]):
+        """Await a Gemini call, bounded by the per-call or default timeout"""
+        timeout = timeout or self.default_timeout
+        try:
+            return await asyncio.wait_for(call, timeout=timeout)
+        except asyncio.TimeoutError:
+            raise LLMTimeoutError(f"Gemini call timed out after {timeout} seconds")
@@ -0,0 +1,64 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+from typing import Dict, Optional
+
+import google.generativeai as genai
+
+from utils.single_flight import request_key
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "gemini" for the real API, "fake" for the offline stand-in used in load tests
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini")
+
+# Append every response to this JSONL file, for the fake provider to replay later
+LLM_RECORD_PATH = os.getenv("LLM_RECORD_PATH", "")
+
+# Prompt template of the call in progress; set by LLMClient so the fake provider
+# knows what kind of response to produce
+current_template = contextvars.ContextVar("current_template", default="unknown")
+
+def prompt_key(prompt: str) -> str:
+    """Key a recorded response by its prompt (or chat message)"""
+    return request_key(prompt)
+
+class GeminiProvider:
+    """Google Gemini through google-generativeai"""
+
+    def __init__(self, api_key: str):
+        genai.configure(api_key=api_key)
+
+    def model(self, model_name: str, generation_config: Optional[Dict] = None,
+              system_instruction: Optional[str] = None):
+        return genai.GenerativeModel(model_name, generation_config=generation_config,
+                                     system_instruction=system_instruction)
+
+class ResponseRecorder:
+    """Appends {template, prompt_key, response} lines to a JSONL file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, template: str, prompt: str, response: str) -> None:
+        line = json.dumps({"template": template, "prompt_key": prompt_key(prompt), "response": response})
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as recording:
+                recording.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"Could not record LLM response to {self.path}: {str(e)}")
+
+def create_llm_provider(api_key: str):
+    """Build the LLM provider configured through the environment"""
+    if LLM_PROVIDER == "fake":
+        from services.llm.fake_provider import FakeProvider
+        logger.warning("Using the offline fake LLM provider; responses are synthetic")
+        return FakeProvider()
+    return GeminiProvider(api_key)
+
+def create_response_recorder() -> Optional[ResponseRecorder]:
+    return ResponseRecorder(LLM_RECORD_PATH) if LLM_RECORD_PATH else None
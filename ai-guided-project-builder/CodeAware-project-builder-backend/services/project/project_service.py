@@ -1,53 +1,57 @@
-import json
 import logging
-import google.generativeai as genai
 from typing import Dict, List, Optional, Any
 import traceback
 
 from models.schemas import ProjectStep, ProjectData
+from services.llm.llm_client import LLMClient
+from services.llm.response_cache import ResponseCache, normalize_text
+from services.project.quiz_bank import QuizBank, valid_questions
+from utils.helpers import extract_json_from_response
+from utils.metrics import record_parse_failure
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Model settings for each kind of generated content; part of the cache key
+PROJECT_MODEL_CONFIG = {
+    "model_name": "gemini-2.0-flash",
+    "generation_config": {"response_mime_type": "application/json", "temperature": 0.2}
+}
+QUIZ_MODEL_CONFIG = {
+    "model_name": "gemini-1.5-flash",
+    "generation_config": {"response_mime_type": "application/json", "temperature": 0.2}
+}
+FEEDBACK_MODEL_CONFIG = {
+    "model_name": "gemini-1.5-flash",
+    "generation_config": {"response_mime_type": "application/json", "temperature": 0.2}
+}
+
 class ProjectService:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-        genai.configure(api_key=api_key)
+    def __init__(self, llm_client: LLMClient, response_cache: Optional[ResponseCache] = None,
+                 quiz_bank: Optional[QuizBank] = None):
+        self.llm_client = llm_client
+        self.response_cache = response_cache
+        self.quiz_bank = quiz_bank
+    
+    def _cached(self, key: Optional[str]) -> Optional[Any]:
+        """Look up a cached response if caching applies to this call"""
+        if key is None or self.response_cache is None:
+            return None
+        return self.response_cache.get(key)
+    
+    def _cache_key(self, kind: str, model_config: Dict, inputs: Dict, use_cache: bool) -> Optional[str]:
+        """Build the cache key for a call, or None when caching is off for it"""
+        if not use_cache or self.response_cache is None:
+            return None
+        return ResponseCache.make_key(kind, model_config, inputs)
+    
+    def _store(self, key: Optional[str], value: Any) -> None:
+        if key is not None and self.response_cache is not None:
+            self.response_cache.set(key, value)
         
     def extract_json_from_response(self, text: str) -> Dict:
         """Extract JSON from a response that might be wrapped in markdown code blocks."""
-        import re
-        
-        # Try direct JSON parsing first
-        try:
-            return json.loads(text)
-        except json.JSONDecodeError:
-            pass
-        
-        # Look for JSON inside markdown code blocks
-        json_pattern = r"```(?:json)?\s*([\s\S]*?)```"
-        matches = re.findall(json_pattern, text)
-        
-        if matches:
-            for match in matches:
-                try:
-                    return json.loads(match.strip())
-                except json.JSONDecodeError:
-                    continue
-        
-        # Try to find anything that looks like JSON object 
-        json_object_pattern = r"\{[\s\S]*\}"
-        matches = re.findall(json_object_pattern, text)
-        
-        if matches:
-            for match in matches:
-                try:
-                    return json.loads(match)
-                except json.JSONDecodeError:
-                    continue
-                    
-        # Return the original text if we couldn't extract JSON
-        return {"error": "Could not extract valid JSON", "original_text": text}
+        return extract_json_from_response(text)
 
     def generate_project_prompt(self, project_type: str, expertise_level: str, project_idea: str) -> str:
         """Generate a prompt for creating a project based on user requirements"""
@@ -188,33 +192,35 @@ class ProjectService:
         """
         return prompt
     
-    def generate_project_steps(self, project_type: str, expertise_level: str, project_idea: str) -> Dict:
+    async def generate_project_steps(self, project_type: str, expertise_level: str, project_idea: str,
+                                     use_cache: bool = True) -> Dict:
         """Generate project steps based on user input"""
+        cache_key = self._cache_key("project_steps", PROJECT_MODEL_CONFIG, {
+            "project_type": normalize_text(project_type),
+            "expertise_level": normalize_text(expertise_level),
+            "project_idea": normalize_text(project_idea)
+        }, use_cache)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            logger.debug(f"Serving cached project plan for: {project_idea}")
+            return cached
+        
         try:
             prompt = self.generate_project_prompt(project_type, expertise_level, project_idea)
             
-            logger.debug("Initializing Gemini model for project generation")
-            model = genai.GenerativeModel("gemini-2.0-flash")
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "response_mime_type": "application/json",
-                    "temperature": 0.2
-                }
-            )
+            response_text = await self.llm_client.generate(prompt, template="project_plan", **PROJECT_MODEL_CONFIG)
             
             logger.debug(f"Received response from Gemini API for project generation")
             
-            # Process the response to extract clean JSON
-            response_text = response.text
-            
             # Try to extract JSON from the response
             try:
                 json_data = self.extract_json_from_response(response_text)
                 # Validate the step structure is correct and has required fields
                 self._validate_project_data(json_data)
+                self._store(cache_key, json_data)
                 return json_data
             except Exception as json_error:
+                record_parse_failure("project_plan")
                 logger.error(f"Error extracting JSON from response: {str(json_error)}")
                 raise Exception(f"Failed to parse project data: {str(json_error)}")
                 
@@ -222,11 +228,26 @@ class ProjectService:
             logger.error(f"Error generating project: {str(e)}\n{traceback.format_exc()}")
             raise Exception(f"Failed to generate project: {str(e)}")
     
-    def generate_next_step(self, project_type: str, expertise_level: str, project_idea: str, 
+    async def generate_next_step(self, project_type: str, expertise_level: str, project_idea: str, 
                           current_step: int, user_code: Optional[str] = None,
                           user_question: Optional[str] = None, 
-                          user_understanding: Optional[str] = None) -> Dict:
-        """Generate the next step for a project"""
+                          user_understanding: Optional[str] = None,
+                          use_cache: bool = True, template: str = "next_step") -> Dict:
+        """Generate the next step for a project; template labels the call in the LLM metrics"""
+        cache_key = self._cache_key("next_step", PROJECT_MODEL_CONFIG, {
+            "project_type": normalize_text(project_type),
+            "expertise_level": normalize_text(expertise_level),
+            "project_idea": normalize_text(project_idea),
+            "current_step": current_step,
+            "user_code": (user_code or "").strip(),
+            "user_question": normalize_text(user_question),
+            "user_understanding": normalize_text(user_understanding)
+        }, use_cache)
+        cached = self._cached(cache_key)
+        if cached is not None:
+            logger.debug(f"Serving cached step {current_step + 1} for: {project_idea}")
+            return cached
+        
         try:
             prompt = self.generate_next_step_prompt(
                 project_type, expertise_level, project_idea, 
@@ -234,37 +255,72 @@ class ProjectService:
             )
             
             # Call Gemini API
-            model = genai.GenerativeModel("gemini-2.0-flash")
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "response_mime_type": "application/json",
-                    "temperature": 0.2
-                }
-            )
-            
-            # Extract JSON from response
-            response_text = response.text
-            json_data = self.extract_json_from_response(response_text)
+            response_text = await self.llm_client.generate(prompt, template=template, **PROJECT_MODEL_CONFIG)
             
-            # Validate the step has required fields
-            self._validate_step_data(json_data)
+            try:
+                # Extract JSON from response
+                json_data = self.extract_json_from_response(response_text)
+                
+                # Validate the step has required fields
+                self._validate_step_data(json_data)
+            except Exception:
+                record_parse_failure("next_step")
+                raise
             
+            self._store(cache_key, json_data)
             return json_data
         
         except Exception as e:
             logger.error(f"Error generating next step: {str(e)}\n{traceback.format_exc()}")
             raise Exception(f"Failed to generate next step: {str(e)}")
     
-    def generate_quiz_questions(self, step_data: Dict) -> List[Dict]:
-        """Generate quiz questions for a specific step"""
-        try:
-            # If step already has quiz questions, use those
-            if "quiz_questions" in step_data and step_data["quiz_questions"]:
-                return step_data["quiz_questions"]
-            
-            # Otherwise generate new questions based on step content
-            prompt = f"""
+    def generate_step_feedback_prompt(self, step_data: Dict, current_step: int, user_code: Optional[str] = None,
+                                      user_question: Optional[str] = None,
+                                      user_understanding: Optional[str] = None) -> str:
+        """Generate a prompt that fits an already drafted next step to the code the user actually submitted"""
+        return f"""
+        I have completed step {current_step} of my project and here is my code:
+        ```
+        {user_code or "No code provided"}
+        ```
+        
+        {f"I have a question: {user_question}" if user_question else ""}
+        
+        {f"This is my understanding of the step: {user_understanding}" if user_understanding else ""}
+        
+        Step {current_step + 1} has already been written:
+        Title: {step_data.get('title', '')}
+        Description: {step_data.get('description', '')}
+        
+        Please provide detailed feedback on my current code - be specific about what I did well and what
+        could be improved, answer my question if I asked one, and mention anything I should change before
+        starting step {current_step + 1}.
+        
+        Format your response as a JSON object with a single field:
+        - feedback: Feedback on the user's current code
+        
+        IMPORTANT: Return only the raw JSON without any markdown formatting or code blocks.
+        """
+    
+    async def reconcile_next_step(self, draft: Dict, current_step: int, user_code: Optional[str] = None,
+                                  user_question: Optional[str] = None,
+                                  user_understanding: Optional[str] = None) -> Dict:
+        """
+        Fit a speculatively drafted step to the learner's submission. Only the
+        feedback depends on the submitted code, so this regenerates just that
+        with the smaller model instead of the whole step.
+        """
+        prompt = self.generate_step_feedback_prompt(draft, current_step, user_code, user_question, user_understanding)
+        response_text = await self.llm_client.generate(prompt, template="next_step_feedback", **FEEDBACK_MODEL_CONFIG)
+        json_data = self.extract_json_from_response(response_text)
+        if not isinstance(json_data, dict) or not isinstance(json_data.get("feedback"), str):
+            record_parse_failure("next_step_feedback")
+            raise ValueError("No feedback in the model response")
+        return {**draft, "feedback": json_data["feedback"]}
+    
+    def generate_quiz_prompt(self, step_data: Dict) -> str:
+        """Generate the prompt for a step's quiz questions"""
+        return f"""
             Generate 2-3 multiple choice questions about the following step in a coding project.
             
             The step is about: {step_data.get('title', 'Coding step')}
@@ -286,42 +342,55 @@ class ProjectService:
             
             Only return the JSON array with no additional text.
             """
+    
+    async def request_quiz_questions(self, step_data: Dict) -> List[Dict]:
+        """Ask the model for a step's quiz questions; raises ValueError unless it returns usable ones"""
+        response_text = await self.llm_client.generate(
+            self.generate_quiz_prompt(step_data), template="quiz_questions", **QUIZ_MODEL_CONFIG
+        )
+        questions = valid_questions(self.extract_json_from_response(response_text))
+        if not questions:
+            record_parse_failure("quiz_questions")
+            raise ValueError("No valid quiz questions in the model response")
+        return questions
+    
+    def prefetch_quiz_questions(self, step_data: Dict, language: str = "") -> None:
+        """Have the quiz bank generate questions for a step in the background, ahead of the learner asking"""
+        if self.quiz_bank is not None and not step_data.get("quiz_questions"):
+            self.quiz_bank.prefetch(step_data, language, lambda: self.request_quiz_questions(step_data))
+    
+    async def generate_quiz_questions(self, step_data: Dict, use_cache: bool = True, language: str = "") -> List[Dict]:
+        """Generate quiz questions for a specific step"""
+        try:
+            # If step already has quiz questions, use those
+            if "quiz_questions" in step_data and step_data["quiz_questions"]:
+                return step_data["quiz_questions"]
             
-            # Call Gemini for generating questions
-            model = genai.GenerativeModel("gemini-1.5-flash")
-            response = model.generate_content(
-                prompt,
-                generation_config={
-                    "response_mime_type": "application/json",
-                    "temperature": 0.2
-                }
-            )
+            # Serve a pre-generated set when the bank has one, and top the pool up
+            if use_cache and self.quiz_bank is not None:
+                questions = self.quiz_bank.take(step_data, language)
+                if questions is not None:
+                    self.prefetch_quiz_questions(step_data, language)
+                    return questions
             
-            # Process the response
-            json_data = self.extract_json_from_response(response.text)
+            cache_key = self._cache_key("quiz_questions", QUIZ_MODEL_CONFIG, {
+                "title": normalize_text(step_data.get('title')),
+                "description": normalize_text(step_data.get('description'))
+            }, use_cache)
+            cached = self._cached(cache_key)
+            if cached is not None:
+                return cached
             
-            # If we didn't get an array, wrap it
-            if not isinstance(json_data, list):
-                if isinstance(json_data, dict):
-                    json_data = [json_data]
-                else:
-                    # Fallback questions if parsing failed
-                    json_data = [
-                        {
-                            "question_id": "q1",
-                            "question_text": f"What is the main topic of the step '{step_data.get('title')}'?",
-                            "options": ["HTML basics", "CSS styling", "JavaScript functions", "Python coding"],
-                            "correct_answer": "HTML basics"  # Default
-                        },
-                        {
-                            "question_id": "q2",
-                            "question_text": f"What is the expected outcome of this step?",
-                            "options": ["A styled webpage", "A functional form", "Basic HTML structure", "Running Python code"],
-                            "correct_answer": "Basic HTML structure"  # Default
-                        }
-                    ]
+            # Otherwise generate new questions based on step content
+            questions = await self.request_quiz_questions(step_data)
             
-            return json_data
+            # Only cache and bank questions the model actually produced, never the fallbacks
+            self._store(cache_key, questions)
+            if self.quiz_bank is not None:
+                self.quiz_bank.add(step_data, language, questions, served=True)
+                self.prefetch_quiz_questions(step_data, language)
+            
+            return questions
             
         except Exception as e:
             logger.error(f"Error generating questions: {str(e)}")
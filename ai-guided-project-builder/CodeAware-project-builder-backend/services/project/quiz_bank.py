@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from pydantic import ValidationError
+
+from models.schemas import QuizQuestion
+from utils.metrics import REGISTRY
+from utils import sqlite_db
+from utils.single_flight import request_key
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Serve step quizzes from pre-generated questions instead of calling the model per request
+QUIZ_BANK_ENABLED = os.getenv("QUIZ_BANK_ENABLED", "true").lower() == "true"
+QUIZ_BANK_PATH = os.getenv("QUIZ_BANK_PATH", "quiz_bank.db")
+
+# Where the server keeps its data; a relative QUIZ_BANK_PATH is resolved against it
+DATA_DIR = os.getenv("DATA_DIR", os.path.join(os.getenv("XDG_CACHE_HOME", os.path.expanduser("~/.cache")),
+                                              "project-builder"))
+
+# Questions in one served quiz
+QUIZ_BANK_QUIZ_SIZE = int(os.getenv("QUIZ_BANK_QUIZ_SIZE", "3"))
+
+# Keep refilling a step's pool in the background until it holds this many distinct questions
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET", "9"))
+
+# Banked questions are dropped this many seconds after they were generated
+QUIZ_BANK_TTL = int(os.getenv("QUIZ_BANK_TTL", str(7 * 24 * 3600)))
+
+# Background generations running at once, and refills allowed to wait for one
+QUIZ_BANK_REFILL_CONCURRENCY = int(os.getenv("QUIZ_BANK_REFILL_CONCURRENCY", "2"))
+QUIZ_BANK_QUEUE_SIZE = int(os.getenv("QUIZ_BANK_QUEUE_SIZE", "100"))
+
+QUIZ_BANK_LOOKUPS = REGISTRY.counter(
+    "quiz_bank_lookups_total", "Quiz bank lookups by result (hit or miss)", ("result",))
+QUIZ_BANK_REFILLS = REGISTRY.counter(
+    "quiz_bank_refills_total", "Background quiz bank refills by result (ok, error or dropped)", ("result",))
+
+def step_fingerprint(step_data: Dict) -> str:
+    """Identify a step by its title and description, ignoring case and whitespace"""
+    return request_key("quiz_questions", " ".join((step_data.get("title") or "").lower().split()),
+                       " ".join((step_data.get("description") or "").lower().split()))
+
+def question_key(question: Dict) -> str:
+    """Identify a question by its text, so the same question is only banked once"""
+    text = " ".join(question["question_text"].lower().split())
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def valid_questions(data: Any) -> List[Dict]:
+    """The well-formed questions in a model response: every field present and the answer among the options"""
+    questions = []
+    for question in data if isinstance(data, list) else [data]:
+        if isinstance(question, dict) and "question_id" in question:
+            question = {**question, "question_id": str(question["question_id"])}
+        try:
+            parsed = QuizQuestion.model_validate(question)
+        except ValidationError:
+            continue
+        if len(parsed.options) >= 2 and parsed.correct_answer in parsed.options:
+            questions.append(parsed.model_dump())
+    return questions
+
+class QuizBankStore:
+    """Banked questions in SQLite (WAL mode), indexed by step fingerprint and language"""
+
+    # Drop expired questions every this many inserts
+    TRIM_EVERY = 100
+
+    def __init__(self, path: Optional[str] = None, ttl: int = QUIZ_BANK_TTL):
+        path = path or os.path.join(DATA_DIR, QUIZ_BANK_PATH)
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.ttl = ttl
+        self._inserts = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite_db.connect(path)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS quiz_bank ("
+                "fingerprint TEXT NOT NULL, language TEXT NOT NULL, question_key TEXT NOT NULL, "
+                "data TEXT NOT NULL, served INTEGER NOT NULL DEFAULT 0, created_at REAL NOT NULL, "
+                "PRIMARY KEY (fingerprint, language, question_key))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS quiz_bank_created_at ON quiz_bank (created_at)")
+
+    def add(self, fingerprint: str, language: str, questions: List[Dict], served: bool = False) -> int:
+        """Bank questions not already held for this step; returns how many were new"""
+        now = time.time()
+        rows = [(fingerprint, language, question_key(question), json.dumps(question), int(served), now)
+                for question in questions]
+        with self._lock, self._conn:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO quiz_bank (fingerprint, language, question_key, data, served, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)", rows
+            )
+            added = self._conn.total_changes - before
+            self._inserts += added
+            if self._inserts >= self.TRIM_EVERY:
+                self._inserts = 0
+                self._conn.execute("DELETE FROM quiz_bank WHERE created_at < ?", (now - self.ttl,))
+        return added
+
+    def count(self, fingerprint: str, language: str) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM quiz_bank WHERE fingerprint = ? AND language = ? AND created_at >= ?",
+                (fingerprint, language, time.time() - self.ttl)
+            ).fetchone()[0]
+
+    def take(self, fingerprint: str, language: str, count: int) -> Optional[List[Dict]]:
+        """
+        A random set of count distinct questions, least served first so repeat
+        quizzes rotate through the pool; None if the pool is smaller than that.
+        """
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT question_key, data FROM quiz_bank "
+                "WHERE fingerprint = ? AND language = ? AND created_at >= ? "
+                "ORDER BY served, RANDOM() LIMIT ?",
+                (fingerprint, language, time.time() - self.ttl, count)
+            ).fetchall()
+            if len(rows) < count:
+                return None
+            self._conn.executemany(
+                "UPDATE quiz_bank SET served = served + 1 "
+                "WHERE fingerprint = ? AND language = ? AND question_key = ?",
+                [(fingerprint, language, row[0]) for row in rows]
+            )
+        questions = [json.loads(row[1]) for row in rows]
+        random.shuffle(questions)
+        return questions
+
+class QuizBank:
+    """Validated quiz questions per step, served instantly and refilled by background workers"""
+
+    def __init__(self, store: Optional[QuizBankStore] = None, quiz_size: int = QUIZ_BANK_QUIZ_SIZE,
+                 target: int = QUIZ_BANK_TARGET, concurrency: int = QUIZ_BANK_REFILL_CONCURRENCY):
+        # Opened in start(), so importing the app doesn't create the database
+        self.store = store
+        self.quiz_size = quiz_size
+        self.target = target
+        self.concurrency = concurrency
+        self._queue: Optional[asyncio.Queue] = None
+        self._pending: Set[str] = set()
+        self._workers: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        if self.store is None:
+            self.store = QuizBankStore()
+            logger.info(f"Quiz bank opened at {self.store.path}")
+        if not self._workers:
+            self._queue = asyncio.Queue(maxsize=QUIZ_BANK_QUEUE_SIZE)
+            self._workers = [asyncio.ensure_future(self._refill_forever()) for _ in range(self.concurrency)]
+
+    async def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._pending.clear()
+
+    def take(self, step_data: Dict, language: str) -> Optional[List[Dict]]:
+        """Serve a quiz for the step from the bank, numbered q1..qN, or None on a miss or before start()"""
+        if self.store is None:
+            return None
+        try:
+            questions = self.store.take(step_fingerprint(step_data), language, self.quiz_size)
+        except sqlite3.OperationalError as e:
+            # Busy with another worker's write; generating the quiz beats stalling the event loop
+            logger.warning(f"Quiz bank lookup failed: {str(e)}")
+            questions = None
+        QUIZ_BANK_LOOKUPS.inc(result="hit" if questions else "miss")
+        if not questions:
+            return None
+        return [{**question, "question_id": f"q{index}"} for index, question in enumerate(questions, 1)]
+
+    def add(self, step_data: Dict, language: str, questions: List[Dict], served: bool = False) -> int:
+        if self.store is None:
+            return 0
+        try:
+            return self.store.add(step_fingerprint(step_data), language, valid_questions(questions), served)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"Could not bank quiz questions: {str(e)}")
+            return 0
+
+    def prefetch(self, step_data: Dict, language: str, generate: Callable[[], Awaitable[List[Dict]]]) -> bool:
+        """Queue a background generation for the step unless its pool is already full; never blocks"""
+        fingerprint = step_fingerprint(step_data)
+        key = f"{fingerprint}:{language}"
+        if not self._workers or key in self._pending:
+            return False
+        try:
+            if self.store.count(fingerprint, language) >= self.target:
+                return False
+        except sqlite3.OperationalError:
+            return False
+        try:
+            self._queue.put_nowait((key, step_data, language, generate))
+        except asyncio.QueueFull:
+            QUIZ_BANK_REFILLS.inc(result="dropped")
+            return False
+        self._pending.add(key)
+        return True
+
+    async def _refill_forever(self) -> None:
+        while True:
+            key, step_data, language, generate = await self._queue.get()
+            try:
+                added = self.add(step_data, language, await generate())
+                QUIZ_BANK_REFILLS.inc(result="ok")
+                logger.debug(f"Banked {added} new quiz questions for step '{step_data.get('title')}'")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                QUIZ_BANK_REFILLS.inc(result="error")
+                logger.warning(f"Quiz bank refill failed for step '{step_data.get('title')}': {str(e)}")
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+def create_quiz_bank() -> Optional[QuizBank]:
+    """Build the quiz bank, or None when it's disabled through the environment"""
+    if not QUIZ_BANK_ENABLED:
+        return None
+    return QuizBank()
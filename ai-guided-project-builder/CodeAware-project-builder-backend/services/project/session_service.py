@@ -1,130 +1,175 @@
+import asyncio
 import uuid
-import json
 import logging
+import os
 from typing import Dict, List, Optional, Any
 
+from models.project_document import ProjectDocument
+from services.project.session_store import create_session_store
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Seconds between background expiry sweeps
+SESSION_EXPIRY_INTERVAL = int(os.getenv("SESSION_EXPIRY_INTERVAL", "60"))
+
 class SessionService:
-    def __init__(self):
-        # Store user sessions
-        self.user_sessions = {}
-        
-        # Store user code files - indexed by session_id
-        self.user_code_files = {}
+    def __init__(self, store=None):
+        # Sessions live in a bounded store; large fields such as the parsed project
+        # and the user's code files are only loaded when asked for
+        self.store = store or create_session_store()
+        self.expired_sessions = 0
+        self._expiry_task = None
+    
+    async def start(self) -> None:
+        """Start the background expiry sweep"""
+        if self._expiry_task is None:
+            self._expiry_task = asyncio.ensure_future(self._expire_forever())
     
-    def create_session(self, project_type: str, expertise_level: str, project_idea: str, gemini_response: str) -> str:
+    async def shutdown(self) -> None:
+        """Stop the background expiry sweep"""
+        if self._expiry_task is not None:
+            self._expiry_task.cancel()
+            self._expiry_task = None
+    
+    async def _expire_forever(self) -> None:
+        while True:
+            await asyncio.sleep(SESSION_EXPIRY_INTERVAL)
+            try:
+                expired = self.store.expire()
+                if expired:
+                    self.expired_sessions += expired
+                    logger.info(f"Expired {expired} idle sessions")
+            except Exception as e:
+                logger.error(f"Error expiring sessions: {str(e)}")
+    
+    def create_session(self, project_type: str, expertise_level: str, project_idea: str, project: ProjectDocument) -> str:
         """Create a new user session and return the session ID"""
         # Generate a session ID
         session_id = str(uuid.uuid4())
         
-        # Parse the gemini response to get project details
-        try:
-            response_data = json.loads(gemini_response)
-            total_steps = response_data.get("total_steps", 10)
-        except json.JSONDecodeError:
-            total_steps = 10  # Default if parsing fails
-        
-        # Store session data
-        self.user_sessions[session_id] = {
+        # Store session data, with empty code files for this session
+        self.store.create(session_id, {
             "project_type": project_type,
             "expertise_level": expertise_level,
             "project_idea": project_idea or "AI suggested project",
             "current_step": 0,
-            "gemini_response": gemini_response,
-            "total_steps": total_steps,
+            "project": project,
+            "total_steps": project.total_steps,
             "execution_attempts": 0,  # Track how many times code was executed
-            "execution_attempts_by_step": {}  # Track execution attempts per step
-        }
-        
-        # Initialize empty code files for this session
-        self.user_code_files[session_id] = {
-            "html": "",
-            "css": "",
-            "javascript": "",
-            "python": ""
-        }
+            "execution_attempts_by_step": {},  # Track execution attempts per step
+            "code_files": {
+                "html": "",
+                "css": "",
+                "javascript": "",
+                "python": ""
+            }
+        })
         
         logger.debug(f"Created new session with ID: {session_id}")
         return session_id
     
     def get_session(self, session_id: str) -> Optional[Dict]:
-        """Get a user session by ID"""
-        return self.user_sessions.get(session_id)
+        """Get a user session by ID, without its large fields"""
+        return self.store.get(session_id)
+    
+    def get_session_field(self, session_id: str, field: str) -> Any:
+        """Load a single large session field such as project or code_files"""
+        return self.store.get_field(session_id, field)
+    
+    def get_project(self, session_id: str) -> Optional[ProjectDocument]:
+        """Get the parsed project plan for a session"""
+        return self.store.get_field(session_id, "project")
+    
+    def advance_to_step(self, session_id: str, step_index: int, step_data: Dict) -> Optional[ProjectDocument]:
+        """Record a newly generated step in the session's project and make it the current step"""
+        project = self.get_project(session_id)
+        if project is None:
+            return None
+        
+        project.set_step(step_index, step_data)
+        self.store.update(session_id, {"current_step": step_index, "project": project})
+        return project
     
     def update_session(self, session_id: str, data: Dict) -> bool:
         """Update a user session with new data"""
-        if session_id not in self.user_sessions:
-            return False
-            
-        self.user_sessions[session_id].update(data)
-        return True
+        return self.store.update(session_id, data)
     
     def increment_step(self, session_id: str) -> bool:
         """Increment the current step for a session"""
-        if session_id not in self.user_sessions:
+        session = self.store.get(session_id)
+        if not session:
             return False
             
-        self.user_sessions[session_id]["current_step"] += 1
-        return True
+        return self.store.update(session_id, {"current_step": session["current_step"] + 1})
     
     def increment_execution_attempts(self, session_id: str) -> int:
         """Increment the execution attempts counter and return the new count"""
-        if session_id not in self.user_sessions:
+        session = self.store.get(session_id)
+        if not session:
             return 0
-            
-        # Increment the global execution counter
-        self.user_sessions[session_id]["execution_attempts"] += 1
         
         # Also track attempts for the current step
-        current_step = self.user_sessions[session_id]["current_step"]
-        step_key = str(current_step)  # Convert to string for dictionary key
+        step_key = str(session["current_step"])  # Convert to string for dictionary key
+        attempts_by_step = session["execution_attempts_by_step"]
+        attempts_by_step[step_key] = attempts_by_step.get(step_key, 0) + 1
         
-        # Initialize the step counter if it doesn't exist
-        if step_key not in self.user_sessions[session_id]["execution_attempts_by_step"]:
-            self.user_sessions[session_id]["execution_attempts_by_step"][step_key] = 0
-            
-        # Increment step counter
-        self.user_sessions[session_id]["execution_attempts_by_step"][step_key] += 1
+        # Increment the global execution counter
+        self.store.update(session_id, {
+            "execution_attempts": session["execution_attempts"] + 1,
+            "execution_attempts_by_step": attempts_by_step
+        })
         
         # Return the count for the current step
-        return self.user_sessions[session_id]["execution_attempts_by_step"][step_key]
+        return attempts_by_step[step_key]
     
     def get_execution_attempts(self, session_id: str) -> int:
         """Get the total number of execution attempts for a session"""
-        if session_id not in self.user_sessions:
+        session = self.store.get(session_id)
+        if not session:
             return 0
             
-        return self.user_sessions[session_id]["execution_attempts"]
+        return session["execution_attempts"]
     
     def get_current_step_execution_attempts(self, session_id: str) -> int:
         """Get the number of execution attempts for the current step"""
-        if session_id not in self.user_sessions:
+        session = self.store.get(session_id)
+        if not session:
             return 0
             
-        current_step = self.user_sessions[session_id]["current_step"]
-        step_key = str(current_step)
+        step_key = str(session["current_step"])
         
-        return self.user_sessions[session_id]["execution_attempts_by_step"].get(step_key, 0)
+        return session["execution_attempts_by_step"].get(step_key, 0)
     
     def store_code(self, session_id: str, code: str, language: str) -> bool:
         """Store user code for a specific language"""
-        if session_id not in self.user_code_files:
+        code_files = self.store.get_field(session_id, "code_files")
+        if code_files is None:
             return False
             
-        if language not in self.user_code_files[session_id]:
+        if language not in code_files:
             return False
             
-        self.user_code_files[session_id][language] = code
-        return True
+        code_files[language] = code
+        return self.store.update(session_id, {"code_files": code_files})
     
     def get_code(self, session_id: str, language: str) -> Optional[str]:
         """Get stored user code for a specific language"""
-        if session_id not in self.user_code_files:
+        code_files = self.store.get_field(session_id, "code_files")
+        if code_files is None:
             return None
             
-        return self.user_code_files[session_id].get(language)
+        return code_files.get(language)
+    
+    def get_metrics(self) -> Dict:
+        """Return the session count and approximate memory footprint"""
+        return {
+            "store": type(self.store).__name__,
+            "sessions": len(self.store),
+            "memory_usage_bytes": self.store.memory_usage(),
+            "expired_sessions": self.expired_sessions,
+            "evicted_sessions": self.store.evicted
+        }
     
     def detect_language(self, code: str) -> str:
         """Detect the programming language from code content"""
@@ -144,19 +189,19 @@ class SessionService:
     
     def store_user_code(self, session_id: str, user_code: str) -> bool:
         """Store user code by detecting the language"""
-        if not user_code or session_id not in self.user_code_files:
+        if not user_code:
+            return False
+        
+        session = self.store.get(session_id)
+        if not session:
             return False
             
         language = self.detect_language(user_code)
         if language == "unknown":
             # Try to determine based on project type
-            if session_id in self.user_sessions:
-                project_type = self.user_sessions[session_id]["project_type"]
-                if project_type == "html+css+js":
-                    language = "html"  # Default to HTML for web projects
-                else:
-                    language = "python"  # Default to Python for Streamlit projects
+            if session["project_type"] == "html+css+js":
+                language = "html"  # Default to HTML for web projects
             else:
-                return False
+                language = "python"  # Default to Python for Streamlit projects
                 
         return self.store_code(session_id, user_code, language) 
\ No newline at end of file
@@ -0,0 +1,270 @@
+import copy
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from models.project_document import ProjectDocument
+from utils import sqlite_db
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# "memory" or "sqlite"
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "sessions.db")
+
+# Sessions untouched for this many seconds are expired
+SESSION_TTL = int(os.getenv("SESSION_TTL", "86400"))
+
+# Hard cap on stored sessions; the least recently used ones are evicted beyond it
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "50000"))
+
+# Large fields that are only loaded when a caller asks for them
+LAZY_FIELDS = ("project", "code_files")
+
+# Lazy fields that aren't plain JSON, as (encode, decode) pairs for persistent stores
+FIELD_CODECS = {
+    "project": (ProjectDocument.to_storage, ProjectDocument.from_storage)
+}
+
+# Only persist a new last-access time when the stored one is older than this
+TOUCH_INTERVAL = 60
+
+def _split_fields(data: Dict):
+    """Separate small, always-loaded fields from large lazy ones"""
+    eager = {key: value for key, value in data.items() if key not in LAZY_FIELDS}
+    lazy = {key: value for key, value in data.items() if key in LAZY_FIELDS}
+    return eager, lazy
+
+def _estimate_size(value: Any) -> int:
+    """Approximate the bytes a value occupies once serialized"""
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, ProjectDocument):
+        return value.size_bytes()
+    try:
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return 0
+
+class MemorySessionStore:
+    """In-process session store with LRU eviction and an idle TTL"""
+
+    def __init__(self, max_sessions: int = SESSION_MAX_SESSIONS, ttl: int = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+
+        # session_id -> {"eager": {...}, "lazy": {...}, "last_access": float}
+        self._sessions = OrderedDict()
+        self._sizes = {}
+        self.evicted = 0
+
+    def create(self, session_id: str, data: Dict) -> None:
+        eager, lazy = _split_fields(data)
+        self._sessions[session_id] = {"eager": eager, "lazy": lazy, "last_access": time.time()}
+        self._sessions.move_to_end(session_id)
+        self._sizes[session_id] = {key: _estimate_size(value) for key, value in data.items()}
+        while len(self._sessions) > self.max_sessions:
+            evicted_id, _ = self._sessions.popitem(last=False)
+            self._sizes.pop(evicted_id, None)
+            self.evicted += 1
+
+    def _entry(self, session_id: str) -> Optional[Dict]:
+        """Return a live entry and mark it as recently used"""
+        entry = self._sessions.get(session_id)
+        if entry is None:
+            return None
+        now = time.time()
+        if now - entry["last_access"] > self.ttl:
+            self.delete(session_id)
+            return None
+        entry["last_access"] = now
+        self._sessions.move_to_end(session_id)
+        return entry
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        entry = self._entry(session_id)
+        return copy.deepcopy(entry["eager"]) if entry else None
+
+    def get_field(self, session_id: str, field: str) -> Any:
+        entry = self._entry(session_id)
+        if entry is None:
+            return None
+        if field in LAZY_FIELDS:
+            # Lazy fields are handed out without copying; callers write changes back with update()
+            return entry["lazy"].get(field)
+        return copy.deepcopy(entry["eager"].get(field))
+
+    def update(self, session_id: str, data: Dict) -> bool:
+        entry = self._entry(session_id)
+        if entry is None:
+            return False
+        eager, lazy = _split_fields(data)
+        entry["eager"].update(copy.deepcopy(eager))
+        entry["lazy"].update(lazy)
+        self._sizes[session_id].update({key: _estimate_size(value) for key, value in data.items()})
+        return True
+
+    def delete(self, session_id: str) -> bool:
+        self._sizes.pop(session_id, None)
+        return self._sessions.pop(session_id, None) is not None
+
+    def expire(self) -> int:
+        """Drop sessions idle for longer than the TTL"""
+        cutoff = time.time() - self.ttl
+        expired = 0
+        # Entries are kept in access order, so stale ones are at the front
+        while self._sessions:
+            session_id, entry = next(iter(self._sessions.items()))
+            if entry["last_access"] >= cutoff:
+                break
+            self.delete(session_id)
+            expired += 1
+        return expired
+
+    def memory_usage(self) -> int:
+        """Approximate bytes held by stored sessions"""
+        return sum(sum(sizes.values()) for sizes in self._sizes.values())
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+class SQLiteSessionStore:
+    """Session store backed by SQLite in WAL mode so sessions survive restarts"""
+
+    def __init__(self, path: str = SESSION_DB_PATH, max_sessions: int = SESSION_MAX_SESSIONS,
+                 ttl: int = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.evicted = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite_db.connect(path)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "session_id TEXT PRIMARY KEY, data TEXT NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+            # Large fields live in their own rows and are only read on demand
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS session_fields ("
+                "session_id TEXT NOT NULL REFERENCES sessions (session_id) ON DELETE CASCADE, "
+                "field TEXT NOT NULL, value TEXT, PRIMARY KEY (session_id, field))"
+            )
+
+    def create(self, session_id: str, data: Dict) -> None:
+        eager, lazy = _split_fields(data)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, data, last_access) VALUES (?, ?, ?)",
+                (session_id, json.dumps(eager), time.time())
+            )
+            self._write_fields(session_id, lazy)
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE session_id IN ("
+                "SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_sessions,)
+            )
+            self.evicted += cursor.rowcount
+
+    def _write_fields(self, session_id: str, fields: Dict) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO session_fields (session_id, field, value) VALUES (?, ?, ?)",
+            [(session_id, field, self._encode(field, value)) for field, value in fields.items()]
+        )
+
+    @staticmethod
+    def _encode(field: str, value: Any) -> str:
+        if field in FIELD_CODECS and value is not None:
+            return FIELD_CODECS[field][0](value)
+        return json.dumps(value)
+
+    @staticmethod
+    def _decode(field: str, value: str) -> Any:
+        if field in FIELD_CODECS:
+            return FIELD_CODECS[field][1](value)
+        return json.loads(value)
+
+    def _load(self, session_id: str) -> Optional[Dict]:
+        """Read the eager fields of a live session and refresh its last-access time"""
+        row = self._conn.execute(
+            "SELECT data, last_access FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        data, last_access = row
+        now = time.time()
+        if now - last_access > self.ttl:
+            self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return None
+        if now - last_access > TOUCH_INTERVAL:
+            self._conn.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?", (now, session_id))
+        return json.loads(data)
+
+    def get(self, session_id: str) -> Optional[Dict]:
+        with self._lock, self._conn:
+            return self._load(session_id)
+
+    def get_field(self, session_id: str, field: str) -> Any:
+        with self._lock, self._conn:
+            eager = self._load(session_id)
+            if eager is None:
+                return None
+            if field not in LAZY_FIELDS:
+                return eager.get(field)
+            row = self._conn.execute(
+                "SELECT value FROM session_fields WHERE session_id = ? AND field = ?", (session_id, field)
+            ).fetchone()
+            return self._decode(field, row[0]) if row and row[0] is not None else None
+
+    def update(self, session_id: str, data: Dict) -> bool:
+        eager, lazy = _split_fields(data)
+        with self._lock, self._conn:
+            current = self._load(session_id)
+            if current is None:
+                return False
+            if eager:
+                current.update(eager)
+                self._conn.execute(
+                    "UPDATE sessions SET data = ?, last_access = ? WHERE session_id = ?",
+                    (json.dumps(current), time.time(), session_id)
+                )
+            self._write_fields(session_id, lazy)
+            return True
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock, self._conn:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            return cursor.rowcount > 0
+
+    def expire(self) -> int:
+        """Drop sessions idle for longer than the TTL"""
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM sessions WHERE last_access < ?", (time.time() - self.ttl,)
+            )
+            return cursor.rowcount
+
+    def memory_usage(self) -> int:
+        """Bytes used by the database file"""
+        with self._lock:
+            page_count = self._conn.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self._conn.execute("PRAGMA page_size").fetchone()[0]
+        return page_count * page_size
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+def create_session_store(path: str = SESSION_DB_PATH):
+    """Build the session store configured through the environment"""
+    if SESSION_STORE == "sqlite":
+        return SQLiteSessionStore(path)
+    return MemorySessionStore()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional
+
+from services.llm.response_cache import normalize_text
+from utils.metrics import REGISTRY
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Draft step N+1 in the background as soon as step N is served
+SPECULATIVE_NEXT_STEP = os.getenv("SPECULATIVE_NEXT_STEP", "false").lower() == "true"
+
+# Spend cap: speculative drafts started per rolling hour, and running at once
+SPECULATIVE_MAX_DRAFTS_PER_HOUR = int(os.getenv("SPECULATIVE_MAX_DRAFTS_PER_HOUR", "100"))
+SPECULATIVE_MAX_IN_FLIGHT = int(os.getenv("SPECULATIVE_MAX_IN_FLIGHT", "4"))
+
+# Unclaimed drafts are dropped after this many seconds, or beyond this many sessions
+SPECULATIVE_DRAFT_TTL = int(os.getenv("SPECULATIVE_DRAFT_TTL", "1800"))
+SPECULATIVE_MAX_DRAFTS = int(os.getenv("SPECULATIVE_MAX_DRAFTS", "1000"))
+
+SPECULATIVE_LOOKUPS = REGISTRY.counter(
+    "speculative_step_lookups_total",
+    "Next-step requests by how a speculative draft served them (hit, reconciled or miss)", ("result",))
+SPECULATIVE_DRAFTS = REGISTRY.counter(
+    "speculative_step_drafts_total",
+    "Speculative next-step drafts by outcome (started, failed, unused or over_budget)", ("result",))
+
+class StepDraft:
+    """A next step being drafted for a session, with the context it was drafted from"""
+
+    def __init__(self, context: Dict, basis_code: str, task: asyncio.Task):
+        self.context = context
+        self.basis_code = basis_code
+        self.task = task
+        self.created_at = time.time()
+
+class StepSpeculator:
+    """
+    Drafts each session's next step while the learner works on the current
+    one, and hands the draft to /next_step if the project context still
+    matches. Drafts are kept per worker.
+    """
+
+    def __init__(self, project_service, enabled: bool = SPECULATIVE_NEXT_STEP,
+                 max_per_hour: int = SPECULATIVE_MAX_DRAFTS_PER_HOUR, max_in_flight: int = SPECULATIVE_MAX_IN_FLIGHT):
+        self.project_service = project_service
+        self.enabled = enabled
+        self.max_per_hour = max_per_hour
+        self.max_in_flight = max_in_flight
+        self._drafts: "OrderedDict[str, StepDraft]" = OrderedDict()  # session_id -> draft, oldest first
+        self._started: Deque[float] = deque()
+        self.hits = 0
+        self.reconciled = 0
+        self.misses = 0
+
+    @staticmethod
+    def _context(project_type: str, expertise_level: str, project_idea: str, current_step: int) -> Dict:
+        return {
+            "project_type": normalize_text(project_type),
+            "expertise_level": normalize_text(expertise_level),
+            "project_idea": normalize_text(project_idea),
+            "current_step": current_step
+        }
+
+    def _in_flight(self) -> int:
+        return sum(1 for draft in self._drafts.values() if not draft.task.done())
+
+    def _within_budget(self) -> bool:
+        cutoff = time.monotonic() - 3600
+        while self._started and self._started[0] < cutoff:
+            self._started.popleft()
+        return len(self._started) < self.max_per_hour and self._in_flight() < self.max_in_flight
+
+    def _discard(self, session_id: str) -> None:
+        draft = self._drafts.pop(session_id, None)
+        if draft is not None:
+            SPECULATIVE_DRAFTS.inc(result="unused")
+            draft.task.cancel()
+
+    def _expire(self) -> None:
+        cutoff = time.time() - SPECULATIVE_DRAFT_TTL
+        while self._drafts:
+            session_id, draft = next(iter(self._drafts.items()))
+            if draft.created_at >= cutoff and len(self._drafts) <= SPECULATIVE_MAX_DRAFTS:
+                break
+            self._discard(session_id)
+
+    def speculate(self, session_id: str, project_type: str, expertise_level: str, project_idea: str,
+                  current_step: int, basis_code: Optional[str] = None) -> bool:
+        """
+        Start drafting the step after current_step in the background, assuming the
+        learner submits basis_code (the current step's starter code) with no question.
+        Returns False when disabled or over the spend cap; never blocks.
+        """
+        if not self.enabled:
+            return False
+        self._expire()
+        self._discard(session_id)
+        if not self._within_budget():
+            SPECULATIVE_DRAFTS.inc(result="over_budget")
+            return False
+
+        basis_code = basis_code or ""
+        task = asyncio.ensure_future(self.project_service.generate_next_step(
+            project_type, expertise_level, project_idea, current_step, basis_code,
+            template="next_step_draft"
+        ))
+        # A failed draft is just a miss later; don't report it as never retrieved
+        task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        self._drafts[session_id] = StepDraft(
+            self._context(project_type, expertise_level, project_idea, current_step), basis_code, task
+        )
+        self._started.append(time.monotonic())
+        SPECULATIVE_DRAFTS.inc(result="started")
+        logger.debug(f"Drafting step {current_step + 1} for session {session_id}")
+        return True
+
+    async def take(self, session_id: str, project_type: str, expertise_level: str, project_idea: str,
+                   current_step: int, user_code: Optional[str] = None, user_question: Optional[str] = None,
+                   user_understanding: Optional[str] = None) -> Optional[Dict]:
+        """
+        The drafted next step if it was drafted for this exact project context.
+        Served as is when the learner submitted the code it assumed and asked
+        nothing; otherwise only its feedback is regenerated for their submission.
+        None on a miss, so the caller generates the step in full.
+        """
+        draft = self._drafts.pop(session_id, None)
+        if draft is None:
+            if self.enabled:
+                self._record("miss")
+            return None
+        if draft.context != self._context(project_type, expertise_level, project_idea, current_step):
+            SPECULATIVE_DRAFTS.inc(result="unused")
+            draft.task.cancel()
+            self._record("miss")
+            return None
+
+        try:
+            # An unfinished draft still has a head start on a fresh call
+            step_data = dict(await draft.task)
+        except Exception as e:
+            SPECULATIVE_DRAFTS.inc(result="failed")
+            logger.warning(f"Speculative draft for session {session_id} failed: {str(e)}")
+            self._record("miss")
+            return None
+
+        if (user_code or "").strip() == draft.basis_code.strip() and not user_question and not user_understanding:
+            self._record("hit")
+            return step_data
+
+        try:
+            step_data = await self.project_service.reconcile_next_step(
+                step_data, current_step, user_code, user_question, user_understanding
+            )
+        except Exception as e:
+            logger.warning(f"Could not reconcile the drafted step for session {session_id}: {str(e)}")
+            self._record("miss")
+            return None
+        self._record("reconciled")
+        return step_data
+
+    def _record(self, result: str) -> None:
+        SPECULATIVE_LOOKUPS.inc(result=result)
+        if result == "hit":
+            self.hits += 1
+        elif result == "reconciled":
+            self.reconciled += 1
+        else:
+            self.misses += 1
+
+    async def shutdown(self) -> None:
+        tasks = [draft.task for draft in self._drafts.values()]
+        self._drafts.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_metrics(self) -> Dict:
+        lookups = self.hits + self.reconciled + self.misses
+        return {
+            "enabled": self.enabled,
+            "drafts_held": len(self._drafts),
+            "drafts_in_flight": self._in_flight(),
+            "drafts_last_hour": len(self._started),
+            "hits": self.hits,
+            "reconciled": self.reconciled,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.reconciled) / lookups if lookups else 0.0
+        }
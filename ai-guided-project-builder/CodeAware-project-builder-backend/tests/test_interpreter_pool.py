@@ -0,0 +1,104 @@
+import asyncio
+import sys
+
+import pytest
+
+from services.execution import interpreter_pool
+from services.execution.execution_service import ExecutionService
+from services.execution.interpreter_pool import InterpreterPool, PoolUnavailable
+
+REAL_WORKER_SCRIPT = interpreter_pool.WORKER_SCRIPT
+
+@pytest.fixture
+def silent_worker(tmp_path, monkeypatch):
+    """A worker script that starts but never reports ready"""
+    script = tmp_path / "silent_worker.py"
+    script.write_text("import time\ntime.sleep(60)\n")
+    monkeypatch.setattr(interpreter_pool, "WORKER_SCRIPT", str(script))
+    monkeypatch.setattr(interpreter_pool, "WORKER_START_TIMEOUT", 0.5)
+    monkeypatch.setattr(interpreter_pool, "WORKER_RESPAWN_ATTEMPTS", 2)
+    monkeypatch.setattr(interpreter_pool, "WORKER_RESPAWN_BACKOFF_SECONDS", 0.01)
+    return script
+
+async def kill_all_workers(pool: InterpreterPool) -> None:
+    for worker in list(pool.workers):
+        worker.kill()
+        await worker.process.wait()
+
+def test_pool_runs_snippets():
+    async def main():
+        pool = InterpreterPool(size=1)
+        await pool.start()
+        try:
+            return await pool.run("print(6 * 7)", timeout=5)
+        finally:
+            await pool.shutdown()
+
+    result = asyncio.run(main())
+    assert result["stdout"] == "42\n"
+    assert result["exit_code"] == 0
+
+def test_worker_that_never_gets_ready_is_killed_and_not_added(silent_worker):
+    async def main():
+        pool = InterpreterPool(size=1)
+        with pytest.raises(asyncio.TimeoutError):
+            await pool._spawn_worker()
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool.workers == []
+
+def test_pool_reports_unavailable_once_its_workers_are_gone(silent_worker, monkeypatch):
+    async def main():
+        pool = InterpreterPool(size=1)
+        monkeypatch.setattr(interpreter_pool, "WORKER_SCRIPT", REAL_WORKER_SCRIPT)
+        await pool.start()
+        monkeypatch.setattr(interpreter_pool, "WORKER_SCRIPT", str(silent_worker))
+        await kill_all_workers(pool)
+        try:
+            assert pool.running and not pool.available
+            with pytest.raises(PoolUnavailable):
+                await pool.run("print(1)", timeout=1)
+        finally:
+            await pool.shutdown()
+
+    asyncio.run(main())
+
+def test_retired_worker_is_replaced():
+    async def main():
+        pool = InterpreterPool(size=1)
+        await pool.start()
+        try:
+            await pool._retire_worker(await pool._idle_workers.get())
+            return len(pool.workers), pool._idle_workers.qsize(), pool.available
+        finally:
+            await pool.shutdown()
+
+    assert asyncio.run(main()) == (1, 1, True)
+
+def test_respawn_gives_up_after_retries(silent_worker):
+    async def main():
+        pool = InterpreterPool(size=1)
+        pool._idle_workers = asyncio.Queue()
+        pool.running = True
+        worker = interpreter_pool.PoolWorker(await asyncio.create_subprocess_exec(
+            sys.executable, "-c", "pass", start_new_session=True))
+        pool.workers.append(worker)
+        await pool._retire_worker(worker)
+        return pool
+
+    pool = asyncio.run(main())
+    assert pool.workers == []
+    assert pool._idle_workers.qsize() == 0
+    assert not pool.available
+
+def test_execution_falls_back_to_a_fresh_interpreter():
+    async def main():
+        service = ExecutionService()
+        service.python_pool = InterpreterPool(size=1)
+        service.python_pool.running = True
+        assert not service.python_pool.available
+        return await service.execute_python("print('fresh')", "run-1")
+
+    result = asyncio.run(main())
+    assert result["stdout"] == "fresh\n"
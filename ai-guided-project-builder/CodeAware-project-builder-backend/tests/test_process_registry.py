@@ -0,0 +1,46 @@
+import sqlite3
+import time
+
+import pytest
+
+from services.execution.process_registry import MemoryProcessRegistry, SQLiteProcessRegistry
+
+@pytest.fixture(params=["memory", "sqlite"])
+def registry(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteProcessRegistry(str(tmp_path / "processes.db"))
+    return MemoryProcessRegistry()
+
+def test_port_can_only_be_held_once(registry):
+    assert registry.add("a", "streamlit", port=8501) is True
+    assert registry.add("b", "streamlit", port=8501) is False
+    assert [entry["execution_id"] for entry in registry.entries()] == ["a"]
+
+def test_port_is_free_again_after_remove(registry):
+    registry.add("a", "streamlit", port=8501)
+    registry.remove("a")
+    assert registry.add("b", "streamlit", port=8501) is True
+
+def test_readding_an_execution_updates_it(registry):
+    registry.add("a", "execution", pid=100)
+    assert registry.add("a", "execution", pid=200) is True
+    assert registry.get("a")["pid"] == 200
+    assert len(registry.entries()) == 1
+
+def test_processes_without_ports_do_not_clash(registry):
+    assert registry.add("a", "execution", pid=1) is True
+    assert registry.add("b", "execution", pid=2) is True
+    assert registry.ports_in_use() == set()
+
+def test_locked_database_fails_fast(tmp_path):
+    path = str(tmp_path / "processes.db")
+    registry = SQLiteProcessRegistry(path)
+    other_worker = sqlite3.connect(path)
+    other_worker.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.monotonic()
+        with pytest.raises(sqlite3.OperationalError):
+            registry.add("a", "execution", pid=1)
+        assert time.monotonic() - started < 1
+    finally:
+        other_worker.rollback()
@@ -0,0 +1,18 @@
+from services.project.quiz_bank import step_fingerprint
+from utils.single_flight import request_key
+
+NESTED = "Fix this:\nif x:\n    a()\n    b()\n"
+DEDENTED = "Fix this:\nif x:\n    a()\nb()\n"
+
+def test_indentation_changes_the_key():
+    assert request_key("gemini", NESTED) != request_key("gemini", DEDENTED)
+
+def test_surrounding_whitespace_is_ignored():
+    assert request_key("gemini", f"\n  {NESTED}  \n") == request_key("gemini", NESTED)
+
+def test_non_text_parts_are_kept():
+    assert request_key("gemini", {"temperature": 0.2}) != request_key("gemini", {"temperature": 0.7})
+
+def test_step_fingerprint_ignores_case_and_whitespace():
+    assert (step_fingerprint({"title": "Set  up\nFlask", "description": "Install it"})
+            == step_fingerprint({"title": "set up flask", "description": "install  it"}))
@@ -0,0 +1,86 @@
+import asyncio
+import socket
+import sys
+
+from services.execution.streamlit_supervisor import StreamlitSupervisor
+
+# Stands in for `streamlit run`: answers health checks after a start-up delay, or exits
+FAKE_APP = """
+import http.server, sys, time
+port, delay = int(sys.argv[1]), float(sys.argv[2])
+time.sleep(delay)
+if delay < 0:
+    sys.exit(3)
+class Health(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+    def log_message(self, *args):
+        pass
+http.server.HTTPServer(("127.0.0.1", port), Health).serve_forever()
+"""
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+class FakeSupervisor(StreamlitSupervisor):
+    def __init__(self, delay: float, **kwargs):
+        port = free_port()
+        super().__init__(port_range=(port, port), startup_timeout=5, **kwargs)
+        self.delay = delay
+        self.spawned = 0
+
+    async def _spawn(self, app):
+        self.spawned += 1
+        with open(app.log_path, "wb") as log_file:
+            app.process = await asyncio.create_subprocess_exec(
+                sys.executable, "-c", FAKE_APP, str(app.port), str(self.delay),
+                stdout=log_file, stderr=asyncio.subprocess.STDOUT, start_new_session=True
+            )
+
+def run_twice(supervisor: StreamlitSupervisor):
+    async def main():
+        try:
+            first = asyncio.ensure_future(supervisor.run("import streamlit", "run-1", "session"))
+            await asyncio.sleep(0.1)
+            second = await supervisor.run("import streamlit as st", "run-2", "session")
+            # The second run waits for the app to come up rather than answering early
+            assert first.done()
+            return await first, second
+        finally:
+            await supervisor.shutdown()
+
+    return asyncio.run(main())
+
+def test_run_during_start_up_reuses_the_starting_app():
+    supervisor = FakeSupervisor(delay=0.5)
+    first, second = run_twice(supervisor)
+    assert first["exit_code"] == 0 and second["exit_code"] == 0
+    assert second["execution_id"] == "run-1"
+    assert second["streamlit_port"] == first["streamlit_port"]
+    assert supervisor.spawned == 1
+    assert (supervisor.apps_started, supervisor.apps_reused) == (1, 1)
+
+def test_run_during_failed_start_up_reports_the_failure():
+    supervisor = FakeSupervisor(delay=-1)
+    first, second = run_twice(supervisor)
+    assert first["streamlit_error"] and second["streamlit_error"]
+    assert supervisor.spawned == 1
+    assert supervisor.apps == {} and supervisor.registry.entries() == []
+
+def test_reaper_leaves_starting_apps_alone():
+    async def main():
+        supervisor = FakeSupervisor(delay=0.5, idle_ttl=0)
+        try:
+            run = asyncio.ensure_future(supervisor.run("import streamlit", "run-1"))
+            await asyncio.sleep(0.1)
+            reaped = await supervisor.reap_idle()
+            return reaped, await run
+        finally:
+            await supervisor.shutdown()
+
+    reaped, result = asyncio.run(main())
+    assert reaped == 0
+    assert result["exit_code"] == 0
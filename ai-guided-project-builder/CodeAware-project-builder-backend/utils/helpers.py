@@ -1,43 +1,19 @@
-import json
 import re
 import logging
 from typing import Dict, Any, List, Optional
 
+from utils.json_extract import JSONExtractionError, extract_json
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
 def extract_json_from_response(text: str) -> Dict[str, Any]:
-    """Extract JSON from a response that might be wrapped in markdown code blocks."""
-    # Try direct JSON parsing first
+    """Extract JSON from a response that might be wrapped in markdown code blocks or surrounded by prose."""
     try:
-        return json.loads(text)
-    except json.JSONDecodeError:
-        pass
-    
-    # Look for JSON inside markdown code blocks
-    json_pattern = r"```(?:json)?\s*([\s\S]*?)```"
-    matches = re.findall(json_pattern, text)
-    
-    if matches:
-        for match in matches:
-            try:
-                return json.loads(match.strip())
-            except json.JSONDecodeError:
-                continue
-    
-    # Try to find anything that looks like JSON object 
-    json_object_pattern = r"\{[\s\S]*\}"
-    matches = re.findall(json_object_pattern, text)
-    
-    if matches:
-        for match in matches:
-            try:
-                return json.loads(match)
-            except json.JSONDecodeError:
-                continue
-                
-    # Return the original text if we couldn't extract JSON
-    return {"error": "Could not extract valid JSON", "original_text": text}
+        return extract_json(text)
+    except JSONExtractionError:
+        # Return the original text if we couldn't extract JSON
+        return {"error": "Could not extract valid JSON", "original_text": text}
 
 def generate_quiz_verification(answers: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Verify user's quiz answers and calculate score"""
@@ -0,0 +1,50 @@
+import asyncio
+import hashlib
+import json
+import logging
+from typing import Any, Awaitable, Callable, Dict
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+def request_key(*parts: Any) -> str:
+    """
+    Hash a request's model, config and prompt. Only leading and trailing
+    whitespace is ignored: prompts carry code, where indentation is meaning.
+    """
+    normalized = [part.strip() if isinstance(part, str) else part for part in parts]
+    payload = json.dumps(normalized, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+class SingleFlight:
+    """Shares one in-flight call among all concurrent callers with the same key"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Task] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, make_call: Callable[[], Awaitable], on_coalesced: Callable[[], None] = None):
+        """Await make_call(), or the identical call another caller already started"""
+        task = self._calls.get(key)
+        if task is None:
+            self.leaders += 1
+            task = asyncio.ensure_future(make_call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.coalesced += 1
+            if on_coalesced is not None:
+                on_coalesced()
+        # A caller that gives up doesn't cancel the call for the others
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the error as seen even if every caller gave up waiting
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._calls)
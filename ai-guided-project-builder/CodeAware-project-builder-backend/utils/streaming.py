@@ -0,0 +1,134 @@
+import json
+import logging
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Marker the algorithm designer appends to the final algorithm
+WORKFLOW_COMPLETE = "WORKFLOW_COMPLETE"
+
+# Tags whose content is extracted from the stream
+STREAM_TAGS = ("progress", "evaluation")
+
+# An unterminated tag longer than this is passed through as plain text
+MAX_TAG_LENGTH = 2000
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no"  # Stop nginx from buffering the stream
+}
+
+def sse_event(event: str, data: Dict) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def parse_progress(value: str) -> Optional[int]:
+    """Read the percentage out of a <progress> tag's content"""
+    match = re.search(r"\d+", value)
+    return int(match.group()) if match else None
+
+class TaggedStreamParser:
+    """Incrementally picks <progress>/<evaluation> tags and the WORKFLOW_COMPLETE marker out of streamed text.
+
+    feed() returns (kind, value) events in stream order: ("text", str),
+    ("progress", int), ("evaluation", str) and ("complete", True). Text is
+    passed through unchanged except that a progress below min_progress is
+    raised to it, as the non-streaming endpoint does.
+    """
+
+    def __init__(self, min_progress: int = 0):
+        self.min_progress = min_progress
+        self.progress = None
+        self.evaluation = None
+        self.complete = False
+
+        self._buffer = ""
+        self._tail = ""  # End of the emitted text, to spot a marker split across chunks
+        self._text = []
+
+    @property
+    def text(self) -> str:
+        """Everything emitted so far"""
+        return "".join(self._text)
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        self._buffer += chunk
+        return self._drain(final=False)
+
+    def close(self) -> List[Tuple[str, Any]]:
+        """Flush whatever is still buffered at the end of the stream"""
+        return self._drain(final=True)
+
+    def _drain(self, final: bool) -> List[Tuple[str, Any]]:
+        events = []
+        while self._buffer:
+            start = self._buffer.find("<")
+            if start == -1:
+                self._emit_text(self._buffer, events)
+                self._buffer = ""
+                break
+            if start > 0:
+                self._emit_text(self._buffer[:start], events)
+                self._buffer = self._buffer[start:]
+
+            tag = self._match_tag()
+            if tag is None or (tag == "" and final):
+                # Not one of our tags; pass the "<" through
+                self._emit_text("<", events)
+                self._buffer = self._buffer[1:]
+                continue
+            if tag == "":
+                # Could still become an opening tag; wait for more text
+                break
+
+            closing = f"</{tag}>"
+            end = self._buffer.find(closing)
+            if end == -1:
+                if final or len(self._buffer) > MAX_TAG_LENGTH:
+                    self._emit_text(self._buffer, events)
+                    self._buffer = ""
+                break
+            content = self._buffer[len(tag) + 2:end]
+            self._buffer = self._buffer[end + len(closing):]
+            self._emit_tag(tag, content, events)
+        return events
+
+    def _match_tag(self) -> Optional[str]:
+        """Return the tag the buffer starts with, "" if it could still become one, or None"""
+        for tag in STREAM_TAGS:
+            opening = f"<{tag}>"
+            if self._buffer.startswith(opening):
+                return tag
+            if opening.startswith(self._buffer):
+                return ""
+        return None
+
+    def _emit_tag(self, tag: str, content: str, events: List) -> None:
+        if tag == "progress":
+            progress = parse_progress(content)
+            if progress is not None and progress < self.min_progress:
+                progress = self.min_progress
+                content = f"{progress}%"
+            if progress is not None:
+                self.progress = progress
+                events.append(("progress", progress))
+        else:
+            self.evaluation = content
+            events.append(("evaluation", content))
+        self._emit_text(f"<{tag}>{content}</{tag}>", events)
+
+    def _emit_text(self, text: str, events: List) -> None:
+        if not text:
+            return
+        self._text.append(text)
+        if events and events[-1][0] == "text":
+            events[-1] = ("text", events[-1][1] + text)
+        else:
+            events.append(("text", text))
+
+        if not self.complete and WORKFLOW_COMPLETE in self._tail + text:
+            self.complete = True
+            events.append(("complete", True))
+        self._tail = (self._tail + text)[-(len(WORKFLOW_COMPLETE) - 1):]